@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""
+Times the hot paths of the hack game, password generation and the providers.
+
+Results are written as JSON, keyed by benchmark name, along with the commit
+they were measured at. When a baseline results file is given, any benchmark
+that got slower than the baseline by more than the threshold is reported and
+the run exits with a non-zero status.
+
+    python benchmark.py -o results.json
+    python benchmark.py -o new.json -b results.json -t 0.25
+
+Sessions recorded with robco_os.py --record can be added with -s. Their keys
+are played back through the hack game and their frames through the ANSI
+provider's encoder, so real play becomes part of the workload.
+
+    python benchmark.py -s session.rrl -o results.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import consolekeys
+import console_providers
+import os
+import recording
+from programs import hack
+from programs import passwordgen
+from programs import puzzlepool
+
+CURSOR_KEYS = [consolekeys.LEFT_ARROW, consolekeys.RIGHT_ARROW,
+               consolekeys.UP_ARROW, consolekeys.DOWN_ARROW]
+
+
+def time_call(function, number, repeat):
+    # Returns the best and median time of a single call over repeat batches
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {'best': min(timings), 'median': statistics.median(timings), 'number': number}
+
+
+def recorded_key_script(length, seed=0):
+    # A repeatable session of cursor movement. Guesses are left out so that
+    # the game never locks out and every frame draws the full memory dump.
+    rng = random.Random(seed)
+    return [rng.choice(CURSOR_KEYS) for _ in range(length)]
+
+
+def make_hack_program(args=()):
+    provider = console_providers.HeadlessOSProvider()
+    return hack.Program(provider, list(args))
+
+
+def bench_get_list_of_words(results, repeat):
+    for length in range(4, 13):
+        results['passwordgen.get_list_of_words[%d]' % length] = \
+            time_call(lambda: passwordgen.get_list_of_words(12, length), 50, repeat)
+
+
+def bench_make_new_dataset(results, repeat):
+    program = make_hack_program()
+    results['hack.make_new_dataset'] = time_call(program.make_new_dataset, 50, repeat)
+    results['puzzlepool.generate_dataset'] = \
+        time_call(lambda: puzzlepool.generate_dataset(5, 12, 1), 50, repeat)
+
+
+def bench_selection(results, repeat):
+    program = make_hack_program()
+    cells = [(y, x) for y in range(6, 22) for x in list(range(7, 19)) + list(range(27, 39))]
+
+    def select_every_cell():
+        for y, x in cells:
+            program.get_index_from_cursor_pos(y, x)
+            program.get_indices_of_selection()
+
+    results['hack.selection[all cells]'] = time_call(select_every_cell, 10, repeat)
+
+
+def bench_scroll_side_text(results, repeat):
+    program = make_hack_program()
+    results['hack.scroll_side_text'] = \
+        time_call(lambda: program.scroll_side_text('Entry denied.'), 1000, repeat)
+
+
+def bench_render(results, repeat, frames=2000):
+    # Per-frame cost of hack.Program.run driven by a recorded key script
+    script = recorded_key_script(frames)
+
+    def play_session():
+        random.seed(0)
+        provider = console_providers.HeadlessOSProvider(script)
+        hack.Program(provider, []).run(provider)
+        return provider.frame_count
+
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        frame_count = play_session()
+        timings.append((time.perf_counter() - start) / frame_count)
+    results['hack.run[frame]'] = {'best': min(timings), 'median': statistics.median(timings),
+                                  'number': frame_count}
+
+
+def bench_session(results, repeat, path):
+    # Plays a recorded session back, as input to the game and as output
+    log = recording.SessionLog.open(path)
+    name = os.path.basename(path)
+    keys = log.keys()
+
+    def play_keys():
+        random.seed(0)
+        provider = console_providers.HeadlessOSProvider(keys)
+        provider.execute_program('hack', [])
+        return provider.frame_count
+
+    def play_frames():
+        with open(os.devnull, 'wb') as output:
+            provider = console_providers.AnsiOSProvider(None, output.fileno(),
+                                                        log.width, log.height)
+            replayer = recording.Replayer(log, provider)
+            replayer.play(0)
+            return replayer.frames
+
+    for label, play in (('keys', play_keys), ('frames', play_frames)):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            frame_count = max(play(), 1)
+            timings.append((time.perf_counter() - start) / frame_count)
+        results['session[%s].%s[frame]' % (name, label)] = \
+            {'best': min(timings), 'median': statistics.median(timings), 'number': frame_count}
+
+
+BENCHMARKS = [
+    bench_get_list_of_words,
+    bench_make_new_dataset,
+    bench_selection,
+    bench_scroll_side_text,
+    bench_render,
+]
+
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(repeat, only=None, sessions=()):
+    results = {}
+    for benchmark in BENCHMARKS:
+        if only is None or any(name in benchmark.__name__ for name in only):
+            benchmark(results, repeat)
+    for path in sessions:
+        bench_session(results, repeat, path)
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Returns (name, baseline, current, ratio) for every benchmark that slowed
+    # down by more than threshold (0.2 meaning 20%) against the baseline
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None or previous['best'] <= 0:
+            continue
+        ratio = result['best'] / previous['best']
+        if ratio > 1 + threshold:
+            regressions.append((name, previous['best'], result['best'], ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the RobCo OS simulator")
+    parser.add_argument('-o', '--output', help='write the results to this JSON file')
+    parser.add_argument('-b', '--baseline', help='a results JSON file to compare against')
+    parser.add_argument('-t', '--threshold', default=0.2, type=float,
+                        help='allowed slowdown against the baseline, 0.2 meaning 20%%')
+    parser.add_argument('-r', '--repeat', default=5, type=int)
+    parser.add_argument('-k', '--only', nargs='*', help='run only benchmarks matching these names')
+    parser.add_argument('-s', '--session', action='append', default=[],
+                        help='a session recorded with robco_os.py --record to play back')
+    benchargs = parser.parse_args()
+
+    results = run_benchmarks(benchargs.repeat, benchargs.only, benchargs.session)
+    for name, result in results.items():
+        print('%-40s %12.3f us' % (name, result['best'] * 1e6))
+
+    if benchargs.output is not None:
+        with open(benchargs.output, 'w') as file:
+            json.dump({'commit': current_commit(), 'python': platform.python_version(),
+                       'results': results}, file, indent=2)
+
+    if benchargs.baseline is not None:
+        with open(benchargs.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline['results'], benchargs.threshold)
+        for name, before, after, ratio in regressions:
+            print('REGRESSION %s: %.3f us -> %.3f us (%.0f%% slower, baseline %s)' %
+                  (name, before * 1e6, after * 1e6, (ratio - 1) * 100, baseline.get('commit')))
+        if len(regressions) > 0:
+            sys.exit(1)
@@ -1,8 +1,16 @@
-import tcod
+import consolecolours
+import collections
 import consolekeys
-import simpleaudio
+import contextlib
+import recording
+import sound_service
+import teletype
 import os
-import random
+import importlib
+import profiler
+import select
+import time
+import numpy as np
 from abc import ABC, abstractmethod
 
 """
@@ -10,49 +18,386 @@ Program modules must define:
 - a class named Program, with the following methods:
   - a constructor taking a provider as an argument
   - a draw method, which takes a BaseOSProvider as an argument
-  - a holotape_inserted method, which takes a path to a local file
-    - this will be implemented in the future, depending on the host OS
+  - optionally, a holotape_inserted method, which takes the path of a
+    holotape (a local directory or zip archive) that was just inserted.
+    The mounted holotape is then the provider's holotape attribute.
 """
 
+# Backend libraries are only imported when a provider that needs them is
+# created, so choosing a lighter provider doesn't pay for loading them
+tcod = None
+# tcod key codes to consolekeys, built along with the first tcod provider
+TCOD_KEYS = None
+
 """
-The console is assumed to be 55x22 based on an (un)educated guess
+Keys that have arrived but haven't been handled yet. Providers fill it with
+every key waiting in their backend, and programs take them a batch at a
+time, so that keys arriving faster than frames can be drawn (e.g. a held
+arrow key) are applied together and drawn once rather than falling further
+and further behind. A batch is at most batch_size keys, which bounds the
+work done before the next frame; the rest wait for the one after.
 """
-class BaseOSProvider(ABC):
-    def common_setup(self):
-        self.is_blocking = True
+class InputQueue:
+    BATCH_SIZE = 32
+    CAPACITY = 256
+
+    def __init__(self, batch_size=BATCH_SIZE, capacity=CAPACITY):
+        self.keys = collections.deque()
+        self.batch_size = batch_size
+        self.capacity = capacity
+        # Keys waiting when the last batch was taken, and the most ever
+        self.depth = 0
+        self.max_depth = 0
+        self.batches = 0
+        self.keys_read = 0
+        # Keys that were handled without a frame of their own, because they
+        # arrived while an earlier one was still being handled
+        self.dropped_frames = 0
+
+    def __len__(self):
+        return len(self.keys)
+
+    def is_full(self):
+        return len(self.keys) >= self.capacity
+
+    def take(self):
+        # Returns the next batch as (key, repeat) pairs, see consolekeys.coalesce
+        count = min(len(self.keys), self.batch_size)
+        keys = [self.keys.popleft() for _ in range(count)]
+        self.count(keys, len(self.keys))
+        return consolekeys.coalesce(keys)
+
+    def count(self, keys, remaining):
+        # Counts a batch of keys taken, with remaining keys left behind it
+        self.depth = len(keys) + remaining
+        self.max_depth = max(self.max_depth, self.depth)
+        self.batches += 1
+        self.keys_read += len(keys)
+        self.dropped_frames += max(0, len(keys) - 1)
+
+# A cell's attributes as bytes: fg, bg, flags and one spare, so that all of
+# them can also be read as a single 32-bit number
+def pack_attributes(fg, bg, flags):
+    return np.array([fg, bg, flags, 0], dtype=np.uint8).view(np.uint32)[0]
+
+DEFAULT_ATTRIBUTES = pack_attributes(consolecolours.DEFAULT_FG, consolecolours.DEFAULT_BG, 0)
+BLINK_ATTRIBUTE = int(pack_attributes(0, 0, consolecolours.BLINK))
+
+"""
+Foreground and background colours (palette indices, see consolecolours) and
+blink/dim flags for every cell, in planes alongside the characters, with
+bulk setters for spans and rectangles. The planes share one array, which
+packed views as one number per cell, so clearing, comparing and copying all
+the attributes is one operation. The invert flag is kept in its own plane,
+inverted, as it always has been.
+"""
+class AttributePlanes:
+
+    def init_attributes(self, width, height):
+        self.attributes = np.zeros((width, height, 4), dtype=np.uint8)
+        self.packed = self.attributes.view(np.uint32)[:, :, 0]
+        self.fg = self.attributes[:, :, 0]
+        self.bg = self.attributes[:, :, 1]
+        self.flags = self.attributes[:, :, 2]
+        self.clear_attributes()
+
+    def clear_attributes(self):
+        self.packed.fill(DEFAULT_ATTRIBUTES)
+
+    def set_attributes(self, cells, fg, bg, flags):
+        # Sets whichever of fg, bg and flags are given for cells, a pair of
+        # slices. The INVERT flag sets inverted, the other flags replace the
+        # cells' flags.
+        if fg is not None:
+            self.fg[cells] = fg
+        if bg is not None:
+            self.bg[cells] = bg
+        if flags is not None:
+            self.inverted[cells] = flags & consolecolours.INVERT != 0
+            self.flags[cells] = flags & ~consolecolours.INVERT
+
+    def set_span_attributes(self, x, y, length, fg=None, bg=None, flags=None):
+        if 0 <= y < self.height:
+            start = max(x, 0)
+            self.set_attributes((slice(start, max(x + length, start)), y), fg, bg, flags)
+
+    def set_rect_attributes(self, x, y, width, height, fg=None, bg=None, flags=None):
+        start_x = max(x, 0)
+        start_y = max(y, 0)
+        self.set_attributes((slice(start_x, max(x + width, start_x)),
+                             slice(start_y, max(y + height, start_y))), fg, bg, flags)
+
+"""
+A named offscreen layer, for things a program draws once and wants on screen
+every frame (e.g. a banner or labels) rather than redrawing them each time.
+Cells that were never drawn to are transparent. Visible layers are composited
+over the screen at refresh, in the order they were created. Drawn cells given
+colours or flags on the layer show those; elsewhere the screen's are kept.
+"""
+class Layer(AttributePlanes):
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        # 0 marks a transparent cell
+        self.chars = np.zeros((width, height), dtype=np.int32)
+        self.inverted = np.zeros((width, height), dtype=bool)
+        self.init_attributes(width, height)
+        self.visible = True
+        # Masks of the drawn cells, and of those given colours or flags (None
+        # if there are none), worked out again after the layer changes
+        self.opaque = None
+        self.coloured = None
+
+    def clear(self):
+        self.chars.fill(0)
+        self.inverted.fill(False)
+        self.clear_attributes()
+        self.opaque = None
+
+    def set_attributes(self, cells, fg, bg, flags):
+        super().set_attributes(cells, fg, bg, flags)
+        self.opaque = None
+
+    def set_character(self, x, y, ch):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.chars[x, y] = ord(ch)
+            self.opaque = None
+
+    def print_str(self, x, y, string):
+        if y < 0 or y >= self.height or x >= self.width:
+            return
+        if x < 0:
+            string = string[-x:]
+            x = 0
+        codes = np.fromiter(map(ord, string[:self.width - x]), dtype=np.int32)
+        self.chars[x:x + len(codes), y] = codes
+        self.opaque = None
+
+    def invert_at(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.inverted[x, y] = not self.inverted[x, y]
+
+    def composite(self, screen):
+        if self.opaque is None:
+            self.opaque = self.chars != 0
+            coloured = self.opaque & (self.packed != DEFAULT_ATTRIBUTES)
+            self.coloured = coloured if coloured.any() else None
+        np.copyto(screen.chars, self.chars, where=self.opaque)
+        # Inverted cells stay inverted if the screen also inverted them, so
+        # compositing twice without a clear in between changes nothing
+        np.logical_or(screen.inverted, self.inverted, out=screen.inverted)
+        if self.coloured is not None:
+            np.copyto(screen.packed, self.packed, where=self.coloured)
+
+"""
+The contents of the console, kept in memory so providers can work out which
+cells changed since the last refresh and only push those to their backend.
+Arrays are indexed [x, y] like the tcod console, which uses order='F'.
+"""
+class ScreenBuffer(AttributePlanes):
+    BULK_CELLS = 64
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.chars = np.full((width, height), ord(' '), dtype=np.int32)
+        self.inverted = np.zeros((width, height), dtype=bool)
+        self.init_attributes(width, height)
+        self.previous_chars = self.chars.copy()
+        self.previous_inverted = self.inverted.copy()
+        self.previous_packed = self.packed.copy()
+        # RGB for every colour index
+        self.palette = np.zeros((256, 3), dtype=np.uint8)
+        self.palette[:len(consolecolours.PALETTE)] = consolecolours.PALETTE
+        # Whether blinking cells are in their on phase, as of this frame and
+        # the last, and whether the last frame had any (None until asked)
+        self.blink_on = True
+        self.previous_blink_on = True
+        self.blinking = False
+        # The first frame has to be pushed in full
+        self.full_redraw = True
+        # Number of cells that changed in the last frame, and in all frames
+        self.changed_cells = 0
+        self.total_changed_cells = 0
+        self.frame_count = 0
+        # A recording.SessionRecorder that's handed every frame, if recording
+        self.recorder = None
+        self.layers = {}
+
+    def clear(self):
+        self.chars.fill(ord(' '))
+        self.inverted.fill(False)
+        self.clear_attributes()
+
+    def set_character(self, x, y, ch):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.chars[x, y] = ord(ch)
+
+    def print_str(self, x, y, string):
+        if y < 0 or y >= self.height or x >= self.width:
+            return
+        if x < 0:
+            string = string[-x:]
+            x = 0
+        codes = np.fromiter(map(ord, string[:self.width - x]), dtype=np.int32)
+        self.chars[x:x + len(codes), y] = codes
+
+    def set_palette(self, colours):
+        # Replaces the RGB of the first len(colours) colour indices
+        palette = self.palette.copy()
+        palette[:len(colours)] = colours
+        self.palette = palette
+        self.invalidate()
+
+    def swap_palette(self, mapping):
+        # Shows each colour index in mapping as another: either the colour
+        # of another index, or an RGB triple. The whole screen changes at the
+        # next refresh, and stays changed, without anything being redrawn.
+        palette = self.palette.copy()
+        for index, colour in mapping.items():
+            palette[index] = self.palette[colour] if isinstance(colour, int) else colour
+        self.palette = palette
+        self.invalidate()
+
+    def colours(self, cells=Ellipsis):
+        # The RGB foreground and background that cells (a mask, or by
+        # default all of them) are shown in, after dimming, blinking and
+        # inversion
+        fg = self.palette[self.fg[cells]]
+        bg = self.palette[self.bg[cells]]
+        flags = self.flags[cells][..., np.newaxis]
+        if flags.any():
+            dim = flags & consolecolours.DIM != 0
+            fg = np.where(dim, (fg.astype(np.uint16) + bg) // 2, fg).astype(np.uint8)
+            if not self.blink_on:
+                fg = np.where(flags & consolecolours.BLINK != 0, bg, fg)
+        inverted = self.inverted[cells][..., np.newaxis]
+        return np.where(inverted, bg, fg), np.where(inverted, fg, bg)
 
-        sounds_path = "sounds"
-        self.sfx_enter = []
-        self.sfx_char = []
+    def update_blink(self, now):
+        # Sets the blink phase for the time now. Returns True if blinking
+        # cells need redrawing because of it.
+        on = int(now / consolecolours.BLINK_INTERVAL) % 2 == 0
+        changed = on != self.blink_on and self.is_blinking()
+        self.blink_on = on
+        return changed
 
-        enter_sounds_path = os.path.join(sounds_path, "enter")
-        if os.path.isdir(enter_sounds_path):
-            for file in os.listdir(enter_sounds_path):
-                self.sfx_enter.append(simpleaudio.WaveObject.from_wave_file(os.path.join(enter_sounds_path, file)))
+    def is_blinking(self):
+        if self.blinking is None:
+            self.blinking = np.count_nonzero(self.previous_packed & BLINK_ATTRIBUTE) > 0
+        return self.blinking
 
-        char_sounds_path = os.path.join(sounds_path, "char")
-        if os.path.isdir(char_sounds_path):
-            for file in os.listdir(char_sounds_path):
-                self.sfx_char.append(simpleaudio.WaveObject.from_wave_file(os.path.join(char_sounds_path, file)))
+    def time_to_next_blink(self, now):
+        # Seconds until blinking cells next turn on or off, or None if there
+        # are none on screen
+        if not self.is_blinking():
+            return None
+        return consolecolours.BLINK_INTERVAL - now % consolecolours.BLINK_INTERVAL
+
+    def invert_at(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.inverted[x, y] = not self.inverted[x, y]
+
+    def invert_cells(self, coords):
+        # coords is a sequence of (x, y) pairs, which may repeat. A handful of
+        # cells is quicker to flip one by one than to hand over to NumPy.
+        if len(coords) < self.BULK_CELLS:
+            for x, y in coords:
+                self.invert_at(x, y)
+            return
+        cells = np.asarray(coords, dtype=np.intp).reshape(-1, 2)
+        inside = (cells[:, 0] >= 0) & (cells[:, 0] < self.width) & \
+                 (cells[:, 1] >= 0) & (cells[:, 1] < self.height)
+        cells = cells[inside]
+        np.logical_xor.at(self.inverted, (cells[:, 0], cells[:, 1]), True)
 
-        self.sfx_ack = simpleaudio.WaveObject.from_wave_file(os.path.join(sounds_path, 'passgood.wav'))
-        self.sfx_nack = simpleaudio.WaveObject.from_wave_file(os.path.join(sounds_path, 'passbad.wav'))
-        self.sfx_reset = simpleaudio.WaveObject.from_wave_file(os.path.join(sounds_path, 'passreset.wav'))
-        self.sfx_clear = simpleaudio.WaveObject.from_wave_file(os.path.join(sounds_path, 'passdud.wav'))
+    def invert_span(self, x, y, length):
+        if 0 <= y < self.height:
+            start = max(x, 0)
+            self.inverted[start:max(x + length, start), y] ^= True
+
+    def invert_rect(self, x, y, width, height):
+        start_x = max(x, 0)
+        start_y = max(y, 0)
+        self.inverted[start_x:max(x + width, start_x), start_y:max(y + height, start_y)] ^= True
+
+    def layer(self, name):
+        # Returns the layer called name, creating it if there isn't one
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = Layer(self.width, self.height)
+        return layer
+
+    def remove_layer(self, name):
+        self.layers.pop(name, None)
+
+    def compose(self):
+        for layer in self.layers.values():
+            if layer.visible:
+                layer.composite(self)
+
+    def invalidate(self):
+        # Forces the next frame to be pushed in full, e.g. after the backend
+        # has lost its contents
+        self.full_redraw = True
+
+    def take_damage(self):
+        # Returns a mask of the cells that changed since the last call and
+        # makes the current frame the one the next call compares against
+        self.compose()
+        if self.full_redraw:
+            damage = np.ones((self.width, self.height), dtype=bool)
+            self.full_redraw = False
+        else:
+            damage = self.chars != self.previous_chars
+            damage |= self.inverted != self.previous_inverted
+            damage |= self.packed != self.previous_packed
+            if self.blink_on != self.previous_blink_on:
+                damage |= self.flags & consolecolours.BLINK != 0
+        np.copyto(self.previous_chars, self.chars)
+        np.copyto(self.previous_inverted, self.inverted)
+        np.copyto(self.previous_packed, self.packed)
+        self.previous_blink_on = self.blink_on
+        self.blinking = None
+        self.changed_cells = int(np.count_nonzero(damage))
+        self.total_changed_cells += self.changed_cells
+        self.frame_count += 1
+        if self.recorder is not None:
+            self.recorder.record_frame(self, damage)
+        return damage
+
+    def row_text(self, y):
+        return ''.join(map(chr, self.chars[:, y]))
+
+"""
+The console is assumed to be 55x22 based on an (un)educated guess
+"""
+class BaseOSProvider(ABC):
+    # The mounted holotape, see insert_holotape
+    holotape = None
+    # The profiler.Profiler timing this provider, see start_profiling
+    profiler = None
+    # Keys read ahead by read_keys, see get_input_queue
+    input_queue = None
+    # The console size, for providers that don't set their own
+    width = 60
+    height = 24
+    # Layers of a provider without a ScreenBuffer, see layer
+    layers = None
+
+    def common_setup(self):
+        self.is_blocking = True
+        # Clips are loaded on first use by the sound service's own thread,
+        # so nothing here waits on audio decoding
+        self.sound = sound_service.create_sound_service("sounds")
 
     def play_sound_for_char(self, char):
         # Subclasses: Override this method for the appropriate sounds per char
-        random.choice(self.sfx_char).play()
+        self.sound.play_for_char(char)
 
     def play_sound(self, sound_name):
-        if sound_name == "ack":
-            self.sfx_ack.play()
-        elif sound_name == "nack":
-            self.sfx_nack.play()
-        elif sound_name == "reset":
-            self.sfx_reset.play()
-        elif sound_name == "clear":
-            self.sfx_clear.play()
+        self.sound.play(sound_name)
 
     # Loads and runs the module identified by module_name and runs it
     # replacing the currently running module
@@ -62,6 +407,194 @@ class BaseOSProvider(ABC):
         module = __import__("programs." + program_name, globals(), locals(), [program_name])
         return module.Program(self, args)
 
+    # Runs program_name, then whichever program it hands over to when it exits,
+    # until a program returns without naming a next one
+    def execute_program(self, program_name, args):
+        exit = False
+        while not exit:
+            with self.profiling("init." + program_name):
+                self.program = self.execute_program_import(program_name, args)
+            with self.profiling("run." + program_name):
+                result = self.program.run(self)
+
+            if result is None or len(result) == 0 or result[0] is None:
+                exit = True
+            else:
+                program_name = result[0]
+                args = result[1]
+
+    # Typing text and blinking cursors, see teletype.py. Whatever is driving
+    # the program (e.g. the asyncio runtime) advances it as time passes.
+    @property
+    def teletype(self):
+        if getattr(self, "_teletype", None) is None:
+            self._teletype = teletype.Teletype()
+        return self._teletype
+
+    # Mounts a directory or zip archive as the holotape (see holotape.py) and
+    # lets the running program know it was inserted
+    def insert_holotape(self, path):
+        import holotape
+        self.holotape = holotape.mount(path)
+        program = getattr(self, "program", None)
+        if program is not None and hasattr(program, "holotape_inserted"):
+            program.holotape_inserted(path)
+        return self.holotape
+
+    # Starts timing getch, refresh, drawing calls and programs (see
+    # profiler.py). Until this is called none of them are wrapped.
+    def start_profiling(self):
+        self.profiler = profiler.Profiler()
+        self.profiler.attach(self)
+        return self.profiler
+
+    # Times the body of a with statement as name, if profiling
+    def profiling(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.timer(name)
+
+    # Named offscreen layers, composited over the screen at every refresh.
+    # Draw to a layer once and it stays on screen until it's hidden (by
+    # setting visible to False), redrawn or removed.
+    def layer(self, name):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            return screen.layer(name)
+        # Without a ScreenBuffer to composite them, the layers' characters
+        # are drawn with print_str just before every refresh, leaving out
+        # their colours and inverted cells
+        if self.layers is None:
+            self.layers = {}
+            refresh = self.refresh
+            def refresh_with_layers():
+                self.draw_layers()
+                refresh()
+            self.refresh = refresh_with_layers
+        layer = self.layers.get(name)
+        if layer is None:
+            layer = self.layers[name] = Layer(self.width, self.height)
+        return layer
+
+    def remove_layer(self, name):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            screen.remove_layer(name)
+        elif self.layers is not None:
+            self.layers.pop(name, None)
+
+    def draw_layers(self):
+        for layer in self.layers.values():
+            if not layer.visible:
+                continue
+            for y in range(layer.height):
+                drawn = np.flatnonzero(layer.chars[:, y])
+                # A print_str for every run of drawn cells
+                for run in np.split(drawn, np.flatnonzero(np.diff(drawn) != 1) + 1):
+                    if len(run) > 0:
+                        self.print_str(int(run[0]), y, ''.join(map(chr, layer.chars[run, y])))
+
+    # Colours and flags (see consolecolours) for a run of cells along a row,
+    # or a rectangle of them. Arguments left as None are unchanged. Like the
+    # characters, they're reset by clear. Providers without a ScreenBuffer
+    # have no colours, so only the INVERT flag shows, by inverting the cells.
+    def set_span_attributes(self, x, y, length, fg=None, bg=None, flags=None):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            screen.set_span_attributes(x, y, length, fg, bg, flags)
+        elif flags is not None and flags & consolecolours.INVERT:
+            self.invert_span(x, y, length)
+
+    def set_rect_attributes(self, x, y, width, height, fg=None, bg=None, flags=None):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            screen.set_rect_attributes(x, y, width, height, fg, bg, flags)
+        elif flags is not None and flags & consolecolours.INVERT:
+            self.invert_rect(x, y, width, height)
+
+    # Recolours the whole screen from the next refresh on, e.g. with one of
+    # consolecolours.THEMES. Unlike attributes, this outlasts clear. Without
+    # a ScreenBuffer there's nothing to recolour.
+    def swap_palette(self, mapping):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            screen.swap_palette(mapping)
+
+    def set_palette(self, colours):
+        screen = getattr(self, "screen", None)
+        if screen is not None:
+            screen.set_palette(colours)
+
+    # Providers that blink cells themselves, rather than leaving it to the
+    # terminal, turn them on and off as time passes. advance_blink returns
+    # True if a refresh is needed to show the change.
+    def advance_blink(self, now):
+        return False
+
+    def time_to_next_blink(self, now):
+        return None
+
+    def get_input_queue(self):
+        if self.input_queue is None:
+            self.input_queue = InputQueue()
+        return self.input_queue
+
+    # Returns a key that has already arrived, or NO_KEY without waiting.
+    # Providers that can check for input without changing the blocking mode
+    # can override this.
+    def poll_key(self):
+        is_blocking = self.is_blocking
+        self.set_input_blocking_mode(False)
+        try:
+            return self.getch()
+        finally:
+            self.set_input_blocking_mode(is_blocking)
+
+    # Waits for a key as getch does (unless keys are queued already), then
+    # takes in every other key that has arrived, and returns the next batch
+    # as (key, repeat) pairs with runs of a movement key coalesced, e.g.
+    # [(DOWN_ARROW, 5), (ENTER, 1)]. Returns [] if no key came while input
+    # isn't blocking.
+    def read_keys(self):
+        queue = self.get_input_queue()
+        if len(queue) == 0:
+            key = self.getch()
+            if key == consolekeys.NO_KEY:
+                return []
+            queue.keys.append(key)
+        while not queue.is_full():
+            key = self.poll_key()
+            if key == consolekeys.NO_KEY:
+                break
+            queue.keys.append(key)
+        return queue.take()
+
+    # A file descriptor that becomes readable when a key is waiting, for
+    # providers that have one, so event loops can wait on it instead of polling
+    def input_fileno(self):
+        return None
+
+    # Releases whatever the provider holds on to (terminal modes, windows, etc.)
+    def close(self):
+        self.sound.close()
+        if getattr(self, "recorder", None) is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    # Writes every key returned by getch and every refreshed frame to file,
+    # for playing back later with recording.py
+    def start_recording(self, file, keyframe_interval=recording.DEFAULT_KEYFRAME_INTERVAL):
+        self.recorder = recording.SessionRecorder(file, self.screen.width, self.screen.height,
+                                                  keyframe_interval)
+        self.screen.recorder = self.recorder
+        getch = self.getch
+        def recorded_getch():
+            key = getch()
+            if key != consolekeys.NO_KEY:
+                self.recorder.record_key(key)
+            return key
+        self.getch = recorded_getch
+
     # getch must return an int that is either an ASCII code or a constant from consolekeys
     @abstractmethod
     def getch(self):
@@ -80,6 +613,20 @@ class BaseOSProvider(ABC):
     def invert_at(self, x, y):
         pass
 
+    # Bulk versions of invert_at. Providers with a faster way of inverting
+    # many cells at once should override these.
+    def invert_cells(self, coords):
+        for x, y in coords:
+            self.invert_at(x, y)
+
+    def invert_span(self, x, y, length):
+        for offset in range(length):
+            self.invert_at(x + offset, y)
+
+    def invert_rect(self, x, y, width, height):
+        for row in range(height):
+            self.invert_span(x, y + row, width)
+
     @abstractmethod
     def clear(self):
         pass
@@ -88,44 +635,58 @@ class BaseOSProvider(ABC):
     def refresh(self):
         pass
 
-    @abstractmethod
-    def execute_program(self, program, args):
-        pass
-
     @abstractmethod
     def set_input_blocking_mode(self, is_blocking):
         pass
 
 class TcodOSProvider(BaseOSProvider):
+    KEY_POLL_INTERVAL = 1 / 60
+
     def __init__(self):
+        global tcod, TCOD_KEYS
+        import tcod
+        if TCOD_KEYS is None:
+            TCOD_KEYS = {
+                tcod.KEY_BACKSPACE: consolekeys.BACKSPACE,
+                tcod.KEY_DELETE: consolekeys.DELETE,
+                tcod.KEY_ENTER: consolekeys.ENTER,
+                tcod.KEY_ESCAPE: consolekeys.ESCAPE,
+
+                tcod.KEY_LEFT: consolekeys.LEFT_ARROW,
+                tcod.KEY_RIGHT: consolekeys.RIGHT_ARROW,
+                tcod.KEY_UP: consolekeys.UP_ARROW,
+                tcod.KEY_DOWN: consolekeys.DOWN_ARROW,
+
+                tcod.KEY_HOME: consolekeys.HOME,
+                tcod.KEY_END: consolekeys.END,
+                tcod.KEY_PAGEUP: consolekeys.PAGE_UP,
+                tcod.KEY_PAGEDOWN: consolekeys.PAGE_DOWN,
+
+                tcod.KEY_TAB: consolekeys.TAB,
+            }
         self.common_setup()
         tcod.console_set_custom_font('font/robco-termfont.png', tcod.FONT_LAYOUT_ASCII_INROW, 16, 8)
         self.console = tcod.console_init_root(w=60, h=24, order='F', fullscreen=True)
-        self.console.default_fg = (0, 255, 0)
-        self.console.default_bg = (0, 0, 0)
+        # Drawing happens in the screen buffer, and refresh copies only the
+        # cells that changed since the last frame into the tcod console,
+        # characters and colours together
+        self.screen = ScreenBuffer(60, 24)
+        self.console.default_fg = tuple(consolecolours.PALETTE[consolecolours.DEFAULT_FG])
+        self.console.default_bg = tuple(consolecolours.PALETTE[consolecolours.DEFAULT_BG])
         self.clear()
         self.refresh()
         self.program = None
 
-    def execute_program(self, program_name, args):
-        exit = False
-        while not exit:
-            self.program = self.execute_program_import(program_name, args)
-            result = self.program.run(self)
-            
-            if result is None or len(result) == 0 or result[0] is None:
-                exit = True
-            else:
-                program_name = result[0]
-                args = result[1]
-
     def getch(self):
         key = tcod.KEY_NONE
         char = consolekeys.NO_KEY
-        if self.is_blocking:
+        if self.is_blocking and (self.teletype.time_to_next_change() is not None or
+                                 self.screen.is_blinking()):
+            key = self.wait_for_keypress_animated()
+        elif self.is_blocking:
             key = tcod.console_wait_for_keypress(False)
         else:
-            key = tcod.console_check_for_keypress()
+            key = tcod.console_check_for_keypress(tcod.KEY_PRESSED)
 
         if key == tcod.KEY_NONE or key.vk == tcod.KEY_NONE:
             return consolekeys.NO_KEY
@@ -137,45 +698,463 @@ class TcodOSProvider(BaseOSProvider):
             char = consolekeys.FUNC_1 + (key.vk - tcod.KEY_F1)
 
         if char == consolekeys.NO_KEY:
-            mappings = {
-                tcod.KEY_BACKSPACE: consolekeys.BACKSPACE,
-                tcod.KEY_DELETE: consolekeys.DELETE,
-                tcod.KEY_ENTER: consolekeys.ENTER,
-                tcod.KEY_ESCAPE: consolekeys.ESCAPE,
-
-                tcod.KEY_LEFT: consolekeys.LEFT_ARROW,
-                tcod.KEY_RIGHT: consolekeys.RIGHT_ARROW,
-                tcod.KEY_UP: consolekeys.UP_ARROW,
-                tcod.KEY_DOWN: consolekeys.DOWN_ARROW,
-
-                tcod.KEY_HOME: consolekeys.HOME,
-                tcod.KEY_END: consolekeys.END,
-                tcod.KEY_PAGEUP: consolekeys.PAGE_UP,
-                tcod.KEY_PAGEDOWN: consolekeys.PAGE_DOWN,
-
-                tcod.KEY_TAB: consolekeys.TAB,
-            }
-            char = mappings.get(key.vk, consolekeys.UNKNOWN_KEY)
+            char = TCOD_KEYS.get(key.vk, consolekeys.UNKNOWN_KEY)
         self.play_sound_for_char(char)
         return char
 
+    # tcod can't wait for a key with a timeout, so while text is typing or a
+    # cursor or cells are blinking, check for keys between animation steps.
+    # Once nothing is animating any more, block until a key is pressed.
+    def wait_for_keypress_animated(self):
+        while True:
+            key = tcod.console_check_for_keypress(tcod.KEY_PRESSED)
+            if key.vk != tcod.KEY_NONE:
+                return key
+            typed = self.teletype.advance(self)
+            if self.advance_blink(time.monotonic()) or typed:
+                self.refresh()
+            wait = self.teletype.time_to_next_change()
+            if wait is None and not self.screen.is_blinking():
+                return tcod.console_wait_for_keypress(False)
+            time.sleep(self.KEY_POLL_INTERVAL if wait is None else min(wait, self.KEY_POLL_INTERVAL))
+
     def clear(self):
-        self.console.clear()
+        self.screen.clear()
 
     def refresh(self):
+        self.screen.update_blink(time.monotonic())
+        damage = self.screen.take_damage()
+        if self.screen.changed_cells > 0:
+            self.console.ch[damage] = self.screen.chars[damage]
+            self.console.fg[damage], self.console.bg[damage] = self.screen.colours(damage)
         tcod.console_flush()
 
+    def advance_blink(self, now):
+        return self.screen.update_blink(now)
+
+    def time_to_next_blink(self, now):
+        return self.screen.time_to_next_blink(now)
+
+    def set_character(self, x, y, ch):
+        self.screen.set_character(x, y, ch)
+
+    def print_str(self, x, y, str):
+        self.screen.print_str(x, y, str)
+
+    def set_input_blocking_mode(self, is_blocking):
+        self.is_blocking = is_blocking
+
+    def invert_at(self, x, y):
+        self.screen.invert_at(x, y)
+
+    def invert_cells(self, coords):
+        self.screen.invert_cells(coords)
+
+    def invert_span(self, x, y, length):
+        self.screen.invert_span(x, y, length)
+
+    def invert_rect(self, x, y, width, height):
+        self.screen.invert_rect(x, y, width, height)
+
+"""
+Keeps the console in memory and reads keys from a script, so programs can run
+without a window, a keyboard or an audio device (e.g. for profiling and tests)
+"""
+class HeadlessOSProvider(BaseOSProvider):
+    def __init__(self, keys=(), width=60, height=24, end_key=consolekeys.ESCAPE):
+        # keys is any iterable of ints (ASCII codes or consolekeys constants)
+        # or single-character strings. Once it runs out, getch returns end_key.
+        # A tuple or list in keys is a burst of keys that arrive together,
+        # as from a held key, which read_keys takes in one batch.
+        self.is_blocking = True
+        self.sound = sound_service.NullSoundService()
+        self.width = width
+        self.height = height
+        self.keys = iter(keys)
+        self.burst = collections.deque()
+        self.end_key = end_key
+        self.frame_count = 0
+        self.key_count = 0
+        self.screen = ScreenBuffer(width, height)
+        self.chars = self.screen.chars
+        self.inverted = self.screen.inverted
+        self.program = None
+
+    def getch(self):
+        if len(self.burst) == 0:
+            key = next(self.keys, self.end_key)
+            if isinstance(key, (tuple, list)):
+                self.burst.extend(key)
+                key = self.burst.popleft() if len(self.burst) > 0 else consolekeys.NO_KEY
+        else:
+            key = self.burst.popleft()
+        if isinstance(key, str):
+            key = ord(key)
+        self.key_count += 1
+        return key
+
+    def poll_key(self):
+        # Only the rest of a burst has arrived already
+        if len(self.burst) == 0:
+            return consolekeys.NO_KEY
+        return self.getch()
+
+    def clear(self):
+        self.screen.clear()
+
+    def refresh(self):
+        self.screen.take_damage()
+        self.frame_count += 1
+
+    def set_character(self, x, y, ch):
+        self.screen.set_character(x, y, ch)
+
+    def print_str(self, x, y, str):
+        self.screen.print_str(x, y, str)
+
+    def set_input_blocking_mode(self, is_blocking):
+        self.is_blocking = is_blocking
+
+    def invert_at(self, x, y):
+        self.screen.invert_at(x, y)
+
+    def invert_cells(self, coords):
+        self.screen.invert_cells(coords)
+
+    def invert_span(self, x, y, length):
+        self.screen.invert_span(x, y, length)
+
+    def invert_rect(self, x, y, width, height):
+        self.screen.invert_rect(x, y, width, height)
+
+    def row_text(self, y):
+        return self.screen.row_text(y)
+
+    def screen_text(self):
+        return '\n'.join(self.row_text(y) for y in range(self.height))
+
+"""
+Escape sequences sent by common terminals (xterm, VT220, linux console) for
+keys that aren't plain ASCII, mapped to consolekeys constants
+"""
+ANSI_KEYS = {
+    b'\x1b[A': consolekeys.UP_ARROW,
+    b'\x1b[B': consolekeys.DOWN_ARROW,
+    b'\x1b[C': consolekeys.RIGHT_ARROW,
+    b'\x1b[D': consolekeys.LEFT_ARROW,
+    b'\x1bOA': consolekeys.UP_ARROW,
+    b'\x1bOB': consolekeys.DOWN_ARROW,
+    b'\x1bOC': consolekeys.RIGHT_ARROW,
+    b'\x1bOD': consolekeys.LEFT_ARROW,
+
+    b'\x1b[H': consolekeys.HOME,
+    b'\x1b[F': consolekeys.END,
+    b'\x1bOH': consolekeys.HOME,
+    b'\x1bOF': consolekeys.END,
+    b'\x1b[1~': consolekeys.HOME,
+    b'\x1b[4~': consolekeys.END,
+    b'\x1b[7~': consolekeys.HOME,
+    b'\x1b[8~': consolekeys.END,
+    b'\x1b[3~': consolekeys.DELETE,
+    b'\x1b[5~': consolekeys.PAGE_UP,
+    b'\x1b[6~': consolekeys.PAGE_DOWN,
+
+    b'\x1bOP': consolekeys.FUNC_1,
+    b'\x1bOQ': consolekeys.FUNC_2,
+    b'\x1bOR': consolekeys.FUNC_3,
+    b'\x1bOS': consolekeys.FUNC_4,
+    b'\x1b[11~': consolekeys.FUNC_1,
+    b'\x1b[12~': consolekeys.FUNC_2,
+    b'\x1b[13~': consolekeys.FUNC_3,
+    b'\x1b[14~': consolekeys.FUNC_4,
+    b'\x1b[15~': consolekeys.FUNC_5,
+    b'\x1b[17~': consolekeys.FUNC_6,
+    b'\x1b[18~': consolekeys.FUNC_7,
+    b'\x1b[19~': consolekeys.FUNC_8,
+    b'\x1b[20~': consolekeys.FUNC_9,
+    b'\x1b[21~': consolekeys.FUNC_10,
+    b'\x1b[23~': consolekeys.FUNC_11,
+    b'\x1b[24~': consolekeys.FUNC_12,
+}
+
+# Single bytes that terminals send differently from what consolekeys expects
+ANSI_BYTES = {
+    0x0a: consolekeys.ENTER,
+    0x0d: consolekeys.ENTER,
+    0x7f: consolekeys.BACKSPACE,
+    0x08: consolekeys.BACKSPACE,
+}
+
+"""
+Runs in a plain terminal (a TTY, over SSH, or on a pty). The screen is kept
+in a ScreenBuffer, and each refresh writes only the escape sequences needed to
+turn the previous frame into the current one, in a single write.
+"""
+class AnsiOSProvider(BaseOSProvider):
+    # How long to wait for the rest of an escape sequence before deciding
+    # that a lone ESC was the escape key
+    ESCAPE_TIMEOUT = 0.025
+
+    def __init__(self, input_fd=0, output_fd=1, width=60, height=24):
+        self.is_blocking = True
+        self.sound = sound_service.NullSoundService()
+        self.input_fd = input_fd
+        self.output_fd = output_fd
+        self.width = width
+        self.height = height
+        self.screen = ScreenBuffer(width, height)
+        self.pending = bytearray()
+        self.program = None
+        # Where the terminal's cursor is and the attributes it's writing
+        # with (packed as by packed_attributes), as far as the output written
+        # so far is concerned
+        self.cursor = None
+        self.attribute = None
+        self.attributes = None
+        # SGR sequences for packed attributes, for the palette they were
+        # made from
+        self.sgr = {}
+        self.sgr_palette = None
+        self.bytes_written = 0
+        self.last_frame_bytes = 0
+
+        self.saved_mode = None
+        if self.input_fd is not None and os.isatty(self.input_fd):
+            import termios
+            import tty
+            self.saved_mode = termios.tcgetattr(self.input_fd)
+            tty.setcbreak(self.input_fd)
+
+        # Alternate screen, hidden cursor, green on black
+        self.write_output(b'\x1b[?1049h\x1b[?25l\x1b[0;32;40m\x1b[2J')
+        self.clear()
+        self.refresh()
+
+    def close(self):
+        super().close()
+        self.write_output(b'\x1b[0m\x1b[?25h\x1b[?1049l')
+        if self.saved_mode is not None:
+            import termios
+            termios.tcsetattr(self.input_fd, termios.TCSADRAIN, self.saved_mode)
+            self.saved_mode = None
+
+    def input_fileno(self):
+        return self.input_fd
+
+    def write_output(self, data):
+        view = memoryview(data)
+        while len(view) > 0:
+            written = os.write(self.output_fd, view)
+            view = view[written:]
+        self.bytes_written += len(data)
+
+    def read_input(self, timeout):
+        # Appends whatever input is available within timeout seconds
+        # (None waits indefinitely). Returns False if nothing arrived.
+        readable, _, _ = select.select([self.input_fd], [], [], timeout)
+        if len(readable) == 0:
+            return False
+        data = os.read(self.input_fd, 1024)
+        if len(data) == 0:
+            raise EOFError('terminal input closed')
+        self.pending += data
+        return True
+
+    def getch(self):
+        if len(self.pending) == 0:
+            if not self.is_blocking:
+                if not self.read_input(0):
+                    return consolekeys.NO_KEY
+            else:
+                # Keep typing text and blinking cursors going while waiting
+                while not self.read_input(self.teletype.time_to_next_change()):
+                    if self.teletype.advance(self):
+                        self.refresh()
+        return self.next_key()
+
+    def next_key(self):
+        if self.pending[0] == 0x1b:
+            if len(self.pending) == 1 and not self.read_input(self.ESCAPE_TIMEOUT):
+                del self.pending[0]
+                return consolekeys.ESCAPE
+            return self.next_escape_sequence()
+
+        first = self.pending[0]
+        if first in ANSI_BYTES:
+            del self.pending[0]
+            return ANSI_BYTES[first]
+        if first < 0x80:
+            del self.pending[0]
+            return first
+
+        # A UTF-8 encoded character, which may not have fully arrived yet
+        length = 2 if first < 0xe0 else 3 if first < 0xf0 else 4
+        while len(self.pending) < length and self.read_input(self.ESCAPE_TIMEOUT):
+            pass
+        sequence = bytes(self.pending[:length])
+        del self.pending[:length]
+        try:
+            return ord(sequence.decode('utf-8'))
+        except (UnicodeDecodeError, TypeError):
+            return consolekeys.UNKNOWN_KEY
+
+    def next_escape_sequence(self):
+        # Reads up to the final byte of a CSI (ESC [) or SS3 (ESC O) sequence
+        while True:
+            end = self.escape_sequence_end()
+            if end is not None:
+                break
+            if not self.read_input(self.ESCAPE_TIMEOUT):
+                end = len(self.pending)
+                break
+        sequence = bytes(self.pending[:end])
+        del self.pending[:end]
+        if len(sequence) == 2 and sequence[1] not in b'[O':
+            # Alt+key arrives as ESC followed by the key
+            return sequence[1]
+        return ANSI_KEYS.get(sequence, consolekeys.UNKNOWN_KEY)
+
+    def escape_sequence_end(self):
+        if len(self.pending) < 2:
+            return None
+        if self.pending[1] == ord('O'):
+            return 3 if len(self.pending) >= 3 else None
+        if self.pending[1] != ord('['):
+            return 2
+        for position in range(2, len(self.pending)):
+            if 0x40 <= self.pending[position] <= 0x7e:
+                return position + 1
+        return None
+
+    def clear(self):
+        self.screen.clear()
+
+    def refresh(self):
+        damage = self.screen.take_damage()
+        if self.screen.changed_cells == 0:
+            self.last_frame_bytes = 0
+            return
+        output = self.render_damage(damage).encode('utf-8', 'replace')
+        self.write_output(output)
+        self.last_frame_bytes = len(output)
+
+    def packed_attributes(self):
+        # Every cell's colours and flags as one number, so a change of any
+        # of them is a single comparison
+        screen = self.screen
+        attributes = screen.flags.astype(np.int32)
+        attributes |= screen.inverted * consolecolours.INVERT
+        attributes <<= 16
+        attributes |= screen.bg.astype(np.int32) << 8
+        attributes |= screen.fg
+        return attributes
+
+    def select_graphic_rendition(self, attribute):
+        # The escape sequence that switches to a packed attribute. Colours
+        # come from the palette, so the terminal needs 24-bit colour; blink
+        # and dim are left to the terminal.
+        sequence = self.sgr.get(attribute)
+        if sequence is None:
+            flags = attribute >> 16
+            codes = ['0', '38;2;%d;%d;%d' % tuple(self.sgr_palette[attribute & 0xff]),
+                     '48;2;%d;%d;%d' % tuple(self.sgr_palette[(attribute >> 8) & 0xff])]
+            if flags & consolecolours.INVERT:
+                codes.append('7')
+            if flags & consolecolours.BLINK:
+                codes.append('5')
+            if flags & consolecolours.DIM:
+                codes.append('2')
+            sequence = self.sgr[attribute] = '\x1b[' + ';'.join(codes) + 'm'
+        return sequence
+
+    def render_damage(self, damage):
+        # Visits the changed cells in the order the terminal writes them,
+        # moving the cursor only when it isn't already where it needs to be
+        # and switching attributes only when they change
+        if self.sgr_palette is not self.screen.palette:
+            # The same attribute now means different colours, so the first
+            # cell written has to select it again
+            self.sgr = {}
+            self.sgr_palette = self.screen.palette
+            self.attribute = None
+        self.attributes = self.packed_attributes()
+        parts = []
+        ys, xs = np.nonzero(damage.T)
+        chars = self.screen.chars[xs, ys].tolist()
+        attributes = self.attributes[xs, ys].tolist()
+        for y, x, char, attribute in zip(ys.tolist(), xs.tolist(), chars, attributes):
+            if self.cursor != (x, y):
+                parts.append(self.move_to(x, y))
+            if attribute != self.attribute:
+                self.attribute = attribute
+                parts.append(self.select_graphic_rendition(attribute))
+            parts.append(self.printable(char))
+            # Stop tracking the cursor at the right edge, since terminals
+            # differ on where it ends up after the last column
+            self.cursor = (x + 1, y) if x + 1 < self.width else None
+        return ''.join(parts)
+
+    def move_to(self, x, y):
+        absolute = '\x1b[%d;%dH' % (y + 1, x + 1)
+        if self.cursor is None or self.cursor[1] != y or self.cursor[0] > x:
+            return absolute
+        # Moving right along a row: rewriting a few unchanged cells is shorter
+        # than any escape sequence, as long as they share the current attribute
+        start = self.cursor[0]
+        gap = x - start
+        if gap <= 3 and not np.any(self.attributes[start:x, y] != self.attribute):
+            return ''.join(self.printable(code) for code in self.screen.chars[start:x, y])
+        relative = '\x1b[%dC' % gap if gap > 1 else '\x1b[C'
+        return relative if len(relative) < len(absolute) else absolute
+
+    @staticmethod
+    def printable(code):
+        if code < 32 or code == 127:
+            return ' '
+        return chr(code)
+
     def set_character(self, x, y, ch):
-        self.console.put_char(x, y, ord(ch))
+        self.screen.set_character(x, y, ch)
 
     def print_str(self, x, y, str):
-        self.console.print_(x, y, str)
+        self.screen.print_str(x, y, str)
 
     def set_input_blocking_mode(self, is_blocking):
         self.is_blocking = is_blocking
 
     def invert_at(self, x, y):
-        for channel in range(3):
-            temp = self.console.fg[x, y, channel]
-            self.console.fg[x, y, channel] = self.console.bg[x, y, channel]
-            self.console.bg[x, y, channel] = temp
+        self.screen.invert_at(x, y)
+
+    def invert_cells(self, coords):
+        self.screen.invert_cells(coords)
+
+    def invert_span(self, x, y, length):
+        self.screen.invert_span(x, y, length)
+
+    def invert_rect(self, x, y, width, height):
+        self.screen.invert_rect(x, y, width, height)
+
+"""
+Providers that can be chosen by name (e.g. with robco_os.py --provider).
+Entries are either a provider class, or a "module:ClassName" string for
+providers that live in other modules, which are only imported when the
+provider is created.
+"""
+PROVIDERS = {
+    "tcod": TcodOSProvider,
+    "ansi": AnsiOSProvider,
+    "headless": HeadlessOSProvider,
+}
+
+def register_provider(name, provider):
+    PROVIDERS[name] = provider
+
+def create_provider(name, *args, **kwargs):
+    provider = PROVIDERS.get(name)
+    if provider is None:
+        raise ValueError("Unknown provider '%s', expected one of: %s" % (name, ", ".join(sorted(PROVIDERS))))
+    if isinstance(provider, str):
+        module_name, class_name = provider.split(":")
+        provider = getattr(importlib.import_module(module_name), class_name)
+        PROVIDERS[name] = provider
+    return provider(*args, **kwargs)
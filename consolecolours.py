@@ -0,0 +1,46 @@
+"""
+These are the colours and flags that console cells can be drawn with.
+
+Colours are indices into the provider's palette, so a whole screen can be
+recoloured by changing the palette (see THEMES) without redrawing anything.
+"""
+
+BLACK = 0
+GREEN = 1
+BRIGHT_GREEN = 2
+DARK_GREEN = 3
+AMBER = 4
+RED = 5
+WHITE = 6
+CYAN = 7
+
+# RGB for each colour above, in order
+PALETTE = (
+    (0, 0, 0),
+    (0, 255, 0),
+    (160, 255, 160),
+    (0, 128, 0),
+    (255, 176, 0),
+    (255, 64, 64),
+    (255, 255, 255),
+    (0, 255, 255),
+)
+
+DEFAULT_FG = GREEN
+DEFAULT_BG = BLACK
+
+# Flags, which can be combined
+INVERT = 1
+BLINK = 2
+DIM = 4
+
+# Seconds that blinking cells spend on, then off
+BLINK_INTERVAL = 0.5
+
+# Palette swaps for the other monochrome terminals: each colour is shown as
+# the colour it maps to
+THEMES = {
+    'green': {},
+    'amber': {GREEN: AMBER, BRIGHT_GREEN: (255, 214, 128), DARK_GREEN: (128, 88, 0)},
+    'white': {GREEN: (208, 208, 208), BRIGHT_GREEN: WHITE, DARK_GREEN: (112, 112, 112)},
+}
@@ -38,3 +38,19 @@ HOME = FUNC_14 + 1
 END = HOME + 1
 PAGE_UP = HOME + 2
 PAGE_DOWN = HOME + 3
+
+# Keys that only move something (a cursor, a page), so when several of the
+# same arrive together, e.g. from a held key, they can be applied as one
+MOVEMENT_KEYS = frozenset((LEFT_ARROW, RIGHT_ARROW, UP_ARROW, DOWN_ARROW, PAGE_UP, PAGE_DOWN))
+
+
+def coalesce(keys):
+    # Returns keys as (key, repeat) pairs, with each run of the same
+    # movement key as one pair and every other key a pair of its own
+    pairs = []
+    for key in keys:
+        if len(pairs) > 0 and key == pairs[-1][0] and key in MOVEMENT_KEYS:
+            pairs[-1] = (key, pairs[-1][1] + 1)
+        else:
+            pairs.append((key, 1))
+    return pairs
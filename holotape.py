@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""
+Holotapes: a local directory or zip archive mounted as a read-only set of
+entries, which programs can list and read.
+
+Entries are opened as buffers rather than read into memory. Files in a
+directory, and zip members stored without compression, are memory-mapped, so
+even a multi-gigabyte log costs nothing until its pages are looked at.
+Compressed zip members have to be decompressed, and are read whole.
+
+    tape = holotape.mount('vault-111-logs.zip')
+    for name in tape.entries():
+        ...
+    with tape.open(name) as entry:
+        entry.buffer[:100]
+"""
+
+import mmap
+import os
+import posixpath
+import struct
+import zipfile
+
+# The fixed part of a zip local file header, which sits in front of each
+# member's data: signature, versions, flags, sizes and name/extra lengths
+ZIP_LOCAL_HEADER = struct.Struct('<4s2B4HL2L2H')
+
+
+class Entry:
+    # An open holotape entry. buffer supports len(), slicing, find() and
+    # rfind(), whether it's a memory map or bytes.
+
+    def __init__(self, name, buffer, mapping=None):
+        self.name = name
+        self.buffer = buffer
+        self.mapping = mapping
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def close(self):
+        if self.mapping is not None:
+            self.mapping.close()
+            self.mapping = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class SliceBuffer:
+    # A window onto part of a memory map (a stored zip member), offering
+    # the same find/rfind/slicing as the map itself with offsets relative
+    # to the start of the window
+
+    def __init__(self, mapping, start, length):
+        self.mapping = mapping
+        self.start = start
+        self.length = length
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.length)
+            return self.mapping[self.start + start:self.start + stop:step]
+        if key < 0:
+            key += self.length
+        if not 0 <= key < self.length:
+            raise IndexError('holotape entry index out of range')
+        return self.mapping[self.start + key]
+
+    def find(self, sub, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        position = self.mapping.find(sub, self.start + start, self.start + end)
+        return position if position < 0 else position - self.start
+
+    def rfind(self, sub, start=0, end=None):
+        end = self.length if end is None else min(end, self.length)
+        position = self.mapping.rfind(sub, self.start + start, self.start + end)
+        return position if position < 0 else position - self.start
+
+
+def map_file(path, offset=0, length=None):
+    # Maps length bytes of path from offset, returning (buffer, mapping)
+    with open(path, 'rb') as file:
+        size = os.fstat(file.fileno()).st_size
+        if length is None:
+            length = size - offset
+        if length == 0:
+            return b'', None
+        # Maps have to start on an allocation boundary
+        aligned = offset - offset % mmap.ALLOCATIONGRANULARITY
+        mapping = mmap.mmap(file.fileno(), length + offset - aligned,
+                            access=mmap.ACCESS_READ, offset=aligned)
+    if aligned == offset:
+        return mapping, mapping
+    return SliceBuffer(mapping, offset - aligned, length), mapping
+
+
+class DirectoryHolotape:
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path.rstrip(os.sep))
+
+    def entries(self):
+        names = []
+        for root, directories, files in os.walk(self.path):
+            directories.sort()
+            for file in sorted(files):
+                relative = os.path.relpath(os.path.join(root, file), self.path)
+                names.append(relative.replace(os.sep, '/'))
+        return names
+
+    def local_path(self, name):
+        # Entry names can't reach outside the holotape
+        name = posixpath.normpath('/' + name).lstrip('/')
+        path = os.path.join(self.path, *name.split('/'))
+        if not os.path.isfile(path):
+            raise FileNotFoundError(name)
+        return path
+
+    def size(self, name):
+        return os.path.getsize(self.local_path(name))
+
+    def open(self, name):
+        buffer, mapping = map_file(self.local_path(name))
+        return Entry(name, buffer, mapping)
+
+
+class ZipHolotape:
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self.name = os.path.basename(self.path)
+        with zipfile.ZipFile(self.path) as archive:
+            self.members = {info.filename: info for info in archive.infolist() if not info.is_dir()}
+
+    def entries(self):
+        return sorted(self.members)
+
+    def size(self, name):
+        return self.members[name].file_size
+
+    def open(self, name):
+        info = self.members.get(name)
+        if info is None:
+            raise FileNotFoundError(name)
+        if info.compress_type == zipfile.ZIP_STORED and not info.flag_bits & 0x1:
+            # Stored members are plain bytes in the archive, so they can be
+            # mapped in place. Their data starts after the local header.
+            with open(self.path, 'rb') as file:
+                file.seek(info.header_offset)
+                header = ZIP_LOCAL_HEADER.unpack(file.read(ZIP_LOCAL_HEADER.size))
+            name_length, extra_length = header[-2], header[-1]
+            offset = info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length
+            buffer, mapping = map_file(self.path, offset, info.file_size)
+            return Entry(name, buffer, mapping)
+        with zipfile.ZipFile(self.path) as archive:
+            return Entry(name, archive.read(info))
+
+
+def mount(path):
+    # Mounts a directory or zip archive as a holotape
+    if os.path.isdir(path):
+        return DirectoryHolotape(path)
+    if zipfile.is_zipfile(path):
+        return ZipHolotape(path)
+    raise ValueError('%s is not a directory or zip archive' % path)
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Measures where the time goes in a running session.
+
+A Profiler attached to a provider (see BaseOSProvider.start_profiling) times
+getch, refresh and the programs it runs, counts the drawing calls made for
+each frame, and measures input latency: the time from getch returning a key
+to the end of the next refresh, i.e. until the result is on screen.
+
+Timings are kept in rolling histograms of the most recent samples, for
+percentiles, and every frame is recorded (again, the most recent ones) for
+dumping to JSON or CSV. Nothing is hooked until profiling starts, so a
+provider that isn't being profiled pays nothing for it.
+
+    python robco_os.py --profile hack                     # summary on stderr
+    python robco_os.py --profile-out frames.csv hack      # and every frame
+"""
+
+import contextlib
+import csv
+import json
+import math
+import time
+from array import array
+
+DEFAULT_WINDOW = 4096
+DRAW_CALLS = ('print_str', 'set_character', 'invert_at', 'invert_cells', 'invert_span',
+              'invert_rect', 'set_span_attributes', 'set_rect_attributes')
+FRAME_FIELDS = ('time', 'refresh', 'latency', 'changed_cells') + DRAW_CALLS
+
+
+class Histogram:
+    # The last window samples, for percentiles, plus counts of every sample
+    # ever added in power-of-two microsecond buckets
+
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.samples = array('d', [0.0] * window)
+        self.position = 0
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+        self.buckets = {}
+
+    def add(self, value):
+        self.samples[self.position] = value
+        self.position = (self.position + 1) % self.window
+        self.count += 1
+        self.total += value
+        self.maximum = max(self.maximum, value)
+        bucket = 0 if value <= 1e-6 else math.ceil(math.log2(value * 1e6))
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+
+    def recent(self):
+        return self.samples[:min(self.count, self.window)]
+
+    def percentile(self, fraction):
+        recent = sorted(self.recent())
+        if len(recent) == 0:
+            return 0.0
+        return recent[min(len(recent) - 1, int(fraction * len(recent)))]
+
+    def summary(self):
+        return {'count': self.count, 'mean': self.total / self.count if self.count else 0.0,
+                'p50': self.percentile(0.5), 'p99': self.percentile(0.99), 'max': self.maximum,
+                # Bucket n holds samples of up to 2**n microseconds
+                'buckets_us': {str(2 ** bucket): count
+                               for bucket, count in sorted(self.buckets.items())}}
+
+
+class Profiler:
+
+    def __init__(self, window=DEFAULT_WINDOW, clock=time.perf_counter):
+        self.window = window
+        self.clock = clock
+        self.started = clock()
+        self.histograms = {}
+        self.frames = []
+        self.frame_position = 0
+        # Drawing calls made since the last refresh
+        self.draw_counts = dict.fromkeys(DRAW_CALLS, 0)
+        # When the key the next refresh answers was returned by getch
+        self.key_time = None
+
+    def add(self, name, value):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram(self.window)
+        histogram.add(value)
+
+    @contextlib.contextmanager
+    def timer(self, name):
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.add(name, self.clock() - started)
+
+    def key_pressed(self, when):
+        if self.key_time is None:
+            self.key_time = when
+
+    def frame_done(self, started, ended, changed_cells):
+        latency = None
+        if self.key_time is not None:
+            latency = ended - self.key_time
+            self.add('latency', latency)
+            self.key_time = None
+        self.add('refresh', ended - started)
+        for name, count in self.draw_counts.items():
+            self.add('draw.' + name, count)
+        frame = (ended - self.started, ended - started, latency, changed_cells) + \
+            tuple(self.draw_counts.values())
+        if len(self.frames) < self.window:
+            self.frames.append(frame)
+        else:
+            self.frames[self.frame_position] = frame
+            self.frame_position = (self.frame_position + 1) % self.window
+        self.draw_counts = dict.fromkeys(DRAW_CALLS, 0)
+
+    def recent_frames(self):
+        return self.frames[self.frame_position:] + self.frames[:self.frame_position]
+
+    def summary(self):
+        return {name: histogram.summary() for name, histogram in sorted(self.histograms.items())}
+
+    def report(self, file):
+        # Prints a line per histogram: times in microseconds, draw.* in calls
+        # per frame
+        print('%-24s %8s %10s %10s %10s' % ('', 'count', 'p50', 'p99', 'max'), file=file)
+        for name, histogram in sorted(self.histograms.items()):
+            scale = 1 if name.startswith('draw.') else 1e6
+            print('%-24s %8d %10.1f %10.1f %10.1f' %
+                  (name, histogram.count, histogram.percentile(0.5) * scale,
+                   histogram.percentile(0.99) * scale, histogram.maximum * scale), file=file)
+
+    def dump(self, path):
+        # Writes every recent frame as CSV if path ends in .csv, or the
+        # summary and frames as JSON otherwise
+        if path.endswith('.csv'):
+            with open(path, 'w', newline='') as file:
+                writer = csv.writer(file)
+                writer.writerow(FRAME_FIELDS)
+                writer.writerows(self.recent_frames())
+        else:
+            with open(path, 'w') as file:
+                json.dump({'summary': self.summary(),
+                           'frames': [dict(zip(FRAME_FIELDS, frame))
+                                      for frame in self.recent_frames()]}, file, indent=2)
+
+    def attach(self, provider):
+        # Wraps the provider's getch, refresh and drawing calls with timed
+        # and counting versions
+        clock = self.clock
+
+        getch = provider.getch
+        def profiled_getch():
+            started = clock()
+            key = getch()
+            ended = clock()
+            self.add('getch', ended - started)
+            if key > 0:
+                self.key_pressed(ended)
+            return key
+        provider.getch = profiled_getch
+
+        refresh = provider.refresh
+        screen = getattr(provider, 'screen', None)
+        def profiled_refresh():
+            started = clock()
+            refresh()
+            self.frame_done(started, clock(), screen.changed_cells if screen is not None else 0)
+        provider.refresh = profiled_refresh
+
+        for name in DRAW_CALLS:
+            setattr(provider, name, self.counted(name, getattr(provider, name)))
+
+    def counted(self, name, method):
+        def counted_call(*args, **kwargs):
+            self.draw_counts[name] += 1
+            return method(*args, **kwargs)
+        return counted_call
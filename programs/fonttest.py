@@ -19,27 +19,29 @@ class Program:
         self.provider.clear()
         self.provider.refresh()
 
+    def draw(self, provider):
+        provider.print_str(0, 0, 'THE QUICK BROWN FOX JUMPED OVER THE LAZY DOG')
+        provider.print_str(0, 1, 'the quick brown fox jumped over the lazy dog')
+        provider.print_str(0, 2, '01234567890123456789')
+        provider.print_str(0, 3, '!@#$%^&*()_+-=[]{}\\/|,.<>?;:"')
+        provider.print_str(0, 4, 'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed')
+        provider.print_str(0, 5, 'do eiusmod tempor incididunt ut labore et dolore magna')
+        provider.print_str(0, 6, 'aliqua. Ut enim ad minim veniam, quis nostrud exercitation')
+        provider.print_str(0, 7, 'ullamco laboris nisi ut aliquip ex ea commodo consequat.')
+        provider.print_str(0, 8, 'Duis aute irure dolor in reprehenderit in voluptate velit')
+        provider.print_str(0, 9, 'esse cillum dolore eu fugiat nulla pariatur. Excepteur sint')
+        provider.print_str(0, 10, 'occaecat cupidatat non proident, sunt in culpa qui officia')
+        provider.print_str(0, 11, 'deserunt mollit anim id est laborum.')
+
+        if self.string is not None:
+            provider.print_str(0, 12, self.string)
+
     def run(self, provider):
 
         while self.key_pressed is not ord('q') and self.key_pressed is not consolekeys.ESCAPE:
 
             self.provider.clear()
-            self.provider.print_str(0, 0, 'THE QUICK BROWN FOX JUMPED OVER THE LAZY DOG')
-            self.provider.print_str(0, 1, 'the quick brown fox jumped over the lazy dog')
-            self.provider.print_str(0, 2, '01234567890123456789')
-            self.provider.print_str(0, 3, '!@#$%^&*()_+-=[]{}\\/|,.<>?;:"')
-            self.provider.print_str(0, 4, 'Lorem ipsum dolor sit amet, consectetur adipiscing elit, sed')
-            self.provider.print_str(0, 5, 'do eiusmod tempor incididunt ut labore et dolore magna')
-            self.provider.print_str(0, 6, 'aliqua. Ut enim ad minim veniam, quis nostrud exercitation')
-            self.provider.print_str(0, 7, 'ullamco laboris nisi ut aliquip ex ea commodo consequat.')
-            self.provider.print_str(0, 8, 'Duis aute irure dolor in reprehenderit in voluptate velit')
-            self.provider.print_str(0, 9, 'esse cillum dolore eu fugiat nulla pariatur. Excepteur sint')
-            self.provider.print_str(0, 10, 'occaecat cupidatat non proident, sunt in culpa qui officia')
-            self.provider.print_str(0, 11, 'deserunt mollit anim id est laborum.')
-
-            if self.string is not None:
-                self.provider.print_str(0, 12, self.string)
-
+            self.draw(self.provider)
             self.provider.refresh()
 
             self.key_pressed = provider.getch()
@@ -47,3 +49,9 @@ class Program:
 
         return None
 
+    async def run_async(self, runtime):
+
+        while self.key_pressed is not ord('q') and self.key_pressed is not consolekeys.ESCAPE:
+            self.key_pressed = await runtime.next_key()
+
+        return None
@@ -1,11 +1,16 @@
 # -*- coding: utf-8 -*-
 """This is a basic recreation of the RobCo terminal hacking mini-game
 found in the Bethesda Fallout games and is playable in any Unix shell"""
+from programs import likeness
+from programs import memorydump
 from programs import passwordgen
+from programs import puzzlepool
+from programs import ringbuffer
+from programs import wordindex
 import random
-import string
 import os
 import sys
+import consolecolours
 import consolekeys
 import argparse
 
@@ -18,6 +23,14 @@ class Program:
         parser = argparse.ArgumentParser(description="Terminal hacking mini-game")
         parser.add_argument('-w', '--word-length', default=5, type=int)
         parser.add_argument('-n', '--number-of-words', default=12, type=int)
+        parser.add_argument('-d', '--difficulty', default=1, type=int, choices=[0, 1, 2],
+                            help='0 is easy, 1 is normal and 2 is hard')
+        parser.add_argument('--pool-depth', default=puzzlepool.DEFAULT_DEPTH, type=int,
+                            help='number of puzzles to keep generated ahead of time')
+        parser.add_argument('--words', default=passwordgen.WORDS_PATH,
+                            help='the word list to take words from, see programs.ingest')
+        parser.add_argument('--scrollback', default=100, type=int,
+                            help='number of side panel lines kept for paging back through')
         parser.add_argument('-p', '--program', help='the program to run upon successful password entry', default=None)
         parser.add_argument('args', nargs="*", help="arguments to be passed along to the next program", default=[])
         hackargs = parser.parse_args(args)
@@ -32,28 +45,32 @@ class Program:
         self.locked_out = False
         self.terminal_status = 'Accessible'
         self.attempts = 4
+        self.remaining_string = 'Attempts Remaining:'
         self.likeness = 0
         self.test_result = ''
         self.address = 0
         self.rows = 16
-        self.difficulty = 1
-        self.selectable_size = 384 # 16 rows of 12 char columns
-        self.side_text_size = 225 # 15 rows of 15 char columns
-        self.max_spacing = 0
+        self.difficulty = hackargs.difficulty
+        self.words_path = hackargs.words
+        self.selectable_size = puzzlepool.SELECTABLE_SIZE
+        self.side_rows = 15 # 15 rows of 15 char columns
+        self.side_width = 15
+        self.side_scroll = 0 # Rows scrolled back from the latest line
         self.word_list = []
-        self.word_start_locations = []
-        self.side_text = []
-        self.selectable_text = []
+        self.side_text = ringbuffer.RingBuffer(max(hackargs.scrollback, self.side_rows))
+        self.memory = None
         self.selection_length = 1
         self.selection_index = 0
-        self.highlightable_indices = []
-        self.bonus_indices = []
+        self.highlightable_indices = range(0)
         self.password = ''
         self.word_to_print = ''
         self.key_pressed = 0
-        self.offset = 0
+        # Times the key was pressed in a row, as read_keys coalesces them
+        self.key_repeat = 1
         self.cursor_x = 7
         self.cursor_y = 6
+        self.puzzle_pool = puzzlepool.get_pool(hackargs.pool_depth)
+        self.prompt_cursor = self.provider.teletype.add_cursor(41, 21)
 
         self.provider.clear()
         self.provider.refresh()
@@ -62,55 +79,41 @@ class Program:
 
     def make_new_dataset(self):
 
-        # Choose a new "memory" address to look at
-        junk_chars = list(string.punctuation)
-        self.address = random.randint(4096, 65500)
-        self.selectable_text.clear()
-        self.side_text.clear()
+        # Checked before anything is generated or drawn, so whoever started
+        # the game (e.g. one session of robco_server) can handle it
+        words = wordindex.get_word_index(self.words_path).count_of_length(self.word_length)
+        if words == 0 or words < self.num_words:
+            raise ValueError("Insufficient words of the requested length!")
+
+        # Puzzles are generated ahead of time by a background worker,
+        # so starting a game only has to take a finished one off the pool
+        dataset = self.puzzle_pool.get(self.word_length, self.num_words, self.difficulty,
+                                       self.words_path)
+        if len(dataset['word_list']) < self.num_words:
+            raise ValueError("Insufficient words of the requested length!")
+
+        self.address = dataset['address']
+        self.password = dataset['password']
+        self.word_list = dataset['word_list']
+        self.word_likeness = dict(zip(self.word_list, dataset['word_likeness']))
+        self.password_location = dataset['password_location']
+        self.memory = memorydump.MemoryDump(dataset['selectable_text'], self.word_length,
+                                            dataset['word_start_locations'])
+        self.draw_chrome()
 
-        # Test of side text
-        for _ in range(self.side_text_size):
-            self.side_text.append(' ')
-
-        # Generate a new "memory" dump populated with junk
-        for _ in range(self.selectable_size):
-            self.selectable_text.append(random.choice(junk_chars))
-
-        # Generate a list of words with one password
-        self.password, self.word_list = passwordgen.get_list_of_words(self.num_words,
-                                                                      self.word_length,
-                                                                      self.difficulty)
-        if len(self.word_list) == 0 or len(self.word_list) < self.num_words:
-            print("Insufficient words of the requested length!")
-            exit(-1)
-
-        random.shuffle(self.word_list)
-
-        # Keep track of where the password is for later bonus testing
-        # It needs to be randomly placed, but we can't accidentally delete it
-        # if a "dud replaced" bonus event occurs
-        self.password_location = self.word_list.index(self.password)
-
-        # Randomly insert the words and password among the junk chars,
-        # but distribute somewhat evenly to prevent overlap
-        self.max_spacing = (self.selectable_size-(self.word_length*self.num_words))//self.num_words
-        self.offset = random.randint(1, self.max_spacing)
-
-        for word in self.word_list:
-            # Overwrite the junk chars with the words we want
-            for char_idx, _ in enumerate(list(word)):
-                # Place the individual letters
-                self.selectable_text[self.offset+char_idx] = word[char_idx]
-                # Mark the start of all non-passwords
-                if word is not self.word_list[self.password_location] and char_idx == 0:
-                    self.word_start_locations.append(self.offset)
-            self.offset = self.offset + self.word_length +\
-                          random.randint(self.max_spacing-2, self.max_spacing)
-            # Keep from placing words too near the end
-            if self.offset > self.selectable_size:
-                self.offset = self.selectable_size - self.word_length
+        self.side_text.clear()
+        self.side_scroll = 0
 
     def update_cursor(self):
+        # A held arrow key moves the cursor once for every repeat, with each
+        # step wrapping between the columns as a single press would
+        if self.key_pressed not in consolekeys.MOVEMENT_KEYS:
+            return self.cursor_y, self.cursor_x
+        for _ in range(self.key_repeat):
+            self.move_cursor()
+        return self.cursor_y, self.cursor_x
+
+    def move_cursor(self):
         if self.key_pressed == consolekeys.DOWN_ARROW:
             self.cursor_y = self.cursor_y + 1
         elif self.key_pressed == consolekeys.UP_ARROW:
@@ -135,34 +138,18 @@ class Program:
         elif self.cursor_x > 38:
             self.cursor_x = 7
 
-        return self.cursor_y, self.cursor_x
-
     def get_cursor_pos_from_index(self, index):
-        # Convert from a spot in selectable_text so
+        # Convert from a spot in the memory dump so
         # we can more easily modify the displayed characters
-
-        self.index = index
-        self.x_col = 7
-        self.y_row = 6
-
-        self.x_col = self.x_col + (self.index % 12)
-        if self.index > 191:
-            self.x_col = self.x_col + 20
-            self.index = self.index - 192
-
-        self.y_row = self.y_row + (self.index // 12)
-
-        return [self.y_row, self.x_col]
+        return [self.memory.cell_y[index], self.memory.cell_x[index]]
 
     def get_index_from_cursor_pos(self, cur_y, cur_x):
         # Convert from a displayable cursor location
-        # to a spot suitable for iterating through selectable_text
+        # to a spot suitable for looking up in the memory dump
 
         self.selection_index = 0
         self.x_col = cur_x - 6
         self.y_row = cur_y - 6
-        self.selection_characters = []
-        self.end_of_word = 0
 
         if self.x_col > 18:
             self.selection_index = self.selection_index + 191 + (self.x_col - 20)
@@ -172,77 +159,29 @@ class Program:
         self.selection_index = self.selection_index + (12 * self.y_row)
 
     def get_indices_of_selection(self):
-        # Check for capital letters and open bracket characters
-        # Now, look right of a letter in the list until a non letter is found
-
-        self.highlightable_indices.clear()
-
-        if self.selectable_text[self.selection_index].isupper():
-            # At most, look right of a letter up to the current word length
-            for len_offset, _ in enumerate(range(self.word_length+1)):
-                # Any junk character marks the end of the word
-                if not self.selectable_text[self.selection_index + len_offset].isupper():
-                    self.end_of_word = self.selection_index + len_offset
-                    self.selection_characters = self.selectable_text[self.end_of_word-self.word_length:
-                                                                     self.end_of_word]
-                    for idx in range(self.end_of_word-self.word_length, self.end_of_word, 1):
-                        self.highlightable_indices.append(idx)
-                    break
-            return ''.join(self.selection_characters)
-        # Or, try and find a matching closing character
-        elif self.selectable_text[self.selection_index] in ['(', '{', '[', '<']:
-            # I could have iterated over a matching set of closing characters, but this is more readable to me
-            if self.selectable_text[self.selection_index] == '(':
-                self.closing_char = ')'
-            elif self.selectable_text[self.selection_index] == '{':
-                self.closing_char = '}'
-            elif self.selectable_text[self.selection_index] == '[':
-                self.closing_char = ']'
-            elif self.selectable_text[self.selection_index] == '<':
-                self.closing_char = '>'
-            # Columns are 12 chars wide, so search up to that many spaces away within selectable text
-            cursor_pos = self.get_cursor_pos_from_index(self.selection_index)
-            for len_offset, _ in enumerate(range(13)):
-                # Don't look past the end of the list
-                if self.selection_index + len_offset > 383:
-                    break
-                # Break out if we've hit a word
-                if self.selectable_text[self.selection_index + len_offset].isalpha():
-                   break
-                # Don't try to break up over a line
-                current_cursor_pos = self.get_cursor_pos_from_index(self.selection_index + len_offset)
-                if current_cursor_pos[0] != cursor_pos[0]:
-                   break
-                # Record the indices of the enclosing brackets
-                if  self.selectable_text[self.selection_index + len_offset] == self.closing_char:
-                    self.end_of_word = self.selection_index + len_offset + 1
-                    self.selection_characters = self.selectable_text[self.end_of_word-len_offset-1:
-                                                                     self.end_of_word]
-                    for idx in range(self.end_of_word-len_offset-1, self.end_of_word, 1):
-                        self.highlightable_indices.append(idx)
-                    return ''.join(self.selection_characters)
-            self.highlightable_indices.append(self.selection_index)
-            return self.selectable_text[self.selection_index]
-        else: # Neither a letter or set of brackets found
-            self.highlightable_indices.append(self.selection_index)
-            return self.selectable_text[self.selection_index]
+        # Whole words, and bracket pairs up to their closing bracket, are
+        # worked out by the memory dump ahead of time, so this is a lookup
+        start, end = self.memory.span_at(self.selection_index)
+        self.highlightable_indices = range(start, end)
+        return self.memory.text_at(self.selection_index)
 
     def remove_word(self, index):
-
-        self.word_start_locations.remove(index)
-        for idx in range(self.word_length):
-            self.selectable_text[index+idx] = '.'
+        self.memory.remove_word(index)
+        self.draw_chrome()
 
     def test_selection(self):
 
         self.likeness = 0
         self.entry_denied = False
 
+        kind = self.memory.kind_at(self.selection_index)
+
         # Characters in a submission must match at the same index within a password
-        if self.selectable_text[self.highlightable_indices[0]].isupper():
-            for char_loc, idx in enumerate(self.highlightable_indices):
-                if self.selectable_text[idx] == self.password[char_loc]:
-                    self.likeness = self.likeness + 1
+        if kind == memorydump.WORD:
+            selection = self.memory.text_at(self.selection_index)
+            self.likeness = self.word_likeness.get(selection)
+            if self.likeness is None:
+                self.likeness = likeness.likeness(selection, self.password)
             # Only the password will have maximum likeness
             if self.likeness == self.word_length:
                 self.logged_in = True
@@ -251,13 +190,11 @@ class Program:
             else:
                 self.entry_denied = True
         # Apply bonus action if a matching set of brackets is found
-        elif self.selectable_text[self.highlightable_indices[0]] in ['(', '{', '[', '<'] and \
-            len(self.highlightable_indices) > 1 and \
-            self.highlightable_indices[0] not in self.bonus_indices:
+        elif kind == memorydump.BRACKETS:
             # Randomly remove a dud word or reset attempts
-            self.bonus_indices.append(self.highlightable_indices[0])
-            if random.randint(0, 100) > 20:
-                dud = random.choice(self.word_start_locations)
+            self.memory.use_bonus(self.selection_index)
+            if random.randint(0, 100) > 20 and self.memory.has_duds():
+                dud = random.choice(self.memory.dud_locations)
                 self.remove_word(dud)
                 self.provider.play_sound("clear")
                 return 'Dud Removed.'
@@ -266,7 +203,7 @@ class Program:
                 self.provider.play_sound("reset")
                 return 'Tries Reset.'
         # There's neither a penalty nor a bonus for clicking a valid bracket pair again
-        elif self.highlightable_indices[0] in self.bonus_indices:
+        elif kind == memorydump.USED_BRACKETS:
             return ''
         else: # Junk characters are automatically incorrect
             self.entry_denied = True
@@ -280,119 +217,197 @@ class Program:
                 self.locked_out = True
                 return 'TERMINAL LOCKED' # PLEASE CONTACT ADMINISTRATOR
 
-    def scroll_side_text(self, text_to_scroll):
-
-        for col in range (14):
-            self.side_text[0 + col] = ' '
-        for row in range(14):
-            # Copy the next row of characters onto the current row of characters
-            self.side_text[row * 15:(row * 15) + 15] = \
-                self.side_text[(row + 1) * 15: ((row + 1) * 15) + 15]
-            # Clear the copied row since next row doesn't necessarily overwrite all spots
-            self.side_text[(row + 1) * 15: ((row + 1) * 15) + 15] = '               '
-
-        self.side_text[210] = '>'
-        # Copy the player's entry separately as the last line
-        for offset, letter in enumerate(list(text_to_scroll)):
-            self.side_text[211 + offset] = letter
+    def scroll_side_text(self, text_to_scroll, colour=None):
+        # Adds a line below the others in the side panel, in colour if given,
+        # jumping back to the latest lines if the player had paged back
+        self.side_text.append((('>' + text_to_scroll)[:self.side_width], colour))
+        self.side_scroll = 0
+
+    def page_side_text(self, pages):
+        # Scrolls the side panel back (positive) or forward (negative)
+        # through the lines kept in the scrollback
+        most = max(0, len(self.side_text) - self.side_rows)
+        self.side_scroll = min(most, max(0, self.side_scroll + pages * self.side_rows))
+
+    def update(self):
+        # Applies the last key pressed to the game. Returns the next program
+        # to run once the player has logged in and pressed enter.
+
+        if not self.locked_out and not self.logged_in:
+
+            if self.key_pressed == consolekeys.PAGE_UP:
+                self.page_side_text(self.key_repeat)
+            elif self.key_pressed == consolekeys.PAGE_DOWN:
+                self.page_side_text(-self.key_repeat)
+
+            self.update_cursor()
+            self.get_index_from_cursor_pos(self.cursor_y, self.cursor_x)
+            self.word_to_print = self.get_indices_of_selection()
+
+            # Test Selection, pass, incorrect, bonus, or lockout
+            # Also, "scroll" the printed side output up after testing
+            if self.key_pressed == ord('e') or self.key_pressed == consolekeys.ENTER:
+                self.terminal_status = self.test_selection()
+                if self.terminal_status == 'Entry denied.':
+                    self.scroll_side_text(self.word_to_print)
+                    self.scroll_side_text(self.terminal_status, consolecolours.RED)
+                    self.scroll_side_text('Likeness='+str(self.likeness))
+                elif self.terminal_status == 'TERMINAL LOCKED' or \
+                        self.terminal_status == 'Password Accepted.':
+                    self.provider.set_input_blocking_mode(False)
+                elif self.terminal_status == 'Tries Reset.' or \
+                        self.terminal_status == 'Dud Removed.':
+                    self.scroll_side_text(self.word_to_print)
+                    self.scroll_side_text(self.terminal_status, consolecolours.AMBER)
+
+        elif self.logged_in:
+            # Allow "logging out" to reset the game
+            if self.key_pressed is consolekeys.ENTER:
+                return [self.next_program, self.next_args]
+
+        return None
+
+    def draw_chrome(self):
+        # The banner, addresses and memory dump only change with a new puzzle
+        # or a removed dud, so they're drawn to a layer that the provider
+        # puts on screen every frame, rather than redrawn on every key
+
+        chrome = self.provider.layer('hack')
+        chrome.clear()
+        chrome.print_str(0, 0, 'Welcome to ROBCO Industries (TM) Termlink')
+        chrome.print_str(0, 2, 'Password Required')
+        chrome.print_str(0, 4, self.remaining_string)
+
+        # Show the "memory" dump
+        # With the selectable text wrapping in columns
+        for row in range(self.rows):
+            chrome.print_str(0, row + 6, hex(self.address+(row * 12)).upper())
+            chrome.print_str(7, row + 6, self.memory.text_of_row(row))
+            chrome.print_str(20, row + 6, hex(self.address+row+16).upper())
+            chrome.print_str(27, row + 6, self.memory.text_of_row(row + self.rows))
+        # With the addresses in the background
+        chrome.set_rect_attributes(0, 6, 6, self.rows, fg=consolecolours.DARK_GREEN)
+        chrome.set_rect_attributes(20, 6, 6, self.rows, fg=consolecolours.DARK_GREEN)
+
+    def draw(self, provider):
+
+        provider.layer('hack').visible = not self.locked_out and not self.logged_in
+
+        if not self.locked_out and not self.logged_in:
+
+            x = len(self.remaining_string) + 1
+            # The last attempt left is a warning
+            if self.attempts == 1:
+                provider.set_span_attributes(0, 4, x + 1, fg=consolecolours.RED,
+                                             flags=consolecolours.BLINK)
+            # Update attempts remaining after testing
+            provider.invert_cells([(x + (2 * attempt), 4) for attempt in range(self.attempts)])
+
+            # Highlight the appropriate characters, a word brighter and a
+            # bracket pair with a bonus to give in amber
+            kind = self.memory.kind_at(self.selection_index)
+            highlight = {memorydump.WORD: consolecolours.BRIGHT_GREEN,
+                         memorydump.BRACKETS: consolecolours.AMBER}.get(kind)
+            for span_x, span_y, length in self.memory.screen_spans(self.highlightable_indices.start,
+                                                                  self.highlightable_indices.stop):
+                provider.set_span_attributes(span_x, span_y, length, fg=highlight,
+                                             flags=consolecolours.INVERT)
+
+            # Show hidden location/password data for debugging
+            # stdscr.addstr(1, 20, str(self.memory.dud_locations))
+            # stdscr.addstr(1, 40, 'likeness=' + str(self.likeness))
+            # stdscr.addstr(2, 40, self.password)
+            # stdscr.addstr(3, 40, str(self.selection_index))
+            # stdscr.addstr(4, 40, str(self.get_cursor_pos_from_index(self.selection_index)))
+            # stdscr.addstr(5, 40, self.terminal_status)
+            # stdscr.addstr(5, 40, str(self.highlightable_indices))
+            # stdscr.addstr(5, 40, str(self.memory.used_brackets))
+
+            # Draw the side text of scrolling entries
+            # Lines fill the panel from the bottom up, and only those
+            # in view are read from the scrollback
+            end = len(self.side_text) - self.side_scroll
+            lines = self.side_text.window(end - self.side_rows, end)
+            first_row = 6 + self.side_rows - len(lines)
+            for row, (line, colour) in enumerate(lines):
+                provider.print_str(40, first_row + row, line)
+                if colour is not None:
+                    provider.set_span_attributes(40, first_row + row, len(line), fg=colour)
+
+            provider.print_str(40, 21, '>' + self.word_to_print)
+            self.prompt_cursor.move(40 + len(self.word_to_print) + 1, 21)
+
+        elif self.locked_out:
+            self.prompt_cursor.hide()
+            # Only allow system reboot
+            provider.print_str(22, 9, self.terminal_status)
+            provider.set_span_attributes(22, 9, len(self.terminal_status), fg=consolecolours.RED,
+                                         flags=consolecolours.BLINK)
+            provider.print_str(16, 11, 'PLEASE CONTACT ADMINISTRATOR')
+
+        elif self.logged_in:
+            provider.print_str(0, 0, 'Welcome to ROBCO Industries (TM) Termlink')
+            provider.print_str(0, 21, self.terminal_status)
+            provider.set_span_attributes(0, 21, len(self.terminal_status),
+                                         fg=consolecolours.BRIGHT_GREEN)
+            self.prompt_cursor.move(len(self.terminal_status), 21)
+
+    def close(self, provider):
+        # Takes the prompt cursor and the chrome layer off screen, so the
+        # next program starts with a blank one
+        provider.teletype.remove(self.prompt_cursor)
+        provider.remove_layer('hack')
+
+    def apply_keys(self, keys):
+        # Applies (key, repeat) pairs, as read_keys returns them, in order,
+        # so that one frame shows them all. Returns (True, result) once the
+        # player quits or logs in and moves on, (False, None) otherwise.
+        for key, repeat in keys:
+            self.key_pressed = key
+            self.key_repeat = repeat
+            if key == ord('q') or key == consolekeys.ESCAPE:
+                return True, None
+            result = self.update()
+            if result is not None:
+                return True, result
+        return False, None
 
     def run(self, provider):
 
-        while self.key_pressed is not ord('q') and self.key_pressed is not consolekeys.ESCAPE:
+        keys = [(self.key_pressed, 1)]
+        while True:
 
             provider.clear()
 
-            if not self.locked_out and not self.logged_in:
-
-                self.update_cursor()
-                self.get_index_from_cursor_pos(self.cursor_y, self.cursor_x)
-                self.word_to_print = self.get_indices_of_selection()
-
-                # Test Selection, pass, incorrect, bonus, or lockout
-                # Also, "scroll" the printed side output up after testing
-                if self.key_pressed == ord('e') or self.key_pressed == consolekeys.ENTER:
-                    self.terminal_status = self.test_selection()
-                    if self.terminal_status == 'Entry denied.':
-                        self.scroll_side_text(self.word_to_print)
-                        self.scroll_side_text(self.terminal_status)
-                        self.scroll_side_text('Likeness='+str(self.likeness))
-                    elif self.terminal_status == 'TERMINAL LOCKED' or \
-                            self.terminal_status == 'Password Accepted.':
-                        provider.set_input_blocking_mode(False)
-                    elif self.terminal_status == 'Tries Reset.' or \
-                            self.terminal_status == 'Dud Removed.':
-                        self.scroll_side_text(self.word_to_print)
-                        self.scroll_side_text(self.terminal_status)
-
-                provider.print_str(0, 0, 'Welcome to ROBCO Industries (TM) Termlink')
-                provider.print_str(0, 2, 'Password Required')
-
-                remaining_string = 'Attempts Remaining:'
-                provider.print_str(0, 4, remaining_string)
-
-                x = len(remaining_string) + 1
-                # Update attempts remaining after testing
-                for _ in range(self.attempts):
-                    provider.invert_at(x, 4)
-                    x += 2
-
-                # Show the "memory" dump
-                # With the selectable text wrapping in columns
-                for row in range(self.rows):
-                    provider.print_str(0, row + 6, hex(self.address+(row * 12)).upper())
-                    provider.print_str(7, row + 6, ''.join(self.selectable_text[12 * row:(12 * row) + 12]))
-                    provider.print_str(20, row + 6, hex(self.address+row+16).upper())
-                    provider.print_str(27, row + 6, ''.join(self.selectable_text[(12 * row) + 192:(12 * row) + 204]))
-
-                # Highlight the appropriate characters
-                for i, _ in enumerate(self.highlightable_indices):
-                    self.y_row, self.x_col = self.get_cursor_pos_from_index(self.highlightable_indices[i])
-                    provider.invert_at(self.x_col, self.y_row)
-
-                    # TODO: Allow changing of colour in the provider
-                    #stdscr.chgat(self.y_row, self.x_col, 1, curses.color_pair(2))
-
-                # Show hidden location/password data for debugging
-                # stdscr.addstr(1, 20, str(self.word_start_locations))
-                # stdscr.addstr(1, 40, 'likeness=' + str(self.likeness))
-                # stdscr.addstr(2, 40, self.password)
-                # stdscr.addstr(3, 40, str(self.selection_index))
-                # stdscr.addstr(4, 40, str(self.get_cursor_pos_from_index(self.selection_index)))
-                # stdscr.addstr(5, 40, self.terminal_status)
-                # stdscr.addstr(5, 40, str(self.highlightable_indices))
-                # stdscr.addstr(5, 40, str(self.bonus_indices))
-
-                # Draw the side text of scrolling entries
-                for row in range(15):
-                    provider.print_str(40, row + 6, ''.join(self.side_text[15 * row:(15 * row) + 15]))
-
-                provider.print_str(40, 21, '>' + self.word_to_print)
-                # Adding the blink attribute cleared the color attribute, so we need to add it again
-                # Multiple attributes for curses require a bitwise OR (go figure)
-                provider.invert_at(40 + len(self.word_to_print) + 1, 21) #, '█', curses.A_BLINK | curses.color_pair(1))
-
-
-            elif self.locked_out:
-                # Only allow system reboot
-                provider.print_str(22, 9, self.terminal_status)
-                provider.print_str(16, 11, 'PLEASE CONTACT ADMINISTRATOR')
-
-            elif self.logged_in:
-                # Allow "logging out" to reset the game
-                provider.print_str(0, 0, 'Welcome to ROBCO Industries (TM) Termlink')
-                provider.print_str(0, 21, self.terminal_status)
-                provider.invert_at(len(self.terminal_status), 21) #, '█', curses.A_BLINK | curses.color_pair(1))
-
-                if self.key_pressed is consolekeys.ENTER:
-                    return [self.next_program, self.next_args]
-
-            # Refresh the screen
+            done, result = self.apply_keys(keys)
+            if done:
+                self.close(provider)
+                return result
+
+            self.draw(provider)
+
+            # Refresh the screen, with the blinking cursor drawn over it
+            provider.teletype.draw(provider)
             provider.refresh()
 
-            # getch() is blocking, so the program waits for input
-            self.key_pressed = provider.getch()
+            # read_keys() is blocking, so the program waits for input. Keys
+            # that arrive while a frame is drawn, e.g. from a held arrow key,
+            # are all applied before the next one rather than a frame apiece.
+            keys = provider.read_keys()
             # Lock out or log in will set nodelay() to True, making getch non-blocking
             # but we want to immediately revert it to wait for input and not constantly draw the terminal
             provider.set_input_blocking_mode(True)
 
-        return None
\ No newline at end of file
+    async def run_async(self, runtime):
+
+        keys = [(self.key_pressed, 1)]
+        while True:
+
+            done, result = self.apply_keys(keys)
+            if done:
+                self.close(runtime.provider)
+                return result
+
+            # The runtime redraws once it's ready for the next frame
+            runtime.invalidate()
+            keys = await runtime.next_keys()
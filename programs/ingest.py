@@ -0,0 +1,147 @@
+# Builds a dictionary for the hack game from any amount of text
+#
+# Source files are split into byte ranges that worker processes read and
+# tokenize on their own, so a corpus is never loaded whole and the work is
+# spread over every core. Each worker normalizes its words (uppercased, and
+# optionally with accents folded away), drops any that aren't plain letters or
+# are the wrong length, and counts the rest. The counts are merged, filtered
+# by frequency, and written out as a word list together with its compiled
+# index (see wordindex.py), stamped so that the game maps the index directly
+# instead of recompiling it:
+#
+#   python -m programs.ingest corpus/*.txt -o programs/themed-words.txt --min-count 3
+#   python robco_os.py hack --words programs/themed-words.txt
+#
+# With --one-per-line each line is taken as a single word, as in an existing
+# word list, and lines that aren't a single word are dropped.
+import argparse
+import collections
+import multiprocessing
+import os
+import re
+import time
+import unicodedata
+from programs import wordindex
+
+CHUNK_SIZE = 8 * 1024 * 1024
+MIN_LENGTH = 4
+MAX_LENGTH = 12
+
+# Runs of letters, with apostrophes and hyphens kept in so that words like
+# "don't" are dropped rather than split into "don" and "t"
+TOKEN = re.compile(rb"[A-Za-z\x80-\xff]+(?:['\-][A-Za-z\x80-\xff]+)*")
+LETTERS = re.compile(rb'[A-Z]+')
+
+def split_file(path, chunk_size=CHUNK_SIZE):
+    # Byte ranges covering the file. Workers move the edges to the nearest
+    # separator, so no word is cut in two.
+    size = os.path.getsize(path)
+    return [(path, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+def is_separator(byte, one_per_line):
+    if one_per_line:
+        return byte == 0x0a
+    return not (0x41 <= byte <= 0x5a or 0x61 <= byte <= 0x7a or byte >= 0x80 or
+                byte in (0x27, 0x2d))
+
+def read_chunk(path, start, end, one_per_line):
+    # Reads start:end, skipping the word cut off at the start (the previous
+    # chunk finishes it) and reading on to finish the word cut off at the end
+    with open(path, 'rb') as file:
+        if start > 0:
+            file.seek(start - 1)
+            data = file.read(end - start + 1)
+            skip = 0
+            while skip < len(data) and not is_separator(data[skip], one_per_line):
+                skip += 1
+            data = data[skip:]
+        else:
+            data = file.read(end - start)
+        tail = bytearray()
+        while len(data) > 0 and not is_separator(data[-1], one_per_line):
+            more = file.read(256)
+            if len(more) == 0:
+                break
+            cut = next((position for position, byte in enumerate(more)
+                        if is_separator(byte, one_per_line)), None)
+            if cut is not None:
+                tail += more[:cut]
+                break
+            tail += more
+        return data + bytes(tail)
+
+def fold_accents(data):
+    # e.g. "café" to "cafe", for corpora that aren't plain ASCII
+    text = unicodedata.normalize('NFKD', data.decode('utf-8', 'ignore'))
+    return text.encode('ascii', 'ignore')
+
+def count_chunk(job):
+    path, start, end, options = job
+    data = read_chunk(path, start, end, options['one_per_line'])
+    if options['fold_accents']:
+        data = fold_accents(data)
+    data = data.upper()
+    if options['one_per_line']:
+        tokens = (line.strip() for line in data.split(b'\n'))
+    else:
+        tokens = TOKEN.findall(data)
+    counts = collections.Counter(tokens)
+
+    min_length = options['min_length']
+    max_length = options['max_length']
+    return collections.Counter({word.decode('ascii'): count for word, count in counts.items()
+                                if min_length <= len(word) <= max_length and
+                                LETTERS.fullmatch(word)})
+
+def ingest(sources, min_length=MIN_LENGTH, max_length=MAX_LENGTH, min_count=1, limit=None,
+           one_per_line=False, accents=False, processes=None, chunk_size=CHUNK_SIZE):
+    # Returns the words found in sources, most frequent first, with their counts
+    options = {'one_per_line': one_per_line, 'fold_accents': accents,
+               'min_length': min_length, 'max_length': max_length}
+    jobs = [(path, start, end, options) for source in sources
+            for path, start, end in split_file(source, chunk_size)]
+    counts = collections.Counter()
+    with multiprocessing.Pool(processes) as pool:
+        for chunk_counts in pool.imap_unordered(count_chunk, jobs):
+            counts.update(chunk_counts)
+    words = [(word, count) for word, count in counts.most_common(limit) if count >= min_count]
+    return words
+
+def write_dictionary(words, path):
+    # Writes the word list and its compiled index. The index records the
+    # list's mtime and size, so the game sees it as current and maps it as is.
+    words = sorted(words, key=lambda word: (len(word), word))
+    wordindex.replace_file(path, ''.join(word.lower() + '\n' for word in words).encode('ascii'))
+    stat = os.stat(path)
+    index_path = wordindex.index_path_for(path)
+    wordindex.replace_file(index_path, wordindex.compile_words(words, stat.st_mtime_ns, stat.st_size))
+    return index_path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build a hack dictionary from text files")
+    parser.add_argument('sources', nargs='+', help='text files to take words from')
+    parser.add_argument('-o', '--output', required=True,
+                        help='the word list to write, with its index written alongside')
+    parser.add_argument('--min-length', default=MIN_LENGTH, type=int)
+    parser.add_argument('--max-length', default=MAX_LENGTH, type=int)
+    parser.add_argument('--min-count', default=1, type=int,
+                        help='leave out words found fewer times than this')
+    parser.add_argument('--limit', default=None, type=int, help='keep only the most frequent words')
+    parser.add_argument('--one-per-line', action='store_true',
+                        help='sources are word lists, with one word on each line')
+    parser.add_argument('--fold-accents', action='store_true',
+                        help='keep accented words with the accents removed')
+    parser.add_argument('-j', '--processes', default=None, type=int,
+                        help='worker processes, defaults to the number of cores')
+    ingestargs = parser.parse_args()
+
+    started = time.perf_counter()
+    words = ingest(ingestargs.sources, ingestargs.min_length, ingestargs.max_length,
+                   ingestargs.min_count, ingestargs.limit, ingestargs.one_per_line,
+                   ingestargs.fold_accents, ingestargs.processes)
+    index_path = write_dictionary([word for word, _ in words], ingestargs.output)
+    lengths = collections.Counter(len(word) for word, _ in words)
+    print('%d words in %.2f s, written to %s and %s' %
+          (len(words), time.perf_counter() - started, ingestargs.output, index_path))
+    print('by length: ' + ', '.join('%d: %d' % item for item in sorted(lengths.items())))
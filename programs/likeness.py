@@ -0,0 +1,88 @@
+# Vectorized "likeness" (same letter in the same position) between words
+#
+# Words of one length are held as a 2-D uint8 array with one row per word,
+# so comparing a word against a whole dictionary, or every word of a puzzle
+# against every other, is a single NumPy comparison and sum.
+import numpy as np
+
+_word_sets = {}
+
+def words_to_array(words, length=None):
+    if length is None:
+        length = len(words[0]) if len(words) > 0 else 0
+    joined = ''.join(words).encode('ascii', 'replace')
+    return np.frombuffer(joined, dtype=np.uint8).reshape(len(words), length)
+
+def word_to_array(word):
+    return np.frombuffer(word.encode('ascii', 'replace'), dtype=np.uint8)
+
+def likeness_to_many(word, array):
+    # Likeness of one word (str or uint8 row) against every row of array
+    if isinstance(word, str):
+        word = word_to_array(word)
+    return np.count_nonzero(array == word, axis=1)
+
+def likeness_matrix(array):
+    # Full pairwise likeness of every row against every other row
+    return np.count_nonzero(array[:, None, :] == array[None, :, :], axis=2)
+
+def likeness_matrices(arrays):
+    # Pairwise likeness for a stack of puzzles at once: arrays is shaped
+    # (puzzles, words, length) and the result (puzzles, words, words)
+    return np.count_nonzero(arrays[:, :, None, :] == arrays[:, None, :, :], axis=3)
+
+def likeness(word_a, word_b):
+    return int(np.count_nonzero(word_to_array(word_a) == word_to_array(word_b)))
+
+class WordSet:
+    # Same-length words as a uint8 array, with the strings decoded on demand
+
+    def __init__(self, array, words=None, index=None):
+        self.array = array
+        self.index = index
+        self.length = array.shape[1]
+        self._words = words
+
+    @classmethod
+    def from_words(cls, words):
+        words = list(words)
+        return cls(words_to_array(words), words)
+
+    @classmethod
+    def from_index(cls, index, length):
+        # Zero-copy view onto the bucket of a compiled word index
+        raw = index.raw_of_length(length)
+        return cls(np.frombuffer(raw, dtype=np.uint8).reshape(-1, length), index=index)
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    @property
+    def words(self):
+        if self._words is None:
+            raw = self.array.tobytes()
+            self._words = [raw[start:start + self.length].decode('ascii')
+                           for start in range(0, len(raw), self.length)]
+        return self._words
+
+    def likeness_to(self, word):
+        return likeness_to_many(word, self.array)
+
+    def likeness_matrix(self):
+        return likeness_matrix(self.array)
+
+    def subset(self, positions):
+        words = None
+        if self._words is not None:
+            words = [self._words[position] for position in positions]
+        return WordSet(self.array[positions], words)
+
+def get_word_set(index, length):
+    # Word sets are cached per index and length, so every game in the
+    # process shares the arrays and the decoded strings
+    key = (id(index), length)
+    word_set = _word_sets.get(key)
+    if word_set is None or word_set.index is not index:
+        word_set = WordSet.from_index(index, length)
+        _word_sets[key] = word_set
+    return word_set
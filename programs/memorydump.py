@@ -0,0 +1,140 @@
+# The "memory" dump of the hack game: junk characters with the words placed
+# among them, shown as two columns of 16 rows of 12 characters.
+#
+# The characters are held in a bytearray, and what the cursor would select
+# on every cell (the whole word, a bracket pair up to its closing bracket, or
+# just the cell) is worked out when the dump is created and kept in arrays,
+# so moving the cursor is a lookup. Removing a dud only re-indexes the rows
+# it was on.
+from array import array
+
+COLUMN_WIDTH = 12
+COLUMN_ROWS = 16
+LEFT_COLUMN_X = 7
+RIGHT_COLUMN_X = 27
+FIRST_ROW_Y = 6
+
+OPENING_BRACKETS = {ord('('): ord(')'), ord('{'): ord('}'),
+                    ord('['): ord(']'), ord('<'): ord('>')}
+REMOVED_CHAR = ord('.')
+
+# What selecting a cell does
+JUNK = 0
+WORD = 1
+BRACKETS = 2
+USED_BRACKETS = 3
+
+def is_upper(code):
+    return 65 <= code <= 90
+
+def is_alpha(code):
+    return 65 <= code <= 90 or 97 <= code <= 122
+
+class MemoryDump:
+
+    def __init__(self, text, word_length, dud_locations):
+        self.cells = bytearray(text.encode('ascii'))
+        self.size = len(self.cells)
+        self.word_length = word_length
+        # Start of every word that can be removed as a dud, i.e. all but the
+        # password, with each one's place in the list for swap-and-pop removal
+        self.dud_locations = list(dud_locations)
+        self.dud_positions = {start: position for position, start in enumerate(self.dud_locations)}
+        # The cells selected from every cell are start:end
+        self.span_start = array('h', range(self.size))
+        self.span_end = array('h', range(1, self.size + 1))
+        self.kind = bytearray(self.size)
+        # Opening brackets whose bonus has been used
+        self.used_brackets = set()
+        # Where every cell is drawn on screen
+        self.cell_x = array('h', [self.column_x(index) + index % COLUMN_WIDTH
+                                  for index in range(self.size)])
+        self.cell_y = array('h', [FIRST_ROW_Y + (index % (COLUMN_WIDTH * COLUMN_ROWS)) // COLUMN_WIDTH
+                                  for index in range(self.size)])
+        self.index_rows(0, self.size)
+
+    @staticmethod
+    def column_x(index):
+        return LEFT_COLUMN_X if index < COLUMN_WIDTH * COLUMN_ROWS else RIGHT_COLUMN_X
+
+    def index_rows(self, start, end):
+        # Works out the selections of every cell on the rows covering start:end
+        start -= start % COLUMN_WIDTH
+        end = min(self.size, end + (-end % COLUMN_WIDTH))
+        cells = self.cells
+        index = start
+        while index < end:
+            code = cells[index]
+            if is_upper(code):
+                # A run of capitals is a word, which is selected as a whole
+                # from any of its letters
+                run_end = index
+                while run_end < self.size and is_upper(cells[run_end]):
+                    run_end += 1
+                word_start = max(0, run_end - self.word_length)
+                for cell in range(index, run_end):
+                    self.span_start[cell] = word_start
+                    self.span_end[cell] = run_end
+                    self.kind[cell] = WORD
+                index = run_end
+                continue
+
+            self.span_start[index] = index
+            self.span_end[index] = index + 1
+            self.kind[index] = JUNK
+            closing = OPENING_BRACKETS.get(code)
+            if closing is not None:
+                # An opening bracket pairs with the first matching closing
+                # bracket after it on the same row, unless a word is in between
+                row_end = index - index % COLUMN_WIDTH + COLUMN_WIDTH
+                for cell in range(index + 1, min(row_end, self.size)):
+                    if is_alpha(cells[cell]):
+                        break
+                    if cells[cell] == closing:
+                        self.span_end[index] = cell + 1
+                        self.kind[index] = USED_BRACKETS if index in self.used_brackets else BRACKETS
+                        break
+            index += 1
+
+    def text_of_row(self, row):
+        # The characters on one of the 32 rows, left column first
+        return self.cells[row * COLUMN_WIDTH:(row + 1) * COLUMN_WIDTH].decode('ascii')
+
+    def span_at(self, index):
+        return self.span_start[index], self.span_end[index]
+
+    def kind_at(self, index):
+        return self.kind[index]
+
+    def text_at(self, index):
+        # The characters selected from index
+        return self.cells[self.span_start[index]:self.span_end[index]].decode('ascii')
+
+    def screen_spans(self, start, end):
+        # The cells start:end as runs along screen rows, (x, y, length)
+        spans = []
+        while start < end:
+            stop = min(end, start - start % COLUMN_WIDTH + COLUMN_WIDTH)
+            spans.append((self.cell_x[start], self.cell_y[start], stop - start))
+            start = stop
+        return spans
+
+    def remove_word(self, start):
+        # Replaces a dud with dots and re-indexes the rows it was on, since
+        # brackets that it blocked may now pair up
+        position = self.dud_positions.pop(start)
+        last = self.dud_locations.pop()
+        if last != start:
+            self.dud_locations[position] = last
+            self.dud_positions[last] = position
+        end = start + self.word_length
+        self.cells[start:end] = bytes([REMOVED_CHAR]) * self.word_length
+        self.index_rows(start, end)
+
+    def use_bonus(self, index):
+        # Marks a bracket pair as used, so it can't give a bonus again
+        self.used_brackets.add(index)
+        self.kind[index] = USED_BRACKETS
+
+    def has_duds(self):
+        return len(self.dud_locations) > 0
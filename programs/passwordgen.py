@@ -2,50 +2,36 @@
 # for "password" options in the RobCo terminal game
 import random
 import os
+from programs import wordindex
+from programs import likeness
+from programs import sampler
+
+WORDS_PATH = os.path.join('programs', 'trimmed-words.txt')
 
 def read_words_of_length(filepath, length):
-    words = []
-    with open(filepath, 'r') as file:
-        for word in file:
-            word = word.rstrip('\n')
-            if len(word) == length:
-                words.append(word.upper())
-    return words
+    # Words come from the compiled index, which is shared by the whole process
+    # and rebuilt automatically whenever the word list changes
+    return wordindex.get_word_index(filepath).words_of_length(length)
 
 def count_similarities(word_a, word_b):
-    count = 0
-    for n in range(0, len(word_a)):
-        if word_a[n] == word_b[n]:
-            count += 1
-    return count
-
-def get_single_word_similarity(available_similarities, difficulty):
-    # TODO: Implement some sort of probabilistic method of picking similarities
-    # based on the difficulty level
-    return random.choice(available_similarities)
+    return likeness.likeness(word_a, word_b)
 
-def get_available_similarities(similarities_table):
-    key_list = list(similarities_table.keys())[0:-1]
-    return list(filter(lambda x: len(similarities_table[x]) > 0, key_list))
-
-def get_list_of_words(num_words, length_of_words, difficulty=1):
+def get_list_of_words(num_words, length_of_words, difficulty=1, words_path=WORDS_PATH):
     # For the game it's best that words have a length between 4 and 12,
     # but I'm leaving the option for any choice.
     # Words of length 15 or more are impractical though
 
-    words = read_words_of_length(os.path.join('programs', 'trimmed-words.txt'), length_of_words)
-    password = random.choice(words)
-
-    # Prepare a table of
-    similarities_table = {}
-    for i in range(0, length_of_words):
-        similarities_table[i] = []
+    word_set = likeness.get_word_set(wordindex.get_word_index(words_path), length_of_words)
+    words = word_set.words
+    password_position = random.randrange(len(words))
+    password = words[password_position]
 
-    for word in words:
-        if word == password:
-            continue
-        similarity_count = count_similarities(word, password)
-        similarities_table[similarity_count].append(word)
+    # Compare the password against every word of the same length in one go,
+    # then bucket the words by how many letters they share with it
+    similarity_counts = word_set.likeness_to(word_set.array[password_position])
+    similarities_table = sampler.SimilaritiesTable.from_counts(similarity_counts,
+                                                               length_of_words,
+                                                               difficulty)
 
     random_list = []
     random_list.append(password)
@@ -53,11 +39,9 @@ def get_list_of_words(num_words, length_of_words, difficulty=1):
     # We're going to take a random sampling of words from a random sampling
     # of similarities, rather than a random word from a contiguous block of words
     for i in range(1, num_words):
-        available_similarities = get_available_similarities(similarities_table)
-        similarity_desired = get_single_word_similarity(available_similarities, difficulty)
-        word = random.choice(similarities_table[similarity_desired])
-        random_list.append(word)
-        similarities_table[similarity_desired].remove(word)
+        if similarities_table.is_empty():
+            break
+        random_list.append(words[similarities_table.sample()])
 
     return password, random_list
 
@@ -0,0 +1,178 @@
+# Generates hack puzzles ahead of time
+#
+# A puzzle ("dataset") is everything make_new_dataset used to build on the
+# input thread: the memory address, the junk-filled memory dump with the words
+# placed in it, the password and the word start locations. The pool keeps a
+# few ready-made puzzles for every (word length, word count, difficulty) that
+# has been asked for and tops them up from a background thread.
+#
+# Run as a module to write puzzles in bulk:
+#   python -m programs.puzzlepool puzzles.jsonl -c 10000 -w 7
+import argparse
+import collections
+import json
+import multiprocessing
+import random
+import string
+import threading
+from programs import passwordgen
+from programs import likeness
+
+DEFAULT_DEPTH = 2
+SELECTABLE_SIZE = 384 # 16 rows of 12 char columns
+JUNK_CHARS = list(string.punctuation)
+
+def generate_dataset(word_length, num_words, difficulty, selectable_size=SELECTABLE_SIZE,
+                     words_path=passwordgen.WORDS_PATH):
+    # Choose a new "memory" address to look at
+    address = random.randint(4096, 65500)
+
+    # Generate a new "memory" dump populated with junk
+    selectable_text = random.choices(JUNK_CHARS, k=selectable_size)
+
+    # Generate a list of words with one password
+    password, word_list = passwordgen.get_list_of_words(num_words, word_length, difficulty,
+                                                        words_path)
+    random.shuffle(word_list)
+
+    # Keep track of where the password is for later bonus testing
+    # It needs to be randomly placed, but we can't accidentally delete it
+    # if a "dud replaced" bonus event occurs
+    password_location = word_list.index(password)
+    word_start_locations = []
+
+    # Randomly insert the words and password among the junk chars,
+    # but distribute somewhat evenly to prevent overlap
+    max_spacing = (selectable_size - (word_length * len(word_list))) // len(word_list)
+    offset = random.randint(1, max_spacing)
+
+    for word_idx, word in enumerate(word_list):
+        # Overwrite the junk chars with the words we want
+        selectable_text[offset:offset + word_length] = list(word)
+        # Mark the start of all non-passwords
+        if word_idx != password_location:
+            word_start_locations.append(offset)
+        offset = offset + word_length + random.randint(max_spacing - 2, max_spacing)
+        # Keep from placing words too near the end
+        if offset > selectable_size:
+            offset = selectable_size - word_length
+
+    # Likeness of every puzzle word to the password, so guesses
+    # can be scored with a lookup rather than comparing letters
+    word_likeness = likeness.WordSet.from_words(word_list).likeness_to(password).tolist()
+
+    return {
+        'word_length': word_length,
+        'num_words': num_words,
+        'difficulty': difficulty,
+        'address': address,
+        'selectable_text': ''.join(selectable_text),
+        'password': password,
+        'word_list': word_list,
+        'word_likeness': word_likeness,
+        'password_location': password_location,
+        'word_start_locations': word_start_locations,
+    }
+
+class PuzzlePool:
+
+    def __init__(self, depth=DEFAULT_DEPTH):
+        self.depth = depth
+        self.ready = {}
+        self.condition = threading.Condition()
+        self.worker = None
+
+    def get(self, word_length, num_words, difficulty, words_path=passwordgen.WORDS_PATH):
+        # Pops a ready-made puzzle, or generates one on the spot if the pool
+        # hasn't caught up yet. Either way the pool is topped up afterwards.
+        key = (word_length, num_words, difficulty, words_path)
+        with self.condition:
+            queue = self.ready.setdefault(key, collections.deque())
+            dataset = queue.popleft() if len(queue) > 0 else None
+            self.start_worker()
+            self.condition.notify()
+        if dataset is None:
+            dataset = _generate_for_key(key)
+        return dataset
+
+    def prefill(self, word_length, num_words, difficulty, words_path=passwordgen.WORDS_PATH):
+        # Asks the worker to start generating puzzles for a combination
+        # before anything needs one
+        with self.condition:
+            self.ready.setdefault((word_length, num_words, difficulty, words_path),
+                                  collections.deque())
+            self.start_worker()
+            self.condition.notify()
+
+    def start_worker(self):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.refill, name='puzzle-pool', daemon=True)
+            self.worker.start()
+
+    def next_wanted(self):
+        for key, queue in self.ready.items():
+            if len(queue) < self.depth:
+                return key
+        return None
+
+    def refill(self):
+        while True:
+            with self.condition:
+                key = self.next_wanted()
+                while key is None:
+                    self.condition.wait()
+                    key = self.next_wanted()
+            try:
+                dataset = _generate_for_key(key)
+            except Exception:
+                # Combinations that can't be generated (e.g. too few words of
+                # a length) are left for get() to report on the caller's thread
+                with self.condition:
+                    self.ready.pop(key, None)
+                continue
+            with self.condition:
+                self.ready.setdefault(key, collections.deque()).append(dataset)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(depth=None):
+    # Returns the process-wide pool shared by every hack.Program
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PuzzlePool(DEFAULT_DEPTH if depth is None else depth)
+        elif depth is not None:
+            _pool.depth = depth
+        return _pool
+
+def _generate_for_key(key):
+    word_length, num_words, difficulty, words_path = key
+    return generate_dataset(word_length, num_words, difficulty, words_path=words_path)
+
+def write_puzzles(path, count, word_length, num_words, difficulty, processes=None,
+                  words_path=passwordgen.WORDS_PATH):
+    # Writes count puzzles to path as JSON lines, spread across a process pool
+    keys = [(word_length, num_words, difficulty, words_path)] * count
+    chunksize = max(1, count // ((processes or multiprocessing.cpu_count()) * 4))
+    with multiprocessing.Pool(processes) as pool, open(path, 'w') as file:
+        for dataset in pool.imap_unordered(_generate_for_key, keys, chunksize):
+            file.write(json.dumps(dataset))
+            file.write('\n')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pregenerate hack puzzles to a JSONL file")
+    parser.add_argument('output', help='the JSONL file to write')
+    parser.add_argument('-c', '--count', default=1000, type=int)
+    parser.add_argument('-w', '--word-length', default=5, type=int)
+    parser.add_argument('-n', '--number-of-words', default=12, type=int)
+    parser.add_argument('-d', '--difficulty', default=1, type=int, choices=[0, 1, 2])
+    parser.add_argument('-j', '--processes', default=None, type=int,
+                        help='worker processes, defaults to the number of cores')
+    parser.add_argument('--words', default=passwordgen.WORDS_PATH,
+                        help='the word list to take words from, see programs.ingest')
+    bulkargs = parser.parse_args()
+    write_puzzles(bulkargs.output, bulkargs.count, bulkargs.word_length,
+                  bulkargs.number_of_words, bulkargs.difficulty, bulkargs.processes,
+                  bulkargs.words)
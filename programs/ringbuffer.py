@@ -0,0 +1,46 @@
+# A fixed-capacity ring buffer
+#
+# Appending overwrites the oldest item once the buffer is full, so memory use
+# is bounded and an append costs the same however much has been added.
+# Items are indexed oldest first, and any item or window of items can be read
+# without walking the rest of the buffer.
+
+class RingBuffer:
+
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError('A ring buffer needs room for at least one item')
+        self.capacity = capacity
+        self.items = [None] * capacity
+        # Position of the oldest item in items
+        self.start = 0
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def append(self, item):
+        if self.count < self.capacity:
+            self.items[(self.start + self.count) % self.capacity] = item
+            self.count += 1
+        else:
+            self.items[self.start] = item
+            self.start = (self.start + 1) % self.capacity
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError('ring buffer index out of range')
+        return self.items[(self.start + index) % self.capacity]
+
+    def window(self, start, stop):
+        # Items start:stop, clamped to what's in the buffer
+        start = max(0, start)
+        stop = min(self.count, stop)
+        return [self.items[(self.start + index) % self.capacity] for index in range(start, stop)]
+
+    def clear(self):
+        self.items = [None] * self.capacity
+        self.start = 0
+        self.count = 0
@@ -0,0 +1,92 @@
+# Picks distractor words for a password, weighted by difficulty
+#
+# Candidate words are bucketed by their likeness to the password. Each bucket
+# is an unordered list of word positions, so taking a random word out of it
+# is a swap with the last element and a pop. The likeness values that still
+# have words are tracked the same way, along with their difficulty weights,
+# so a pick never has to rescan the table.
+import random
+import numpy as np
+
+EASY = 0
+NORMAL = 1
+HARD = 2
+
+# Each difficulty weights every candidate word by bias ** likeness, so a
+# bucket is picked in proportion to the words it has left times that weight.
+# Most words share few letters with the password, so the biases are set well
+# apart for the difficulties to show in programs.solver. Easy puzzles favour
+# distractors that share many letters with the password, so every guess gives
+# away a lot; hard puzzles favour ones that share few.
+DIFFICULTY_BIAS = {
+    EASY: 6.0,
+    NORMAL: 1.5,
+    HARD: 0.25,
+}
+
+def difficulty_curve(difficulty, length):
+    # Returns the weight of a word with each likeness value 0..length-1 for a
+    # difficulty. Difficulties outside the table are clamped to the nearest level.
+    difficulty = min(max(difficulty, min(DIFFICULTY_BIAS)), max(DIFFICULTY_BIAS))
+    bias = DIFFICULTY_BIAS[difficulty]
+    return [bias ** similarity for similarity in range(length)]
+
+class SimilaritiesTable:
+
+    def __init__(self, buckets, difficulty=NORMAL):
+        # buckets maps a likeness value to a list of word positions
+        self.buckets = buckets
+        self.curve = difficulty_curve(difficulty, len(buckets))
+        self.available = []
+        self.weights = []
+        self.available_slot = {}
+        for similarity, bucket in enumerate(buckets):
+            if len(bucket) > 0:
+                self.add_available(similarity)
+
+    @classmethod
+    def from_counts(cls, similarity_counts, length, difficulty=NORMAL):
+        # Buckets word positions by likeness with a single sort. Words with a
+        # likeness of length-1 or more are left out: the password itself, and
+        # near-copies that would make the puzzle trivial.
+        order = np.argsort(similarity_counts, kind='stable')
+        bounds = np.searchsorted(similarity_counts[order], np.arange(length))
+        buckets = [order[bounds[similarity]:bounds[similarity + 1]].tolist()
+                   for similarity in range(length - 1)]
+        buckets.append([])
+        return cls(buckets, difficulty)
+
+    def add_available(self, similarity):
+        self.available_slot[similarity] = len(self.available)
+        self.available.append(similarity)
+        self.weights.append(self.curve[similarity] * len(self.buckets[similarity]))
+
+    def remove_available(self, similarity):
+        slot = self.available_slot.pop(similarity)
+        last = self.available.pop()
+        last_weight = self.weights.pop()
+        if last != similarity:
+            self.available[slot] = last
+            self.weights[slot] = last_weight
+            self.available_slot[last] = slot
+
+    def is_empty(self):
+        return len(self.available) == 0
+
+    def pick_similarity(self):
+        return random.choices(self.available, weights=self.weights)[0]
+
+    def pop(self, similarity):
+        # Removes and returns a random word position from one bucket
+        bucket = self.buckets[similarity]
+        slot = random.randrange(len(bucket))
+        bucket[slot], bucket[-1] = bucket[-1], bucket[slot]
+        position = bucket.pop()
+        if len(bucket) == 0:
+            self.remove_available(similarity)
+        else:
+            self.weights[self.available_slot[similarity]] = self.curve[similarity] * len(bucket)
+        return position
+
+    def sample(self):
+        return self.pop(self.pick_similarity())
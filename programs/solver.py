@@ -0,0 +1,276 @@
+# Solves hack puzzles and measures how hard they are
+#
+# A guess at a word that isn't the password answers with its likeness to the
+# password, as test_selection does, which rules out every word that doesn't
+# have that same likeness to the guess. A puzzle is solved over the sets of
+# words that are still possible, held as bitmasks, with the likeness of every
+# pair of words looked up in a matrix computed up front. For each puzzle:
+#   - expected_guesses: guesses needed on average by the strategy that
+#     minimizes the average, if every word is equally likely the password
+#   - worst_case: guesses needed in the worst case by the minimax strategy
+#   - lockout: chance a perfect player is locked out, i.e. can't be sure of
+#     the password within the attempts allowed
+#   - random_lockout: the same for a player who always guesses one of the
+#     words still possible, chosen at random
+#   - password_guesses: guesses the expected-guess strategy takes to find
+#     the puzzle's actual password
+# Bracket bonuses (dud removal and tries reset) are left out.
+#
+# Run as a module to analyze puzzles in bulk, either generated on the spot
+# for each difficulty or read from a file written by programs.puzzlepool:
+#   python -m programs.solver -c 5000 -w 7 -n 12
+#   python -m programs.solver -i puzzles.jsonl -o analysis.jsonl
+import argparse
+import collections
+import json
+import multiprocessing
+import statistics
+import numpy as np
+from programs import likeness
+from programs import passwordgen
+from programs import sampler
+
+ATTEMPTS = 4
+CHUNK_SIZE = 64
+
+class Solver:
+
+    def __init__(self, matrix, attempts=ATTEMPTS):
+        matrix = np.asarray(matrix)
+        self.size = matrix.shape[0]
+        self.length = int(matrix[0, 0])
+        self.attempts = attempts
+        self.matrix = matrix
+        self.everything = (1 << self.size) - 1
+        # For every guess, the words giving each likeness other than a match,
+        # as a dict of likeness to bitmask
+        self.answers = []
+        for guess in range(self.size):
+            masks = collections.defaultdict(int)
+            for word, value in enumerate(matrix[guess].tolist()):
+                if word != guess:
+                    masks[value] |= 1 << word
+            self.answers.append(dict(masks))
+        self.answer_masks = [tuple(masks.values()) for masks in self.answers]
+        self._moves = {}
+        self._expected = {}
+        self._worst = {}
+        self._success = {}
+        self._random_success = {}
+
+    def split(self, candidates, guess):
+        # The sets of words left after each answer a wrong guess could get
+        return [part for mask in self.answer_masks[guess] if (part := candidates & mask)]
+
+    def moves(self, candidates):
+        # (guess, hit, parts) for every guess worth making: ones that could be
+        # the password or that narrow things down. Guesses that would split the
+        # words the same way as an earlier one are left out.
+        moves = self._moves.get(candidates)
+        if moves is None:
+            moves = []
+            seen = set()
+            for guess in range(self.size):
+                hit = candidates >> guess & 1
+                parts = self.split(candidates, guess)
+                if not hit and len(parts) < 2:
+                    continue
+                key = (hit, frozenset(parts))
+                if key not in seen:
+                    seen.add(key)
+                    moves.append((guess, hit, parts))
+            # Guesses that could win are usually the better ones, so they go
+            # first to let the searches stop early
+            moves.sort(key=lambda move: -move[1])
+            self._moves[candidates] = moves
+        return moves
+
+    def expected(self, candidates):
+        # Returns (average guesses left, best guess)
+        result = self._expected.get(candidates)
+        if result is not None:
+            return result
+        count = candidates.bit_count()
+        if count <= 2:
+            result = (1.0 + (count - 1) / 2, candidates.bit_length() - 1)
+        else:
+            # Nothing beats guessing one of the words such that, if it's
+            # wrong, the answer says which of the others it is
+            best_possible = 2 - 1 / count
+            result = (float('inf'), None)
+            for guess, _, parts in self.moves(candidates):
+                cost = 1 + sum(part.bit_count() * self.expected(part)[0] for part in parts) / count
+                if cost < result[0]:
+                    result = (cost, guess)
+                    if cost <= best_possible:
+                        break
+        self._expected[candidates] = result
+        return result
+
+    def worst(self, candidates):
+        # Guesses left in the worst case, playing minimax
+        result = self._worst.get(candidates)
+        if result is not None:
+            return result
+        count = candidates.bit_count()
+        if count <= 2:
+            result = count
+        else:
+            result = count
+            for _, _, parts in self.moves(candidates):
+                result = min(result, 1 + max(self.worst(part) for part in parts))
+                if result == 2:
+                    break
+        self._worst[candidates] = result
+        return result
+
+    def success(self, candidates, attempts):
+        # Best chance of entering the password within attempts guesses
+        if attempts == 0:
+            return 0.0
+        if self.worst(candidates) <= attempts:
+            return 1.0
+        key = (candidates, attempts)
+        result = self._success.get(key)
+        if result is None:
+            count = candidates.bit_count()
+            result = max((hit + sum(part.bit_count() * self.success(part, attempts - 1)
+                                    for part in parts)) / count
+                         for _, hit, parts in self.moves(candidates))
+            self._success[key] = result
+        return result
+
+    def random_success(self, candidates, attempts):
+        # Chance of entering the password within attempts guesses when
+        # guessing at random among the words that are still possible
+        if attempts == 0:
+            return 0.0
+        if attempts >= candidates.bit_count():
+            # Every wrong guess rules out at least itself
+            return 1.0
+        key = (candidates, attempts)
+        result = self._random_success.get(key)
+        if result is None:
+            count = candidates.bit_count()
+            total = 0.0
+            for guess in range(self.size):
+                if candidates >> guess & 1:
+                    total += 1 + sum(part.bit_count() * self.random_success(part, attempts - 1)
+                                     for part in self.split(candidates, guess))
+            result = total / (count * count)
+            self._random_success[key] = result
+        return result
+
+    def guesses_for(self, password):
+        # Guesses the expected-guess strategy takes to find password
+        candidates = self.everything
+        guesses = 0
+        while True:
+            guess = self.expected(candidates)[1]
+            guesses += 1
+            if guess == password:
+                return guesses
+            candidates &= self.answers[guess][int(self.matrix[guess, password])]
+
+    def analyze(self, password=None):
+        result = {
+            'expected_guesses': self.expected(self.everything)[0],
+            'worst_case': self.worst(self.everything),
+            'lockout': 1 - self.success(self.everything, self.attempts),
+            'random_lockout': 1 - self.random_success(self.everything, self.attempts),
+        }
+        if password is not None:
+            result['password_guesses'] = self.guesses_for(password)
+        return result
+
+def analyze_puzzles(puzzles, attempts=ATTEMPTS):
+    # puzzles is a list of (password, word_list) pairs. Puzzles with the same
+    # word length and count have their likeness matrices computed together.
+    results = [None] * len(puzzles)
+    groups = collections.defaultdict(list)
+    for position, (_, word_list) in enumerate(puzzles):
+        groups[(len(word_list[0]), len(word_list))].append(position)
+    for positions in groups.values():
+        arrays = np.stack([likeness.words_to_array(puzzles[position][1]) for position in positions])
+        for position, matrix in zip(positions, likeness.likeness_matrices(arrays)):
+            password, word_list = puzzles[position]
+            results[position] = Solver(matrix, attempts).analyze(word_list.index(password))
+    return results
+
+def _generate_and_analyze(key):
+    word_length, num_words, difficulty, count = key
+    puzzles = [passwordgen.get_list_of_words(num_words, word_length, difficulty)
+               for _ in range(count)]
+    return [dict(result, difficulty=difficulty, word_length=word_length, num_words=num_words)
+            for result in analyze_puzzles(puzzles)]
+
+def _analyze_datasets(datasets):
+    results = analyze_puzzles([(dataset['password'], dataset['word_list']) for dataset in datasets])
+    return [dict(result, difficulty=dataset.get('difficulty'), word_length=dataset['word_length'],
+                 num_words=len(dataset['word_list']))
+            for dataset, result in zip(datasets, results)]
+
+def analyze_in_bulk(jobs, worker, processes=None):
+    # Runs worker over jobs in a process pool, yielding every result
+    with multiprocessing.Pool(processes) as pool:
+        for results in pool.imap_unordered(worker, jobs):
+            yield from results
+
+def summarize(results):
+    # Per-difficulty distribution of each measure
+    by_difficulty = collections.defaultdict(list)
+    for result in results:
+        by_difficulty[result['difficulty']].append(result)
+    summary = {}
+    for difficulty, group in sorted(by_difficulty.items(), key=lambda item: str(item[0])):
+        def quantiles(name):
+            values = [result[name] for result in group]
+            deciles = statistics.quantiles(values, n=10) if len(values) > 1 else values * 9
+            return {'mean': statistics.fmean(values), 'p10': deciles[0],
+                    'p50': statistics.median(values), 'p90': deciles[-1]}
+        summary[difficulty] = {
+            'puzzles': len(group),
+            'expected_guesses': quantiles('expected_guesses'),
+            'random_lockout': quantiles('random_lockout'),
+            'lockout': quantiles('lockout'),
+            'password_guesses': quantiles('password_guesses'),
+            'worst_case': dict(sorted(collections.Counter(result['worst_case']
+                                                          for result in group).items())),
+        }
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Solve hack puzzles and report how hard they are")
+    parser.add_argument('-i', '--input', help='a JSONL file of puzzles from programs.puzzlepool')
+    parser.add_argument('-o', '--output', help='write the analysis of every puzzle to this JSONL file')
+    parser.add_argument('-c', '--count', default=1000, type=int,
+                        help='puzzles to generate for each difficulty')
+    parser.add_argument('-w', '--word-length', default=5, type=int)
+    parser.add_argument('-n', '--number-of-words', default=12, type=int)
+    parser.add_argument('-d', '--difficulty', nargs='*', type=int, choices=[0, 1, 2],
+                        default=[sampler.EASY, sampler.NORMAL, sampler.HARD])
+    parser.add_argument('-j', '--processes', default=None, type=int,
+                        help='worker processes, defaults to the number of cores')
+    solverargs = parser.parse_args()
+
+    if solverargs.input is not None:
+        with open(solverargs.input) as file:
+            datasets = [json.loads(line) for line in file if line.strip()]
+        jobs = [datasets[start:start + CHUNK_SIZE] for start in range(0, len(datasets), CHUNK_SIZE)]
+        worker = _analyze_datasets
+    else:
+        jobs = []
+        for difficulty in solverargs.difficulty:
+            for start in range(0, solverargs.count, CHUNK_SIZE):
+                jobs.append((solverargs.word_length, solverargs.number_of_words, difficulty,
+                             min(CHUNK_SIZE, solverargs.count - start)))
+        worker = _generate_and_analyze
+
+    results = list(analyze_in_bulk(jobs, worker, solverargs.processes))
+    if solverargs.output is not None:
+        with open(solverargs.output, 'w') as file:
+            for result in results:
+                file.write(json.dumps(result))
+                file.write('\n')
+    print(json.dumps(summarize(results), indent=2))
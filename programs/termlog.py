@@ -0,0 +1,278 @@
+# -*- coding: utf-8 -*-
+"""Reads the terminal logs on a holotape, a page at a time
+
+Entries are memory-mapped and only the lines on screen are ever read, so a
+log of any size opens straight away. Line starts are found with find/rfind
+around the current position, and those found while reading down from the top
+are kept in an index so that paging back over them, and numbering them, is a
+lookup."""
+from array import array
+import argparse
+import bisect
+import os
+import consolekeys
+import holotape
+
+SCREEN_WIDTH = 60
+TEXT_TOP = 2
+TEXT_ROWS = 20
+STATUS_ROW = 23
+
+class LineIndex:
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        self.size = len(buffer)
+        # Starts of the first len(starts) lines, found so far
+        self.starts = array('q', [0])
+        self.complete = self.size == 0
+
+    def next_line(self, offset):
+        # Start of the line after the one starting at offset, or None
+        known = bisect.bisect_right(self.starts, offset)
+        if known < len(self.starts):
+            return self.starts[known]
+        newline = self.buffer.find(b'\n', offset)
+        following = None if newline < 0 or newline + 1 >= self.size else newline + 1
+        # Reading on from the last known line extends the index
+        if offset == self.starts[-1] and not self.complete:
+            if following is None:
+                self.complete = True
+            else:
+                self.starts.append(following)
+        return following
+
+    def previous_line(self, offset):
+        # Start of the line before the one starting at offset, or None
+        if offset <= 0:
+            return None
+        if offset <= self.starts[-1]:
+            known = bisect.bisect_left(self.starts, offset)
+            return self.starts[known - 1]
+        newline = self.buffer.rfind(b'\n', 0, offset - 1)
+        return newline + 1
+
+    def line_number(self, offset):
+        # Line number (from 1) of the line starting at offset, if it has been
+        # indexed
+        if offset > self.starts[-1]:
+            return None
+        return bisect.bisect_left(self.starts, offset) + 1
+
+    def last_lines_start(self, count):
+        # Start of the count'th line from the end, found without reading
+        # anything before it
+        position = self.size
+        if self.buffer[position - 1:position] == b'\n':
+            position -= 1
+        start = 0
+        for _ in range(count):
+            newline = self.buffer.rfind(b'\n', 0, position)
+            if newline < 0:
+                return 0
+            start = newline + 1
+            position = newline
+        return start
+
+    def line_text(self, offset, width):
+        # The start of the line at offset, at most width characters of it
+        newline = self.buffer.find(b'\n', offset, offset + width * 4 + 1)
+        end = offset + width * 4 if newline < 0 else newline
+        text = self.buffer[offset:min(end, self.size)].decode('utf-8', 'replace')
+        return text.rstrip('\r').expandtabs(4)[:width]
+
+class Program:
+
+    def __init__(self, provider, args):
+
+        self.provider = provider
+
+        parser = argparse.ArgumentParser(description="Holotape terminal log reader")
+        parser.add_argument('entry', nargs='?', default=None,
+                            help='the entry to open, or a log file, directory or zip archive '
+                                 'to read from when no holotape has been inserted')
+        logargs = parser.parse_args(args)
+
+        self.key_pressed = 0
+        # Times the key was pressed in a row, as read_keys coalesces them
+        self.key_repeat = 1
+        self.holotape = provider.holotape
+        self.entries = []
+        self.selected = 0
+        self.list_top = 0
+        self.entry = None
+        self.index = None
+        self.top = 0
+        self.message = ''
+
+        entry = logargs.entry
+        if self.holotape is None and entry is not None:
+            if os.path.isfile(entry) and not entry.endswith('.zip'):
+                self.holotape = holotape.mount(os.path.dirname(os.path.abspath(entry)))
+                entry = os.path.basename(entry)
+            else:
+                self.holotape = holotape.mount(entry)
+                entry = None
+
+        self.load_entries()
+        if entry is not None:
+            self.open_entry(entry)
+
+        self.provider.clear()
+        self.provider.refresh()
+
+    def holotape_inserted(self, path):
+        # A new holotape replaces the old one, back at its list of entries
+        self.close_entry()
+        self.holotape = holotape.mount(path)
+        self.load_entries()
+
+    def load_entries(self):
+        self.entries = self.holotape.entries() if self.holotape is not None else []
+        self.selected = 0
+        self.list_top = 0
+        if self.holotape is None:
+            self.message = 'NO HOLOTAPE INSERTED'
+        elif len(self.entries) == 0:
+            self.message = 'HOLOTAPE IS BLANK'
+        else:
+            self.message = ''
+
+    def open_entry(self, name):
+        self.close_entry()
+        try:
+            self.entry = self.holotape.open(name)
+        except (OSError, KeyError):
+            self.message = 'UNABLE TO READ ' + name.upper()
+            return
+        self.index = LineIndex(self.entry.buffer)
+        self.top = 0
+        self.message = ''
+
+    def close_entry(self):
+        if self.entry is not None:
+            self.entry.close()
+        self.entry = None
+        self.index = None
+
+    def scroll(self, lines):
+        # Moves the top of the page down (or up, if negative) by lines
+        step = self.index.next_line if lines > 0 else self.index.previous_line
+        for _ in range(abs(lines)):
+            offset = step(self.top)
+            if offset is None:
+                break
+            self.top = offset
+
+    def update(self):
+        # Applies the last key pressed. Returns True once the program is done.
+        key = self.key_pressed
+        if key == ord('q') or key == consolekeys.ESCAPE:
+            if self.entry is None:
+                return True
+            self.close_entry()
+            return False
+
+        repeat = self.key_repeat
+        if self.entry is not None:
+            if key == consolekeys.DOWN_ARROW:
+                self.scroll(repeat)
+            elif key == consolekeys.UP_ARROW:
+                self.scroll(-repeat)
+            elif key == consolekeys.PAGE_DOWN:
+                self.scroll(TEXT_ROWS * repeat)
+            elif key == consolekeys.PAGE_UP:
+                self.scroll(-TEXT_ROWS * repeat)
+            elif key == consolekeys.HOME:
+                self.top = 0
+            elif key == consolekeys.END:
+                self.top = self.index.last_lines_start(TEXT_ROWS)
+        elif len(self.entries) > 0:
+            if key == consolekeys.DOWN_ARROW:
+                self.selected = min(len(self.entries) - 1, self.selected + repeat)
+            elif key == consolekeys.UP_ARROW:
+                self.selected = max(0, self.selected - repeat)
+            elif key == consolekeys.PAGE_DOWN:
+                self.selected = min(len(self.entries) - 1, self.selected + TEXT_ROWS * repeat)
+            elif key == consolekeys.PAGE_UP:
+                self.selected = max(0, self.selected - TEXT_ROWS * repeat)
+            elif key == consolekeys.HOME:
+                self.selected = 0
+            elif key == consolekeys.END:
+                self.selected = len(self.entries) - 1
+            elif key == consolekeys.ENTER or key == ord('e'):
+                self.open_entry(self.entries[self.selected])
+            # Keep the selection on screen
+            if self.selected < self.list_top:
+                self.list_top = self.selected
+            elif self.selected >= self.list_top + TEXT_ROWS:
+                self.list_top = self.selected - TEXT_ROWS + 1
+        return False
+
+    def draw(self, provider):
+
+        if self.entry is not None:
+            provider.print_str(0, 0, self.entry.name.upper()[:SCREEN_WIDTH])
+            offset = self.top
+            for row in range(TEXT_ROWS):
+                if offset is None:
+                    break
+                provider.print_str(0, TEXT_TOP + row, self.index.line_text(offset, SCREEN_WIDTH))
+                offset = self.index.next_line(offset)
+
+            # Line numbers are only known for the part read from the top
+            line = self.index.line_number(self.top)
+            if line is not None:
+                position = 'LINE %d' % line
+            else:
+                position = '%d%%' % (100 * self.top // max(1, len(self.entry)))
+            status = 'PGUP/PGDN HOME/END  Q:BACK'
+            provider.print_str(0, STATUS_ROW, status)
+            provider.print_str(SCREEN_WIDTH - len(position), STATUS_ROW, position)
+
+        else:
+            title = 'HOLOTAPE' if self.holotape is None else 'HOLOTAPE: ' + self.holotape.name.upper()
+            provider.print_str(0, 0, title[:SCREEN_WIDTH])
+            for row, name in enumerate(self.entries[self.list_top:self.list_top + TEXT_ROWS]):
+                provider.print_str(2, TEXT_TOP + row, name[:SCREEN_WIDTH - 2])
+                if self.list_top + row == self.selected:
+                    provider.invert_span(2, TEXT_TOP + row, min(len(name), SCREEN_WIDTH - 2))
+            if len(self.message) > 0:
+                provider.print_str(0, TEXT_TOP + TEXT_ROWS, self.message)
+            provider.print_str(0, STATUS_ROW, 'ENTER:OPEN  Q:EXIT')
+
+    def apply_keys(self, keys):
+        # Applies (key, repeat) pairs from read_keys in order, so a held key
+        # scrolls as far as it was repeated before the next frame. Returns
+        # True once the program is done.
+        for key, repeat in keys:
+            self.key_pressed = key
+            self.key_repeat = repeat
+            if self.update():
+                return True
+        return False
+
+    def run(self, provider):
+
+        keys = [(self.key_pressed, 1)]
+        while not self.apply_keys(keys):
+
+            provider.clear()
+            self.draw(provider)
+            provider.refresh()
+
+            keys = provider.read_keys()
+            provider.set_input_blocking_mode(True)
+
+        self.close_entry()
+        return None
+
+    async def run_async(self, runtime):
+
+        keys = [(self.key_pressed, 1)]
+        while not self.apply_keys(keys):
+            runtime.invalidate()
+            keys = await runtime.next_keys()
+
+        self.close_entry()
+        return None
@@ -0,0 +1,159 @@
+# Compiled, length-bucketed index of a word list
+#
+# The source text file is compiled once into a compact binary file that sits
+# next to it. Words are uppercased and stored back to back, grouped by length,
+# so every bucket is a single contiguous run of fixed-width records and the
+# words of one length are a plain slice of the mapped file.
+#
+# Layout (all integers little-endian):
+#   header:  magic "RCWI", version (u16), max length (u16),
+#            source mtime in ns (u64), source size (u64)
+#   table:   (offset u32, count u32) for every length 0..max length
+#   data:    bucket records, each `length` bytes of ASCII
+import mmap
+import os
+import struct
+import threading
+
+MAGIC = b'RCWI'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQQ')
+TABLE_ENTRY = struct.Struct('<II')
+INDEX_SUFFIX = '.idx'
+
+_indices = {}
+_indices_lock = threading.Lock()
+
+def index_path_for(source_path):
+    return os.path.splitext(source_path)[0] + INDEX_SUFFIX
+
+def compile_words(words, source_mtime_ns=0, source_size=0):
+    # Returns the bytes of a compiled index of words, recording the mtime and
+    # size of the word list file they came from
+    buckets = {}
+    for word in words:
+        buckets.setdefault(len(word), []).append(word.upper().encode('ascii', 'replace'))
+
+    max_length = max(buckets.keys(), default=0)
+    offset = HEADER.size + TABLE_ENTRY.size * (max_length + 1)
+    table = []
+    data = []
+    for length in range(max_length + 1):
+        bucket = buckets.get(length, [])
+        table.append(TABLE_ENTRY.pack(offset, len(bucket)))
+        data.extend(bucket)
+        offset += length * len(bucket)
+
+    header = HEADER.pack(MAGIC, VERSION, max_length, source_mtime_ns, source_size)
+    return header + b''.join(table) + b''.join(data)
+
+def compile_index(source_path):
+    # Returns the bytes of a compiled index for the word list at source_path
+    stat = os.stat(source_path)
+    with open(source_path, 'r') as file:
+        words = [word.rstrip('\n') for word in file]
+    return compile_words([word for word in words if len(word) > 0],
+                         stat.st_mtime_ns, stat.st_size)
+
+def replace_file(path, data):
+    # Writes data to path atomically, so readers never see half a file
+    temp_path = path + '.tmp.' + str(os.getpid())
+    with open(temp_path, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+def write_index(source_path, index_path=None):
+    # Compiles the word list and atomically replaces the index file
+    if index_path is None:
+        index_path = index_path_for(source_path)
+    replace_file(index_path, compile_index(source_path))
+    return index_path
+
+def is_index_current(source_path, index_path):
+    try:
+        stat = os.stat(source_path)
+        with open(index_path, 'rb') as file:
+            header = file.read(HEADER.size)
+    except OSError:
+        return False
+    if len(header) < HEADER.size:
+        return False
+    magic, version, _, mtime_ns, size = HEADER.unpack(header)
+    return magic == MAGIC and version == VERSION and \
+        mtime_ns == stat.st_mtime_ns and size == stat.st_size
+
+class WordIndex:
+
+    def __init__(self, buffer):
+        # buffer is anything supporting the buffer protocol: an mmap of an
+        # index file, or the bytes returned by compile_index
+        self.buffer = buffer
+        magic, version, self.max_length, self.source_mtime_ns, self.source_size = \
+            HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Not a compiled word index')
+        self.table = [TABLE_ENTRY.unpack_from(buffer, HEADER.size + TABLE_ENTRY.size * length)
+                      for length in range(self.max_length + 1)]
+
+    def count_of_length(self, length):
+        if length < 0 or length > self.max_length:
+            return 0
+        return self.table[length][1]
+
+    def raw_of_length(self, length):
+        # Returns a read-only view of every word of the given length,
+        # stored back to back without separators
+        if length < 0 or length > self.max_length:
+            return memoryview(b'')
+        offset, count = self.table[length]
+        return memoryview(self.buffer)[offset:offset + length * count].toreadonly()
+
+    def words_of_length(self, length):
+        raw = bytes(self.raw_of_length(length))
+        return [raw[start:start + length].decode('ascii') for start in range(0, len(raw), length)]
+
+    def word_at(self, length, position):
+        offset, count = self.table[length]
+        if position < 0 or position >= count:
+            raise IndexError('word index out of range')
+        start = offset + position * length
+        return bytes(self.buffer[start:start + length]).decode('ascii')
+
+def open_index(source_path):
+    # Maps the compiled index for source_path, rebuilding it if the word list
+    # has changed since it was compiled. If the index can't be written next to
+    # the word list, it is compiled in memory instead.
+    index_path = index_path_for(source_path)
+    if not is_index_current(source_path, index_path):
+        try:
+            write_index(source_path, index_path)
+        except OSError:
+            return WordIndex(compile_index(source_path))
+
+    with open(index_path, 'rb') as file:
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    return WordIndex(mapped)
+
+def get_word_index(source_path):
+    # Returns the process-wide index for source_path, opening it on first use
+    # and reopening it if the source word list has been modified since
+    key = os.path.abspath(source_path)
+    with _indices_lock:
+        index = _indices.get(key)
+        if index is not None:
+            try:
+                stat = os.stat(source_path)
+                if stat.st_mtime_ns == index.source_mtime_ns and stat.st_size == index.source_size:
+                    return index
+            except OSError:
+                return index
+        index = open_index(source_path)
+        _indices[key] = index
+        return index
+
+
+if __name__ == '__main__':
+    import sys
+
+    for path in sys.argv[1:] or [os.path.join('programs', 'trimmed-words.txt')]:
+        print(write_index(path))
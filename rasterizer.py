@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+"""
+Draws the console into RGB pixels without a window, for screenshots and for
+exporting recorded sessions as PNG sequences or animated PNGs.
+
+The glyphs come from the same font the tcod provider uses,
+font/robco-termfont.png, laid out 16x8 in ASCII order along the rows. Each
+glyph is drawn once, in both the normal and inverted colours, into a table
+of tiles; a frame is then a single NumPy gather of one tile per cell, so it
+takes well under a millisecond and nothing is drawn glyph by glyph. Screens
+in several colours (see consolecolours) get a set of tiles for every pair of
+colours on them, and are drawn with the same gather.
+
+    python rasterizer.py session.rrl -o frames/                # PNG per frame
+    python rasterizer.py session.rrl -o frames/ --fps 30       # at a fixed rate
+    python rasterizer.py session.rrl -o session.png --animated
+    python rasterizer.py session.rrl -o shot.png --seek 12.5   # one screenshot
+
+PNGs are read and written here too (8-bit and lower, not interlaced), so
+there's nothing to install beyond NumPy.
+"""
+
+import argparse
+import os
+import struct
+import time
+import zlib
+import numpy as np
+import recording
+
+FONT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'font', 'robco-termfont.png')
+FONT_COLUMNS = 16
+FONT_ROWS = 8
+# The colours the tcod provider draws with
+DEFAULT_FG = (0, 255, 0)
+DEFAULT_BG = (0, 0, 0)
+# Tile sets are kept for reuse, up to this many
+MAX_TILE_SETS = 256
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_HEADER = struct.Struct('>IIBBBBB')
+# Channels for each PNG colour type: grey, RGB, palette, grey+alpha, RGBA
+PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+
+def paeth(left, up, up_left):
+    estimate = left + up - up_left
+    to_left, to_up, to_up_left = abs(estimate - left), abs(estimate - up), abs(estimate - up_left)
+    if to_left <= to_up and to_left <= to_up_left:
+        return left
+    return up if to_up <= to_up_left else up_left
+
+
+def unfilter(data, height, stride, step):
+    # Undoes the filter on each of height rows of stride bytes. step is the
+    # number of bytes per pixel (at least one), which filters look back by.
+    rows = np.zeros((height, stride), dtype=np.uint8)
+    previous = bytearray(stride)
+    for y in range(height):
+        start = y * (stride + 1)
+        kind = data[start]
+        row = bytearray(data[start + 1:start + 1 + stride])
+        if kind == 1:
+            for i in range(step, stride):
+                row[i] = (row[i] + row[i - step]) & 0xff
+        elif kind == 2:
+            row = bytearray((a + b) & 0xff for a, b in zip(row, previous))
+        elif kind == 3:
+            for i in range(stride):
+                left = row[i - step] if i >= step else 0
+                row[i] = (row[i] + ((left + previous[i]) >> 1)) & 0xff
+        elif kind == 4:
+            for i in range(stride):
+                left = row[i - step] if i >= step else 0
+                up_left = previous[i - step] if i >= step else 0
+                row[i] = (row[i] + paeth(left, previous[i], up_left)) & 0xff
+        elif kind != 0:
+            raise ValueError('Unknown PNG filter %d' % kind)
+        rows[y] = np.frombuffer(bytes(row), dtype=np.uint8)
+        previous = row
+    return rows
+
+
+def read_png(path):
+    # Returns the image as a (height, width, channels) uint8 array, with
+    # palettes expanded to RGB and grey levels below 8 bits scaled up
+    with open(path, 'rb') as file:
+        data = file.read()
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError('%s is not a PNG' % path)
+    chunks = {}
+    compressed = []
+    position = len(PNG_SIGNATURE)
+    while position < len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        position += length + 12
+        if kind == b'IDAT':
+            compressed.append(body)
+        elif kind == b'IEND':
+            break
+        else:
+            chunks[kind] = body
+
+    width, height, depth, colour, _, _, interlace = PNG_HEADER.unpack(chunks[b'IHDR'])
+    if depth > 8 or interlace:
+        raise ValueError('%s: only non-interlaced PNGs of up to 8 bits are supported' % path)
+    channels = PNG_CHANNELS[colour]
+    stride = (width * channels * depth + 7) // 8
+    rows = unfilter(zlib.decompress(b''.join(compressed)), height, stride,
+                    max(1, channels * depth // 8))
+
+    if depth < 8:
+        # Several pixels to a byte: split the bits into depth-bit values
+        bits = np.unpackbits(rows, axis=1).reshape(height, -1, depth)[:, :width]
+        rows = (bits * (1 << np.arange(depth - 1, -1, -1, dtype=np.uint8))).sum(axis=2, dtype=np.uint8)
+        if colour == 0:
+            rows = rows * (255 // ((1 << depth) - 1))
+    pixels = rows.reshape(height, width, channels)
+    if colour == 3:
+        palette = np.frombuffer(chunks[b'PLTE'], dtype=np.uint8).reshape(-1, 3)
+        pixels = palette[pixels[:, :, 0]]
+    return pixels
+
+
+def png_chunk(kind, body):
+    return struct.pack('>I', len(body)) + kind + body + struct.pack('>I', zlib.crc32(kind + body))
+
+
+def png_data(pixels, level):
+    # The compressed rows of an (height, width, 3) image, each behind a
+    # "no filter" byte
+    height = pixels.shape[0]
+    rows = np.zeros((height, pixels.shape[1] * 3 + 1), dtype=np.uint8)
+    rows[:, 1:] = pixels.reshape(height, -1)
+    return zlib.compress(rows.tobytes(), level)
+
+
+def write_png(path, pixels, level=1):
+    # Writes an (height, width, 3) uint8 image. Low compression levels are
+    # much quicker, and the console's flat colours compress well anyway.
+    height, width = pixels.shape[:2]
+    with open(path, 'wb') as file:
+        file.write(PNG_SIGNATURE)
+        file.write(png_chunk(b'IHDR', PNG_HEADER.pack(width, height, 8, 2, 0, 0, 0)))
+        file.write(png_chunk(b'IDAT', png_data(pixels, level)))
+        file.write(png_chunk(b'IEND', b''))
+
+
+class AnimatedPNG:
+    # Collects frames, each shown for its own number of milliseconds, and
+    # writes them as an APNG on close. The frame count goes in the header, so
+    # frames are kept (compressed) until then.
+
+    def __init__(self, path, level=1):
+        self.path = path
+        self.level = level
+        self.size = None
+        self.frames = []
+
+    def add_frame(self, pixels, delay):
+        if self.size is None:
+            self.size = pixels.shape[:2]
+        self.frames.append((png_data(pixels, self.level), max(0, min(int(round(delay)), 0xffff))))
+
+    def close(self):
+        if len(self.frames) == 0:
+            return
+        height, width = self.size
+        sequence = 0
+        with open(self.path, 'wb') as file:
+            file.write(PNG_SIGNATURE)
+            file.write(png_chunk(b'IHDR', PNG_HEADER.pack(width, height, 8, 2, 0, 0, 0)))
+            # Frame count, and 0 to loop forever
+            file.write(png_chunk(b'acTL', struct.pack('>II', len(self.frames), 0)))
+            for number, (data, delay) in enumerate(self.frames):
+                # Each frame covers the whole image, shown for delay/1000 s
+                file.write(png_chunk(b'fcTL', struct.pack('>IIIIIHHBB', sequence, width, height,
+                                                          0, 0, delay, 1000, 0, 0)))
+                sequence += 1
+                if number == 0:
+                    # The first frame doubles as the still image
+                    file.write(png_chunk(b'IDAT', data))
+                else:
+                    file.write(png_chunk(b'fdAT', struct.pack('>I', sequence) + data))
+                    sequence += 1
+            file.write(png_chunk(b'IEND', b''))
+        self.frames = []
+
+
+class GlyphAtlas:
+    # The glyphs of a font image laid out in columns x rows tiles, in
+    # character order along the rows (tcod's FONT_LAYOUT_ASCII_INROW), as
+    # coverage from 0 to 1 with shape (glyphs, glyph height, glyph width)
+
+    def __init__(self, path=FONT_PATH, columns=FONT_COLUMNS, rows=FONT_ROWS):
+        pixels = read_png(path)
+        height, width, channels = pixels.shape
+        self.glyph_width = width // columns
+        self.glyph_height = height // rows
+        if channels in (2, 4):
+            # The alpha channel says where the glyph is
+            coverage = pixels[:, :, -1]
+        else:
+            # Otherwise it's drawn light on dark
+            coverage = pixels.max(axis=2)
+        coverage = coverage[:rows * self.glyph_height, :columns * self.glyph_width] / 255.0
+        self.coverage = coverage.reshape(rows, self.glyph_height, columns, self.glyph_width) \
+            .transpose(0, 2, 1, 3).reshape(rows * columns, self.glyph_height, self.glyph_width)
+
+    def __len__(self):
+        return len(self.coverage)
+
+
+class Rasterizer:
+    # Draws characters and inverted flags, indexed [x, y] like a
+    # ScreenBuffer, into (height, width, 3) RGB images
+
+    def __init__(self, atlas=None, fg=DEFAULT_FG, bg=DEFAULT_BG):
+        self.atlas = GlyphAtlas() if atlas is None else atlas
+        self.glyphs = len(self.atlas)
+        self.glyph_width = self.atlas.glyph_width
+        self.glyph_height = self.atlas.glyph_height
+        self.tile_rows = np.arange(self.glyph_height)[np.newaxis, :, np.newaxis]
+        # Characters the font doesn't have are drawn blank, as tcod does
+        self.blank = ord(' ')
+        self.tile_sets = {}
+        self.tiles = self.tile_set(fg, bg)
+
+    def tile_set(self, fg, bg):
+        # Every glyph in fg on bg, then every glyph inverted, with each
+        # tile's rows flattened so a gather copies a row of pixels at once
+        key = (tuple(fg), tuple(bg))
+        tiles = self.tile_sets.get(key)
+        if tiles is None:
+            if len(self.tile_sets) > MAX_TILE_SETS:
+                self.tile_sets.clear()
+            coverage = self.atlas.coverage[:, :, :, np.newaxis]
+            fg = np.array(fg, dtype=np.float64)
+            bg = np.array(bg, dtype=np.float64)
+            tiles = np.concatenate([bg + (fg - bg) * coverage, fg + (bg - fg) * coverage])
+            tiles = self.tile_sets[key] = np.round(tiles).astype(np.uint8).reshape(
+                2 * self.glyphs, self.glyph_height, self.glyph_width * 3)
+        return tiles
+
+    def glyph_indices(self, chars):
+        return np.where((chars >= 0) & (chars < self.glyphs), chars, self.blank)
+
+    def render(self, chars, inverted, tiles=None):
+        width, height = chars.shape
+        tiles = self.tiles if tiles is None else tiles
+        tile = self.glyph_indices(chars)
+        tile += inverted * self.glyphs
+        # Index tiles by [cell row, row within the glyph, cell column], which
+        # lays the pixels out in image order with no copy afterwards
+        pixels = tiles[tile.T[:, np.newaxis, :], self.tile_rows]
+        return pixels.reshape(height * self.glyph_height, width * self.glyph_width, 3)
+
+    def render_screen(self, screen):
+        # A screen all in one pair of colours, as recordings are, takes the
+        # quicker path through a tile set in those colours
+        fg = screen.fg[0, 0]
+        bg = screen.bg[0, 0]
+        if not screen.flags.any() and (screen.fg == fg).all() and (screen.bg == bg).all():
+            return self.render(screen.chars, screen.inverted,
+                               self.tile_set(screen.palette[fg], screen.palette[bg]))
+
+        # Otherwise every pair of colours on screen gets its tile set, and
+        # the cells pick from the lot
+        fg, bg = screen.colours()
+        packed = (fg.astype(np.int64) << np.array([40, 32, 24])).sum(axis=2) + \
+            (bg.astype(np.int64) << np.array([16, 8, 0])).sum(axis=2)
+        pairs, pair = np.unique(packed, return_inverse=True)
+        tiles = self.pair_tiles(tuple(pairs.tolist()))
+        width, height = screen.chars.shape
+        tile = pair.reshape(width, height) * self.glyphs + self.glyph_indices(screen.chars)
+        pixels = tiles[tile.T[:, np.newaxis, :], self.tile_rows]
+        return pixels.reshape(height * self.glyph_height, width * self.glyph_width, 3)
+
+    def pair_tiles(self, pairs):
+        # The uninverted tiles for each pair of packed RGB colours, one set
+        # after another
+        tiles = self.tile_sets.get(pairs)
+        if tiles is None:
+            if len(self.tile_sets) > MAX_TILE_SETS:
+                self.tile_sets.clear()
+            sets = [self.tile_set([(pair >> shift) & 0xff for shift in (40, 32, 24)],
+                                  [(pair >> shift) & 0xff for shift in (16, 8, 0)])[:self.glyphs]
+                    for pair in pairs]
+            tiles = self.tile_sets[pairs] = np.concatenate(sets)
+        return tiles
+
+
+def screenshot(provider, path, rasterizer=None):
+    # Saves what a provider with a ScreenBuffer is showing as a PNG
+    rasterizer = Rasterizer() if rasterizer is None else rasterizer
+    write_png(path, rasterizer.render_screen(provider.screen))
+
+
+def session_frames(log, rasterizer, start=0.0, end=None):
+    # Yields (time, pixels) for every frame of a recording.SessionLog between
+    # start and end seconds, beginning with the screen as it was at start
+    import console_providers
+    provider = console_providers.HeadlessOSProvider(width=log.width, height=log.height)
+    screen = provider.screen
+    position, start_time = (None, 0.0)
+    if start > 0:
+        position, start_time = recording.Replayer(log, provider).seek(start)
+        yield start, rasterizer.render_screen(screen)
+    for record_time, record_type, payload, length, _ in log.records(position, start_time):
+        if end is not None and record_time > end:
+            break
+        if record_type == recording.KEY:
+            continue
+        if record_type == recording.PALETTE:
+            screen.set_palette(log.palette(payload, length))
+            continue
+        log.apply(record_type, payload, length, screen.chars, screen.inverted, screen.packed)
+        yield record_time, rasterizer.render_screen(screen)
+
+
+def resample(frames, fps, end=None):
+    # Turns frames at irregular times into one every 1/fps seconds, each
+    # showing whatever was on screen at that moment
+    interval = 1.0 / fps
+    sample_time = None
+    shown = None
+    last_time = None
+    for frame_time, pixels in frames:
+        if sample_time is None:
+            sample_time = frame_time
+        while shown is not None and sample_time < frame_time:
+            yield sample_time, shown
+            sample_time += interval
+        shown = pixels
+        last_time = frame_time
+    if shown is not None:
+        for _ in range(max(1, int((max(last_time, end or 0.0) - sample_time) * fps) + 1)):
+            yield sample_time, shown
+            sample_time += interval
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a recorded RobCo OS session as images")
+    parser.add_argument("log", help="the recording to export")
+    parser.add_argument("-o", "--output", required=True,
+                        help="a directory for a PNG per frame, or with --animated or --seek alone, "
+                             "the PNG to write")
+    parser.add_argument("--animated", action="store_true", help="write a single animated PNG")
+    parser.add_argument("--seek", default=0.0, type=float, help="seconds into the session to start at")
+    parser.add_argument("--end", default=None, type=float, help="seconds into the session to stop at")
+    parser.add_argument("--fps", default=0.0, type=float,
+                        help="frames per second to sample at, 0 for every recorded frame")
+    parser.add_argument("--level", default=1, type=int, choices=range(10), metavar="0-9",
+                        help="zlib compression level")
+    parser.add_argument("--font", default=FONT_PATH, help="the 16x8 glyph atlas to draw with")
+    exportargs = parser.parse_args()
+
+    log = recording.SessionLog.open(exportargs.log)
+    rasterizer = Rasterizer(GlyphAtlas(exportargs.font))
+    started = time.perf_counter()
+    count = 0
+
+    if exportargs.seek > 0 and exportargs.end is None and not exportargs.animated \
+            and exportargs.output.endswith('.png'):
+        # A screenshot of a single moment
+        _, pixels = next(session_frames(log, rasterizer, exportargs.seek, exportargs.seek))
+        write_png(exportargs.output, pixels, exportargs.level)
+        count = 1
+    else:
+        frames = session_frames(log, rasterizer, exportargs.seek, exportargs.end)
+        if exportargs.fps > 0:
+            frames = resample(frames, exportargs.fps, exportargs.end)
+        if exportargs.animated:
+            animation = AnimatedPNG(exportargs.output, exportargs.level)
+            previous = None
+            for frame_time, pixels in frames:
+                if previous is not None:
+                    animation.add_frame(previous[1], (frame_time - previous[0]) * 1000)
+                previous = (frame_time, pixels)
+                count += 1
+            if previous is not None:
+                animation.add_frame(previous[1], 1000)
+            animation.close()
+        else:
+            os.makedirs(exportargs.output, exist_ok=True)
+            for frame_time, pixels in frames:
+                write_png(os.path.join(exportargs.output, '%05d.png' % count), pixels, exportargs.level)
+                count += 1
+
+    elapsed = time.perf_counter() - started
+    print('%d frames in %.3f s (%.0f frames/s)' % (count, elapsed, count / elapsed if elapsed > 0 else 0))
@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+Records sessions to a compact binary log and plays them back.
+
+A log holds the keys returned by getch and, for every refresh, the cells that
+changed since the previous frame, each stamped with the time since the
+previous record. Every so often a keyframe holding the whole screen is
+written, so playback can seek without replaying from the start.
+
+    python robco_os.py --record session.rrl hack
+    python recording.py session.rrl                  # play back in real time
+    python recording.py session.rrl --speed 0        # as fast as possible
+    python recording.py session.rrl --seek 600 --provider ansi
+
+Layout: the header is the magic "RCRL", a version byte, and the width and
+height as varints. Each record is a type byte, the milliseconds since the
+previous record and the payload length (varints), followed by the payload:
+  key:      the key as a zigzag varint
+  frame:    a run count, then for every run of changed cells (in row order)
+            the cells skipped since the last run, the run length, each
+            character as a varint, the inverted flags as packed bits and
+            each cell's packed colours and flags as a varint
+  keyframe: every character, inverted flag and packed attribute, zlib
+            compressed
+  palette:  the RGB of all 256 colour indices, zlib compressed, written
+            whenever the palette changes (e.g. for a theme) and before
+            every keyframe
+
+Version 1 logs, from before cells had colours, have no attributes, and
+neither they nor version 2 logs have palettes. They still play back, in the
+default colours.
+"""
+
+import argparse
+import time
+import zlib
+import numpy as np
+
+MAGIC = b'RCRL'
+VERSION = 3
+
+KEY = 1
+FRAME = 2
+KEYFRAME = 3
+PALETTE = 4
+
+DEFAULT_KEYFRAME_INTERVAL = 30.0
+
+
+def write_varint(output, value):
+    while value >= 0x80:
+        output.append((value & 0x7f) | 0x80)
+        value >>= 7
+    output.append(value)
+
+
+def read_varint(data, position):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+class SessionRecorder:
+
+    def __init__(self, file, width, height, keyframe_interval=DEFAULT_KEYFRAME_INTERVAL,
+                 clock=time.monotonic):
+        self.file = file
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.clock = clock
+        self.last_time = clock()
+        self.last_keyframe = None
+        # The palette last written, which the screen replaces rather than
+        # changes in place
+        self.palette = None
+        header = bytearray(MAGIC)
+        header.append(VERSION)
+        write_varint(header, width)
+        write_varint(header, height)
+        self.file.write(header)
+
+    def write_record(self, record_type, payload):
+        now = self.clock()
+        elapsed = max(0, int(round((now - self.last_time) * 1000)))
+        # Keep the fractional milliseconds so long sessions don't drift
+        self.last_time += elapsed / 1000
+        record = bytearray([record_type])
+        write_varint(record, elapsed)
+        write_varint(record, len(payload))
+        record += payload
+        self.file.write(record)
+        return now
+
+    def record_key(self, key):
+        payload = bytearray()
+        write_varint(payload, zigzag(key))
+        self.write_record(KEY, payload)
+
+    def record_frame(self, screen, damage):
+        # screen is a ScreenBuffer, damage the mask its take_damage returned
+        now = self.clock()
+        keyframe = self.last_keyframe is None or now - self.last_keyframe >= self.keyframe_interval
+        # Before every keyframe too, so playback that seeks to it has the
+        # palette
+        if keyframe or screen.palette is not self.palette:
+            self.palette = screen.palette
+            self.write_record(PALETTE, zlib.compress(screen.palette.tobytes()))
+        if keyframe:
+            self.last_keyframe = now
+            self.write_record(KEYFRAME, encode_keyframe(screen.chars, screen.inverted, screen.packed))
+        elif damage.any():
+            self.write_record(FRAME, encode_frame(screen.chars, screen.inverted, screen.packed, damage))
+
+    def close(self):
+        self.file.close()
+
+
+def encode_keyframe(chars, inverted, packed):
+    # Row order, so the arrays (indexed [x, y]) are transposed first
+    data = chars.T.astype('<u4').tobytes() + np.packbits(inverted.T).tobytes() + \
+        packed.T.astype('<u4').tobytes()
+    return zlib.compress(data)
+
+
+def encode_frame(chars, inverted, packed, damage):
+    flat_chars = chars.T.ravel()
+    flat_inverted = inverted.T.ravel()
+    flat_packed = packed.T.ravel()
+    changed = np.flatnonzero(damage.T.ravel())
+    # Split the changed cells into runs of consecutive cells
+    breaks = np.flatnonzero(np.diff(changed) != 1) + 1
+    starts = np.concatenate(([0], breaks))
+    ends = np.concatenate((breaks, [len(changed)]))
+
+    payload = bytearray()
+    write_varint(payload, len(starts))
+    position = 0
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        first = int(changed[start])
+        write_varint(payload, first - position)
+        write_varint(payload, end - start)
+        for code in flat_chars[first:first + end - start].tolist():
+            write_varint(payload, code)
+        payload += np.packbits(flat_inverted[first:first + end - start]).tobytes()
+        for attribute in flat_packed[first:first + end - start].tolist():
+            write_varint(payload, attribute)
+        position = first + end - start
+    return payload
+
+
+class SessionLog:
+    # Reads a log written by SessionRecorder
+
+    def __init__(self, data):
+        self.data = data
+        if bytes(data[:4]) != MAGIC or not 1 <= data[4] <= VERSION:
+            raise ValueError('Not a session recording')
+        self.version = data[4]
+        self.width, position = read_varint(data, 5)
+        self.height, position = read_varint(data, position)
+        self.start = position
+        self.keyframes = None
+
+    @classmethod
+    def open(cls, path):
+        with open(path, 'rb') as file:
+            return cls(file.read())
+
+    def records(self, position=None, time=0.0):
+        # Yields (time in seconds, type, payload position, payload length, next position)
+        if position is None:
+            position = self.start
+        while position < len(self.data):
+            record_type = self.data[position]
+            elapsed, position = read_varint(self.data, position + 1)
+            length, position = read_varint(self.data, position)
+            time += elapsed / 1000
+            yield time, record_type, position, length, position + length
+            position += length
+
+    def index(self):
+        # (time, position) of every keyframe, built on first use. A keyframe
+        # starts at the palette written just before it, if there is one.
+        if self.keyframes is None:
+            self.keyframes = []
+            record_start = self.start
+            palette_start = None
+            for record_time, record_type, _, _, next_position in self.records():
+                if record_type == KEYFRAME:
+                    self.keyframes.append((record_time, record_start if palette_start is None
+                                           else palette_start))
+                palette_start = record_start if record_type == PALETTE else None
+                record_start = next_position
+        return self.keyframes
+
+    def duration(self):
+        last = 0.0
+        for record_time, _, _, _, _ in self.records():
+            last = record_time
+        return last
+
+    def keys(self):
+        # Every recorded key, for feeding into a program as scripted input
+        return [unzigzag(read_varint(self.data, payload)[0])
+                for _, record_type, payload, _, _ in self.records() if record_type == KEY]
+
+    def palette(self, payload, length):
+        # The colours of a palette record, for ScreenBuffer.set_palette
+        data = zlib.decompress(self.data[payload:payload + length])
+        return np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+
+    def apply(self, record_type, payload, length, chars, inverted, packed=None):
+        # Applies a frame or keyframe to chars, inverted and packed (the
+        # screen's packed attributes), indexed [x, y]. packed is left alone
+        # if it's None or the log has no attributes.
+        attributes = packed is not None and self.version >= 2
+        if record_type == KEYFRAME:
+            data = zlib.decompress(self.data[payload:payload + length])
+            cells = self.width * self.height
+            chars.T[...] = np.frombuffer(data[:cells * 4], dtype='<u4').reshape(self.height, self.width)
+            packed_bits = (cells + 7) // 8
+            bits = np.unpackbits(np.frombuffer(data[cells * 4:cells * 4 + packed_bits], dtype=np.uint8))[:cells]
+            inverted.T[...] = bits.reshape(self.height, self.width).astype(bool)
+            if attributes:
+                start = cells * 4 + packed_bits
+                packed.T[...] = np.frombuffer(data[start:start + cells * 4],
+                                              dtype='<u4').reshape(self.height, self.width)
+        elif record_type == FRAME:
+            cells = []
+            codes = []
+            flags = []
+            values = []
+            runs, position = read_varint(self.data, payload)
+            cell = 0
+            for _ in range(runs):
+                skip, position = read_varint(self.data, position)
+                run, position = read_varint(self.data, position)
+                cell += skip
+                cells.extend(range(cell, cell + run))
+                for _ in range(run):
+                    code, position = read_varint(self.data, position)
+                    codes.append(code)
+                packed_bytes = (run + 7) // 8
+                bits = np.unpackbits(np.frombuffer(self.data[position:position + packed_bytes],
+                                                   dtype=np.uint8))
+                flags.append(bits[:run])
+                position += packed_bytes
+                if self.version >= 2:
+                    for _ in range(run):
+                        value, position = read_varint(self.data, position)
+                        values.append(value)
+                cell += run
+            if len(cells) > 0:
+                # Cells are numbered in row order
+                rows, columns = np.divmod(np.array(cells), self.width)
+                chars[columns, rows] = codes
+                inverted[columns, rows] = np.concatenate(flags).astype(bool)
+                if attributes:
+                    packed[columns, rows] = values
+
+
+class Replayer:
+    # Plays a SessionLog into any provider with a ScreenBuffer
+
+    def __init__(self, log, provider):
+        self.log = log
+        self.provider = provider
+        self.frames = 0
+
+    def seek(self, target):
+        # Shows the screen as it was at target seconds, starting from the
+        # nearest keyframe before it. Returns where to carry on playing from.
+        keyframes = self.log.index()
+        start_time, start_position = 0.0, None
+        for keyframe_time, keyframe_position in keyframes:
+            if keyframe_time > target:
+                break
+            start_time, start_position = keyframe_time, keyframe_position
+        # Record times are relative to the record before, so the keyframe's
+        # own delay has to be taken off again
+        if start_position is not None:
+            elapsed, _ = read_varint(self.log.data, start_position + 1)
+            start_time -= elapsed / 1000
+
+        screen = self.provider.screen
+        resume = start_position
+        for record_time, record_type, payload, length, next_position in \
+                self.log.records(start_position, start_time):
+            if record_time > target:
+                break
+            if record_type == PALETTE:
+                screen.set_palette(self.log.palette(payload, length))
+            self.log.apply(record_type, payload, length, screen.chars, screen.inverted, screen.packed)
+            resume = next_position
+            start_time = record_time
+        self.provider.refresh()
+        return resume, start_time
+
+    def play(self, speed=1.0, start=0.0, end=None):
+        # speed is a multiple of real time, or 0 to play as fast as possible
+        position, start_time = self.seek(start) if start > 0 else (None, 0.0)
+        screen = self.provider.screen
+        began = time.monotonic()
+        for record_time, record_type, payload, length, _ in self.log.records(position, start_time):
+            if end is not None and record_time > end:
+                break
+            if record_type == KEY:
+                continue
+            if record_type == PALETTE:
+                # The frame after it shows it
+                screen.set_palette(self.log.palette(payload, length))
+                continue
+            if speed > 0:
+                delay = (record_time - start_time) / speed - (time.monotonic() - began)
+                if delay > 0:
+                    time.sleep(delay)
+            self.log.apply(record_type, payload, length, screen.chars, screen.inverted, screen.packed)
+            self.provider.refresh()
+            self.frames += 1
+
+
+if __name__ == "__main__":
+    import console_providers
+
+    parser = argparse.ArgumentParser(description="Play back a recorded RobCo OS session")
+    parser.add_argument("log", help="the recording to play")
+    parser.add_argument("--provider", default="tcod", choices=sorted(console_providers.PROVIDERS))
+    parser.add_argument("--speed", default=1.0, type=float,
+                        help="multiple of real time, 0 plays as fast as possible")
+    parser.add_argument("--seek", default=0.0, type=float, help="seconds into the session to start at")
+    parser.add_argument("--end", default=None, type=float, help="seconds into the session to stop at")
+    replayargs = parser.parse_args()
+
+    log = SessionLog.open(replayargs.log)
+    provider = console_providers.create_provider(replayargs.provider)
+    replayer = Replayer(log, provider)
+    started = time.perf_counter()
+    try:
+        replayer.play(replayargs.speed, replayargs.seek, replayargs.end)
+    finally:
+        provider.close()
+    elapsed = time.perf_counter() - started
+    print('%d frames in %.3f s (%.0f frames/s)' % (replayer.frames, elapsed,
+                                                    replayer.frames / elapsed if elapsed > 0 else 0))
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+Opens many simulated players against a running robco_server.py and reports
+how quickly the server answers their key presses.
+
+Each client connects and then, for the length of the test, either sits idle
+or presses cursor keys at roughly the given rate. The latency of a key press
+is the time from sending it to receiving the next bytes from the server.
+
+    python robco_server.py --port 2323 &
+    python robco_loadtest.py --port 2323 --sessions 300 --idle 0.5 --duration 30
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+CURSOR_KEYS = [b'\x1b[A', b'\x1b[B', b'\x1b[C', b'\x1b[D']
+
+
+class Client:
+
+    def __init__(self, rate, active):
+        self.rate = rate
+        self.active = active
+        self.latencies = []
+        self.bytes_received = 0
+        self.keys_sent = 0
+        self.sent_at = None
+        self.error = None
+
+    async def receive(self, reader):
+        while True:
+            data = await reader.read(65536)
+            if len(data) == 0:
+                return
+            self.bytes_received += len(data)
+            if self.sent_at is not None:
+                self.latencies.append(time.perf_counter() - self.sent_at)
+                self.sent_at = None
+
+    async def run(self, host, port, duration):
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as error:
+            self.error = error
+            return
+        receiving = asyncio.create_task(self.receive(reader))
+        end = time.perf_counter() + duration
+        try:
+            while time.perf_counter() < end:
+                if not self.active:
+                    await asyncio.sleep(end - time.perf_counter())
+                    break
+                await asyncio.sleep(random.expovariate(self.rate))
+                if self.sent_at is None:
+                    self.sent_at = time.perf_counter()
+                writer.write(random.choice(CURSOR_KEYS))
+                self.keys_sent += 1
+            writer.write(b'q')
+            await writer.drain()
+            await asyncio.wait_for(receiving, 5)
+        except (OSError, asyncio.TimeoutError) as error:
+            self.error = error
+        finally:
+            receiving.cancel()
+            writer.close()
+
+
+def percentile(values, fraction):
+    if len(values) == 0:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def load_test(host, port, sessions, idle, rate, duration, ramp):
+    clients = [Client(rate, random.random() >= idle) for _ in range(sessions)]
+    tasks = []
+    for client in clients:
+        tasks.append(asyncio.create_task(client.run(host, port, duration)))
+        await asyncio.sleep(ramp / max(sessions, 1))
+    await asyncio.gather(*tasks)
+    return clients
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test a robco_server.py instance")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=2323, type=int)
+    parser.add_argument("-s", "--sessions", default=100, type=int)
+    parser.add_argument("-i", "--idle", default=0.0, type=float,
+                        help="fraction of sessions that connect but never press a key")
+    parser.add_argument("-r", "--rate", default=5.0, type=float,
+                        help="key presses per second for each active session")
+    parser.add_argument("-d", "--duration", default=10.0, type=float, help="seconds")
+    parser.add_argument("--ramp", default=1.0, type=float,
+                        help="seconds over which to open the connections")
+    testargs = parser.parse_args()
+
+    clients = asyncio.run(load_test(testargs.host, testargs.port, testargs.sessions,
+                                    testargs.idle, testargs.rate, testargs.duration,
+                                    testargs.ramp))
+    latencies = [latency for client in clients for latency in client.latencies]
+    failed = [client for client in clients if client.error is not None]
+    print('sessions:       %d (%d active, %d failed)' %
+          (len(clients), sum(client.active for client in clients), len(failed)))
+    print('keys sent:      %d' % sum(client.keys_sent for client in clients))
+    print('bytes received: %d' % sum(client.bytes_received for client in clients))
+    if len(latencies) > 0:
+        print('latency ms:     p50 %.1f  p90 %.1f  p99 %.1f  max %.1f  mean %.1f' %
+              (percentile(latencies, 0.5) * 1000, percentile(latencies, 0.9) * 1000,
+               percentile(latencies, 0.99) * 1000, max(latencies) * 1000,
+               statistics.mean(latencies) * 1000))
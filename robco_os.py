@@ -5,14 +5,81 @@ It works somewhat like an OS by providing services to the python modules that
 it launches into a Termlink-like terminal.
 """
 
+import time
+started = time.perf_counter()
+
 import argparse
+import json
+import sys
+import consolecolours
 import consolekeys
 import console_providers
 
+imported = time.perf_counter()
+
+# Records how long it took to get the first frame of the first program on
+# screen: the first refresh that changes anything once the program has been
+# constructed. (Programs clear the screen while they're being constructed,
+# which doesn't count.) The hook stays in place, rather than unwrapping itself,
+# since the profiler may have wrapped it in turn.
+def time_first_frame(provider, report):
+    refresh = provider.refresh
+    screen = getattr(provider, "screen", None)
+    def first_refresh():
+        refresh()
+        if "first_frame" in report or getattr(provider, "program", None) is None:
+            return
+        if screen is not None and screen.changed_cells == 0:
+            return
+        report["first_frame"] = time.perf_counter() - started
+    provider.refresh = first_refresh
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Execute the RobCo OS simulator")
+    parser.add_argument("--provider", default="tcod", choices=sorted(console_providers.PROVIDERS),
+                        help="how the terminal is displayed (default: tcod)")
+    parser.add_argument("--startup-report", action="store_true",
+                        help="print import, provider and first frame times to stderr on exit")
+    parser.add_argument("--async", dest="use_async", action="store_true",
+                        help="run programs on the asyncio runtime instead of busy polling")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record the session to FILE, for playing back with recording.py")
+    parser.add_argument("--holotape", metavar="PATH",
+                        help="insert a directory or zip archive as a holotape")
+    parser.add_argument("--profile", action="store_true",
+                        help="time input, drawing and programs, printing p50/p99 to stderr on exit")
+    parser.add_argument("--profile-out", metavar="FILE",
+                        help="profile, and write every frame to FILE (.json or .csv) on exit")
+    parser.add_argument("--theme", choices=sorted(consolecolours.THEMES),
+                        help="the terminal's colours, green by default")
     parser.add_argument("program", help="the RobCo OS program to launch")
     parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments passed to the program")
     mainargs = parser.parse_args()
-    provider = console_providers.TcodOSProvider()
-    provider.execute_program(mainargs.program, mainargs.args)
+
+    report = {"provider": mainargs.provider, "imports": imported - started}
+    provider = console_providers.create_provider(mainargs.provider)
+    report["provider_ready"] = time.perf_counter() - started
+    if mainargs.startup_report:
+        time_first_frame(provider, report)
+    if mainargs.theme is not None:
+        provider.swap_palette(consolecolours.THEMES[mainargs.theme])
+    if mainargs.profile or mainargs.profile_out is not None:
+        provider.start_profiling()
+    if mainargs.holotape is not None:
+        provider.insert_holotape(mainargs.holotape)
+    if mainargs.record is not None:
+        provider.start_recording(open(mainargs.record, "wb"))
+    try:
+        if mainargs.use_async:
+            import runtime
+            runtime.execute_program(provider, mainargs.program, mainargs.args)
+        else:
+            provider.execute_program(mainargs.program, mainargs.args)
+    finally:
+        provider.close()
+        if mainargs.startup_report:
+            print(json.dumps(report), file=sys.stderr)
+        if provider.profiler is not None:
+            provider.profiler.report(sys.stderr)
+            if mainargs.profile_out is not None:
+                provider.profiler.dump(mainargs.profile_out)
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+Hosts many RobCo Termlink sessions on one machine over TCP. Connect with
+telnet (or anything that speaks plain ANSI over a socket) and each connection
+gets its own provider and program chain, like running robco_os.py in its own
+terminal:
+
+    python robco_server.py --port 2323 hack -w 6
+    telnet localhost 2323
+
+All sessions run on one asyncio event loop. Programs with run_async are run
+on the loop itself; older synchronous programs get a thread each. Read-only
+data, such as the compiled word index and the puzzle pool, is loaded once per
+process and shared by every session.
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import consolekeys
+import console_providers
+import runtime
+import time
+from programs import passwordgen
+from programs import puzzlepool
+from programs import wordindex
+
+# Telnet protocol bytes
+IAC = 255
+DONT = 254
+DO = 253
+WONT = 252
+WILL = 251
+SB = 250
+SE = 240
+ECHO = 1
+SUPPRESS_GO_AHEAD = 3
+
+# Asks the client to stop echoing and send each key as it's typed
+TELNET_CHARACTER_MODE = bytes([IAC, WILL, ECHO, IAC, WILL, SUPPRESS_GO_AHEAD])
+
+
+class TelnetFilter:
+    # Strips telnet commands out of the input stream, keeping state between
+    # reads since a command can be split across them
+
+    def __init__(self):
+        self.state = None
+        self.last = None
+
+    def feed(self, data):
+        output = bytearray()
+        for byte in data:
+            if self.state == 'iac':
+                if byte == IAC:
+                    output.append(IAC)
+                    self.state = None
+                elif byte in (WILL, WONT, DO, DONT):
+                    self.state = 'option'
+                elif byte == SB:
+                    self.state = 'subnegotiation'
+                else:
+                    self.state = None
+            elif self.state == 'option':
+                self.state = None
+            elif self.state == 'subnegotiation':
+                if byte == IAC:
+                    self.state = 'subnegotiation-iac'
+            elif self.state == 'subnegotiation-iac':
+                self.state = None if byte == SE else 'subnegotiation'
+            elif byte == IAC:
+                self.state = 'iac'
+            elif self.last == 0x0d and byte in (0x00, 0x0a):
+                # Telnet sends enter as CR LF or CR NUL
+                pass
+            else:
+                output.append(byte)
+            self.last = byte
+        return bytes(output)
+
+
+class SocketOSProvider(console_providers.AnsiOSProvider):
+    # An ANSI terminal on the other end of a socket. Output is handed to the
+    # stream writer a frame at a time, and input is fed in by the session.
+    # While a slow client has more than OUTPUT_HIGH_WATER bytes of output
+    # unsent, frames are skipped rather than queued, and once it catches up
+    # a single frame brings its screen up to date.
+    OUTPUT_HIGH_WATER = 64 * 1024
+
+    def __init__(self, writer, width=60, height=24):
+        self.writer = writer
+        self.disconnected = False
+        self.last_input = 0
+        self.draining = None
+        self.frames_skipped = 0
+        writer.transport.set_write_buffer_limits(high=self.OUTPUT_HIGH_WATER)
+        super().__init__(None, None, width, height)
+
+    def refresh(self):
+        if self.draining is not None:
+            self.frames_skipped += 1
+            return
+        # The damage isn't taken while frames are skipped, so it builds up
+        # until the next frame sends all of it
+        super().refresh()
+        if self.writer.transport.get_write_buffer_size() > self.OUTPUT_HIGH_WATER:
+            self.draining = asyncio.ensure_future(self.drain())
+
+    async def drain(self):
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            self.draining = None
+        self.refresh()
+
+    def write_output(self, data):
+        if not self.disconnected:
+            self.writer.write(data)
+        self.bytes_written += len(data)
+
+    def feed(self, data):
+        self.pending += data
+        self.last_input = time.monotonic()
+
+    def read_input(self, timeout):
+        # Input only arrives through feed(), so there's never more to wait for
+        return False
+
+    def waiting_for_rest(self):
+        # Whether the next key is an escape sequence or UTF-8 character whose
+        # rest hasn't arrived yet. Keys are often split across TCP segments,
+        # so it's given ESCAPE_TIMEOUT to turn up before being decoded as is.
+        first = self.pending[0]
+        if first == 0x1b:
+            return self.escape_sequence_end() is None
+        if first < 0xc0:
+            return False
+        length = 2 if first < 0xe0 else 3 if first < 0xf0 else 4
+        return len(self.pending) < length
+
+    def getch(self):
+        if self.disconnected:
+            return consolekeys.ESCAPE
+        if len(self.pending) == 0:
+            return consolekeys.NO_KEY
+        if self.waiting_for_rest() and time.monotonic() - self.last_input < self.ESCAPE_TIMEOUT:
+            return consolekeys.NO_KEY
+        return self.next_key()
+
+    def close(self, message=None):
+        # message, if given, is shown once the terminal has been reset
+        if self.draining is not None:
+            self.draining.cancel()
+        super().close()
+        if message is not None and not self.disconnected:
+            self.writer.write(('\r\n%s\r\n' % message).encode('utf-8', 'replace'))
+        self.writer.close()
+
+
+class Server:
+
+    def __init__(self, program, args, max_sessions=1000, max_fps=30):
+        self.program = program
+        self.args = args
+        self.max_sessions = max_sessions
+        self.max_fps = max_fps
+        self.sessions = set()
+        # Synchronous programs each need a thread of their own
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_sessions,
+                                                              thread_name_prefix='session')
+
+    async def handle_connection(self, reader, writer):
+        if len(self.sessions) >= self.max_sessions:
+            writer.write(b'\r\nALL TERMINALS ARE IN USE. PLEASE TRY AGAIN LATER.\r\n')
+            writer.close()
+            return
+
+        writer.write(TELNET_CHARACTER_MODE)
+        provider = SocketOSProvider(writer)
+        session = runtime.Runtime(provider, max_fps=self.max_fps, poll_input=False,
+                                  executor=self.executor)
+        self.sessions.add(session)
+        telnet = TelnetFilter()
+        loop = asyncio.get_running_loop()
+
+        def pump_keys():
+            session.pump_keys()
+            if len(provider.pending) > 0 and provider.waiting_for_rest():
+                # Decode what's there if no more arrives in time
+                loop.call_later(provider.ESCAPE_TIMEOUT, pump_keys)
+
+        async def read_input():
+            while True:
+                data = await reader.read(1024)
+                if len(data) == 0:
+                    return
+                provider.feed(telnet.feed(data))
+                pump_keys()
+
+        programs = asyncio.create_task(session.execute_program(self.program, list(self.args)))
+        reading = asyncio.create_task(read_input())
+        error = None
+        try:
+            await asyncio.wait({programs, reading}, return_when=asyncio.FIRST_COMPLETED)
+            if not programs.done():
+                # The client went away: ask the program to quit the way a
+                # player would, then give up on it if it doesn't
+                provider.disconnected = True
+                session.pump_keys()
+                try:
+                    await asyncio.wait_for(programs, 5)
+                except Exception:
+                    # Timed out or failed, with nobody left to tell
+                    pass
+            elif not programs.cancelled():
+                # A program that fails (e.g. on bad arguments) only ends
+                # this session
+                error = programs.exception()
+        except ConnectionError:
+            pass
+        finally:
+            reading.cancel()
+            self.sessions.discard(session)
+            provider.close(error)
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        async with server:
+            await server.serve_forever()
+
+
+def preload_shared_data():
+    # Opens the word index and starts the puzzle pool before the first
+    # connection, rather than having the first player wait on it
+    wordindex.get_word_index(passwordgen.WORDS_PATH)
+    puzzlepool.get_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve RobCo OS sessions over TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=2323, type=int)
+    parser.add_argument("--max-sessions", default=1000, type=int)
+    parser.add_argument("--max-fps", default=30, type=int)
+    parser.add_argument("program", nargs="?", default="hack", help="the RobCo OS program to launch")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="arguments passed to the program")
+    serverargs = parser.parse_args()
+
+    preload_shared_data()
+    server = Server(serverargs.program, serverargs.args, serverargs.max_sessions, serverargs.max_fps)
+    try:
+        asyncio.run(server.serve(serverargs.host, serverargs.port))
+    except KeyboardInterrupt:
+        pass
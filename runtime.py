@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*-
+"""
+An asyncio runtime for programs, as an alternative to each program spinning
+in its own getch/redraw loop.
+
+Keys arrive as awaitable events, programs can schedule timers, and the screen
+is only redrawn when something has marked it as changed, at no more than
+max_fps frames per second. When nothing is happening the loop is asleep.
+
+Programs opt in by defining, alongside the usual constructor:
+  - draw(provider), which draws the whole screen (it has already been cleared)
+  - async run_async(runtime), which returns the same [program, args] result
+    that run(provider) does
+
+Programs that only define run(provider) still work: they're run on a worker
+thread against a SyncProviderAdapter, whose getch waits on the runtime's key
+events instead of polling, so a program that switches to non-blocking input
+redraws at a capped rate rather than as fast as it can.
+"""
+
+import asyncio
+import time
+import consolekeys
+
+
+class Timer:
+    # A repeating timer created by Runtime.call_every
+
+    def __init__(self, runtime, interval, callback):
+        self.runtime = runtime
+        self.interval = interval
+        self.callback = callback
+        self.handle = None
+        self.cancelled = False
+        self.schedule()
+
+    def schedule(self):
+        self.handle = self.runtime.loop.call_later(self.interval, self.fire)
+
+    def fire(self):
+        if self.cancelled:
+            return
+        if self.callback() is not False:
+            self.runtime.invalidate()
+        self.schedule()
+
+    def cancel(self):
+        self.cancelled = True
+        if self.handle is not None:
+            self.handle.cancel()
+
+
+class Runtime:
+
+    def __init__(self, provider, max_fps=30, poll_interval=1/60, idle_interval=0.25,
+                 max_pending_keys=256, poll_input=True, executor=None):
+        self.provider = provider
+        self.frame_interval = 1 / max_fps
+        # How often to check for keys on providers that have no file
+        # descriptor to wait on (e.g. tcod)
+        self.poll_interval = poll_interval
+        # How long a non-blocking getch from a synchronous program waits
+        # for a key when its last frame didn't change anything
+        self.idle_interval = idle_interval
+        self.max_pending_keys = max_pending_keys
+        # Providers whose input is fed to them (e.g. from a socket) turn
+        # polling off and call pump_keys() whenever new input arrives
+        self.poll_input = poll_input
+        # Where synchronous programs run, defaulting to the loop's executor
+        self.executor = executor
+        self.loop = None
+        self.keys = None
+        self.dirty = None
+        self.input_task = None
+        self.input_fd = None
+        # Whether reading input has stopped until the program takes keys off
+        # the full queue
+        self.input_paused = False
+        self.last_frame = 0
+
+    # Input
+
+    def start_input(self):
+        self.keys = asyncio.Queue(self.max_pending_keys)
+        self.dirty = asyncio.Event()
+        self.provider.set_input_blocking_mode(False)
+        self.input_fd = self.provider.input_fileno()
+        if self.input_fd is not None:
+            self.loop.add_reader(self.input_fd, self.pump_keys)
+        elif self.poll_input:
+            self.input_task = self.loop.create_task(self.poll_keys())
+        else:
+            self.pump_keys()
+
+    def stop_input(self):
+        if self.input_fd is not None:
+            if not self.input_paused:
+                self.loop.remove_reader(self.input_fd)
+            self.input_fd = None
+        if self.input_task is not None:
+            self.input_task.cancel()
+            self.input_task = None
+        self.provider.set_input_blocking_mode(True)
+
+    def pump_keys(self):
+        # Moves every key the provider has ready onto the queue
+        if self.keys is None:
+            return
+        while True:
+            if self.keys.full():
+                self.pause_input()
+                return
+            key = self.provider.getch()
+            if key == consolekeys.NO_KEY:
+                break
+            self.keys.put_nowait(key)
+
+    def pause_input(self):
+        # The input left unread would keep its file descriptor readable, so
+        # stop watching it rather than have the loop call pump_keys nonstop
+        if not self.input_paused and self.input_fd is not None:
+            self.loop.remove_reader(self.input_fd)
+        self.input_paused = True
+
+    def resume_input(self):
+        # Called once keys have been taken off the queue
+        if not self.input_paused:
+            return
+        self.input_paused = False
+        if self.input_fd is not None:
+            self.loop.add_reader(self.input_fd, self.pump_keys)
+        self.pump_keys()
+
+    async def poll_keys(self):
+        while True:
+            self.pump_keys()
+            await asyncio.sleep(self.poll_interval)
+
+    async def next_key(self, timeout=None):
+        # Waits for the next key, or returns NO_KEY after timeout seconds
+        if timeout is None:
+            key = await self.keys.get()
+        else:
+            try:
+                key = await asyncio.wait_for(self.keys.get(), timeout)
+            except asyncio.TimeoutError:
+                return consolekeys.NO_KEY
+        self.resume_input()
+        return key
+
+    async def next_keys(self, timeout=None):
+        # Waits for the next key like next_key, then takes every key queued
+        # behind it as well, as (key, repeat) pairs like
+        # BaseOSProvider.read_keys. Returns [] after timeout seconds.
+        key = await self.next_key(timeout)
+        if key == consolekeys.NO_KEY:
+            return []
+        return await self.queued_keys(key)
+
+    async def queued_keys(self, first):
+        # first and the keys queued behind it, up to a batch
+        queue = self.provider.get_input_queue()
+        keys = [first]
+        while len(keys) < queue.batch_size and not self.keys.empty():
+            keys.append(self.keys.get_nowait())
+        self.resume_input()
+        queue.count(keys, self.keys.qsize())
+        return consolekeys.coalesce(keys)
+
+    # Timers
+
+    def call_later(self, delay, callback):
+        # Runs callback once after delay seconds. The screen is redrawn
+        # afterwards unless the callback returns False.
+        def fire():
+            if callback() is not False:
+                self.invalidate()
+        return self.loop.call_later(delay, fire)
+
+    def call_every(self, interval, callback):
+        return Timer(self, interval, callback)
+
+    # Rendering
+
+    def invalidate(self):
+        # Marks the screen as needing a redraw
+        self.dirty.set()
+
+    async def render_loop(self, program):
+        while True:
+            await self.dirty.wait()
+            wait = self.last_frame + self.frame_interval - self.loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            self.dirty.clear()
+            self.provider.clear()
+            program.draw(self.provider)
+            self.provider.teletype.draw(self.provider)
+            self.provider.refresh()
+            self.last_frame = self.loop.time()
+
+    async def animate(self):
+        # Advances typing text, blinking cursors and blinking cells,
+        # presenting just the cells they touched rather than redrawing the
+        # program
+        teletype = self.provider.teletype
+        while True:
+            waits = [wait for wait in (teletype.time_to_next_change(),
+                                       self.provider.time_to_next_blink(time.monotonic()))
+                     if wait is not None]
+            await asyncio.sleep(max(min(waits), self.frame_interval) if waits else self.idle_interval)
+            typed = teletype.advance(self.provider)
+            if self.provider.advance_blink(time.monotonic()) or typed:
+                await self.present()
+
+    async def present(self):
+        # Refreshes without redrawing the program, no more often than the
+        # frame rate allows
+        wait = self.last_frame + self.frame_interval - self.loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        self.provider.refresh()
+        self.last_frame = self.loop.time()
+
+    # Programs
+
+    async def run_program(self, program_name, args):
+        module = __import__("programs." + program_name, globals(), locals(), [program_name])
+        if hasattr(module.Program, "run_async"):
+            with self.provider.profiling("init." + program_name):
+                program = module.Program(self.provider, args)
+            self.provider.program = program
+            render = self.loop.create_task(self.render_loop(program))
+            animate = self.loop.create_task(self.animate())
+            self.invalidate()
+            try:
+                with self.provider.profiling("run." + program_name):
+                    return await program.run_async(self)
+            finally:
+                render.cancel()
+                animate.cancel()
+
+        adapter = SyncProviderAdapter(self.provider, self)
+        def run_sync():
+            with self.provider.profiling("init." + program_name):
+                program = module.Program(adapter, args)
+            self.provider.program = program
+            with self.provider.profiling("run." + program_name):
+                return program.run(adapter)
+        return await self.loop.run_in_executor(self.executor, run_sync)
+
+    async def execute_program(self, program_name, args):
+        # The asyncio counterpart of BaseOSProvider.execute_program
+        self.loop = asyncio.get_running_loop()
+        self.start_input()
+        try:
+            while program_name is not None:
+                result = await self.run_program(program_name, args)
+                if result is None or len(result) == 0 or result[0] is None:
+                    program_name = None
+                else:
+                    program_name = result[0]
+                    args = result[1]
+        finally:
+            self.stop_input()
+
+
+class SyncProviderAdapter:
+    # Stands in for the provider when a synchronous program runs on a worker
+    # thread. Drawing goes straight to the provider's screen buffer, while
+    # input and presenting frames go through the runtime's event loop.
+
+    def __init__(self, provider, runtime):
+        self.provider = provider
+        self.runtime = runtime
+        self.is_blocking = True
+
+    def __getattr__(self, name):
+        return getattr(self.provider, name)
+
+    def call_in_loop(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.runtime.loop).result()
+
+    def read_keys(self):
+        # The runtime's queue is the only one keys arrive in, so the batch
+        # is whatever it holds behind the next key
+        key = self.getch()
+        if key == consolekeys.NO_KEY:
+            return []
+        return self.call_in_loop(self.runtime.queued_keys(key))
+
+    def getch(self):
+        timeout = None
+        if not self.is_blocking:
+            timeout = self.runtime.frame_interval
+            screen = getattr(self.provider, "screen", None)
+            if screen is not None and screen.changed_cells == 0:
+                timeout = self.runtime.idle_interval
+
+        # While waiting, keep typing text, blinking cursors and blinking
+        # cells moving. This happens on the program's thread so it never
+        # races its drawing.
+        teletype = self.provider.teletype
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = None if deadline is None else max(0, deadline - time.monotonic())
+            animation = teletype.time_to_next_change()
+            blink = self.provider.time_to_next_blink(time.monotonic())
+            if blink is not None:
+                animation = blink if animation is None else min(animation, blink)
+            if animation is not None:
+                animation = max(animation, self.runtime.frame_interval)
+                wait = animation if wait is None else min(wait, animation)
+            key = self.call_in_loop(self.runtime.next_key(wait))
+            if key != consolekeys.NO_KEY:
+                return key
+            typed = teletype.advance(self.provider)
+            if self.provider.advance_blink(time.monotonic()) or typed:
+                self.refresh()
+            if deadline is not None and time.monotonic() >= deadline:
+                return consolekeys.NO_KEY
+
+    def refresh(self):
+        self.call_in_loop(self.runtime.present())
+
+    def set_input_blocking_mode(self, is_blocking):
+        self.is_blocking = is_blocking
+
+
+def execute_program(provider, program_name, args, **options):
+    asyncio.run(Runtime(provider, **options).execute_program(program_name, args))
@@ -0,0 +1,175 @@
+"""
+Plays the terminal's sound effects without holding up input or startup.
+
+Clips are decoded the first time they're played and kept in a small LRU
+cache. All decoding and playback happens on one mixer thread, which limits
+how many sounds can play at once. Requests go through a short queue, and
+key sounds that arrive faster than they can be played (e.g. a held-down
+key) are dropped rather than queued up behind each other.
+"""
+
+import collections
+import os
+import queue
+import random
+import threading
+import time
+import warnings
+import consolekeys
+
+# Named effects and the files they're played from
+EFFECTS = {
+    "ack": "passgood.wav",
+    "nack": "passbad.wav",
+    "reset": "passreset.wav",
+    "clear": "passdud.wav",
+}
+
+
+class NullSoundService:
+    # Used when there's no audio library, audio device or sounds directory
+    enabled = False
+
+    def play(self, sound_name):
+        pass
+
+    def play_for_char(self, char):
+        pass
+
+    def close(self):
+        pass
+
+
+class SoundService:
+    # Consecutive playback failures before sound is switched off. Clips that
+    # can't be loaded don't count, since other clips may still play.
+    MAX_FAILURES = 3
+
+    def __init__(self, simpleaudio, sounds_path="sounds", cache_size=32, max_voices=4,
+                 queue_size=8, min_key_interval=0.03):
+        self.simpleaudio = simpleaudio
+        self.sounds_path = sounds_path
+        self.cache_size = cache_size
+        self.max_voices = max_voices
+        self.min_key_interval = min_key_interval
+        self.cache = collections.OrderedDict()
+        self.listings = {}
+        # Clips that couldn't be loaded, which aren't tried again
+        self.unloadable = set()
+        self.voices = collections.deque()
+        self.requests = queue.Queue(maxsize=queue_size)
+        self.last_key_sound = 0.0
+        self.dropped = 0
+        self.failures = 0
+        self.enabled = True
+        self.mixer = threading.Thread(target=self.mix, name='sound-mixer', daemon=True)
+        self.mixer.start()
+
+    def play(self, sound_name):
+        effect = EFFECTS.get(sound_name)
+        if effect is not None:
+            self.request(os.path.join(self.sounds_path, effect), False)
+
+    def play_for_char(self, char):
+        # Drop key sounds that come in faster than they'd be heard anyway
+        now = time.monotonic()
+        if now - self.last_key_sound < self.min_key_interval:
+            self.dropped += 1
+            return
+        self.last_key_sound = now
+        folder = "enter" if char == consolekeys.ENTER else "char"
+        self.request(folder, True)
+
+    def request(self, sound, is_key):
+        if not self.enabled:
+            return
+        try:
+            self.requests.put_nowait((sound, is_key))
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        try:
+            self.requests.put_nowait(None)
+        except queue.Full:
+            pass
+
+    def clip_paths(self, folder):
+        # Lists a folder of interchangeable clips the first time it's needed
+        paths = self.listings.get(folder)
+        if paths is None:
+            folder_path = os.path.join(self.sounds_path, folder)
+            paths = []
+            if os.path.isdir(folder_path):
+                paths = [os.path.join(folder_path, file) for file in sorted(os.listdir(folder_path))]
+            if folder == "enter" and len(paths) == 0:
+                paths = self.clip_paths("char")
+            self.listings[folder] = paths
+        return paths
+
+    def load(self, path):
+        clip = self.cache.get(path)
+        if clip is not None:
+            self.cache.move_to_end(path)
+            return clip
+        clip = self.simpleaudio.WaveObject.from_wave_file(path)
+        self.cache[path] = clip
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return clip
+
+    def mix(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            sound, is_key = request
+            if is_key:
+                paths = self.clip_paths(sound)
+                if len(paths) == 0:
+                    continue
+                sound = random.choice(paths)
+
+            self.voices = collections.deque(voice for voice in self.voices if voice.is_playing())
+            if len(self.voices) >= self.max_voices:
+                if is_key:
+                    # Key clicks aren't worth cutting anything off for
+                    self.dropped += 1
+                    continue
+                self.voices.popleft().stop()
+
+            if sound in self.unloadable:
+                self.dropped += 1
+                continue
+            try:
+                clip = self.load(sound)
+            except Exception as error:
+                # A missing or unreadable file only costs that one sound
+                self.unloadable.add(sound)
+                self.dropped += 1
+                warnings.warn("can't load sound %s: %s" % (sound, error))
+                continue
+
+            try:
+                self.voices.append(clip.play())
+                self.failures = 0
+            except Exception:
+                # Audio device errors only cost us the sound, never the
+                # session. If nothing will play at all, stop trying.
+                self.dropped += 1
+                self.failures += 1
+                if self.failures >= self.MAX_FAILURES:
+                    self.enabled = False
+                    return
+
+
+def create_sound_service(sounds_path="sounds", **options):
+    # Returns a working SoundService, or a NullSoundService if audio can't
+    # be used on this machine
+    if not os.path.isdir(sounds_path):
+        return NullSoundService()
+    try:
+        import simpleaudio
+    except ImportError:
+        return NullSoundService()
+    return SoundService(simpleaudio, sounds_path, **options)
@@ -0,0 +1,178 @@
+"""
+Teletype-style text and blinking cursors.
+
+Text is queued with a characters-per-second rate and revealed a character at
+a time as time passes, like the Termlink printing a response. Cursors blink
+at a fixed interval and can be hidden or moved. Nothing here sleeps: the
+owner calls advance() whenever it likes (from an event loop timer, or while
+waiting for a key) and only the cells that changed since the last call are
+painted onto the provider, so a typing effect never holds up input and never
+needs the whole screen redrawn.
+
+Programs that clear and redraw the screen every frame should call draw()
+after drawing, which repaints everything revealed so far.
+"""
+
+import time
+
+DEFAULT_CPS = 60
+DEFAULT_BLINK = 0.53
+
+
+class TextStream:
+
+    def __init__(self, x, y, text, cps, start, width=None):
+        self.cps = cps
+        self.start = start
+        self.revealed = 0
+        self.finished = False
+        # Work out where every character lands up front, following newlines
+        # and wrapping at width columns if one is given
+        self.cells = []
+        column, row = x, y
+        for ch in text:
+            if ch == '\n' or (width is not None and column >= x + width):
+                column, row = x, row + 1
+                if ch == '\n':
+                    continue
+            self.cells.append((column, row, ch))
+            column += 1
+
+    def is_done(self):
+        return self.revealed >= len(self.cells)
+
+    def due(self, now):
+        # Number of characters that should be showing at time now
+        if self.finished:
+            return len(self.cells)
+        return min(len(self.cells), max(0, int((now - self.start) * self.cps)))
+
+    def next_change(self):
+        if self.is_done():
+            return None
+        if self.finished:
+            return self.start
+        return self.start + (self.revealed + 1) / self.cps
+
+    def finish(self):
+        # Reveals the rest of the text on the next advance
+        self.finished = True
+
+
+class BlinkingCursor:
+
+    def __init__(self, x, y, interval, clock):
+        self.clock = clock
+        self.x = x
+        self.y = y
+        self.interval = interval
+        self.start = clock()
+        self.enabled = True
+        # Where the cursor was last painted, if it's currently showing
+        self.drawn_at = None
+
+    def move(self, x, y):
+        # Moving restarts the blink, so the cursor is solid right after it moves
+        if (x, y) != (self.x, self.y):
+            self.x = x
+            self.y = y
+            self.start = self.clock()
+
+    def show(self):
+        self.enabled = True
+
+    def hide(self):
+        self.enabled = False
+
+    def is_on(self, now):
+        if not self.enabled:
+            return False
+        if self.interval is None:
+            return True
+        return int((now - self.start) / self.interval) % 2 == 0
+
+    def next_change(self, now):
+        if not self.enabled or self.interval is None:
+            return None
+        return self.start + (int((now - self.start) / self.interval) + 1) * self.interval
+
+
+class Teletype:
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.streams = []
+        self.cursors = []
+
+    def type_text(self, x, y, text, cps=DEFAULT_CPS, width=None):
+        stream = TextStream(x, y, text, cps, self.clock(), width)
+        self.streams.append(stream)
+        return stream
+
+    def add_cursor(self, x, y, interval=DEFAULT_BLINK):
+        # interval=None gives a cursor that doesn't blink
+        cursor = BlinkingCursor(x, y, interval, self.clock)
+        self.cursors.append(cursor)
+        return cursor
+
+    def remove(self, item):
+        if item in self.streams:
+            self.streams.remove(item)
+        if item in self.cursors:
+            self.cursors.remove(item)
+
+    def clear(self):
+        self.streams.clear()
+        self.cursors.clear()
+
+    def is_typing(self):
+        return any(not stream.is_done() for stream in self.streams)
+
+    def time_to_next_change(self, now=None):
+        # Seconds until advance() would have something to paint, or None if
+        # nothing will change until something new is queued
+        if now is None:
+            now = self.clock()
+        changes = [stream.next_change() for stream in self.streams] + \
+                  [cursor.next_change(now) for cursor in self.cursors]
+        changes = [change for change in changes if change is not None]
+        if len(changes) == 0:
+            return None
+        return max(0, min(changes) - now)
+
+    def advance(self, provider, now=None):
+        # Paints whatever changed since the last advance or draw.
+        # Returns True if any cell was touched.
+        if now is None:
+            now = self.clock()
+        changed = False
+        for stream in self.streams:
+            due = stream.due(now)
+            for column, row, ch in stream.cells[stream.revealed:due]:
+                provider.set_character(column, row, ch)
+                changed = True
+            stream.revealed = max(stream.revealed, due)
+        for cursor in self.cursors:
+            position = (cursor.x, cursor.y) if cursor.is_on(now) else None
+            if position != cursor.drawn_at:
+                if cursor.drawn_at is not None:
+                    provider.invert_at(*cursor.drawn_at)
+                if position is not None:
+                    provider.invert_at(*position)
+                cursor.drawn_at = position
+                changed = True
+        return changed
+
+    def draw(self, provider, now=None):
+        # Repaints everything onto a freshly cleared screen
+        if now is None:
+            now = self.clock()
+        for stream in self.streams:
+            stream.revealed = max(stream.revealed, stream.due(now))
+            for column, row, ch in stream.cells[:stream.revealed]:
+                provider.set_character(column, row, ch)
+        for cursor in self.cursors:
+            cursor.drawn_at = None
+            if cursor.is_on(now):
+                provider.invert_at(cursor.x, cursor.y)
+                cursor.drawn_at = (cursor.x, cursor.y)